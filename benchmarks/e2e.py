@@ -0,0 +1,151 @@
+"""Benchmark de extremo a extremo: N mandos virtuales contra la consola falsa.
+
+Cada mando es un SimulatedWiimote (o un ReplayWiimote con --capture)
+conectado con JoyDance a joydance.fake_console. Mide el throughput de
+muestras, el jitter entre frames, la pérdida de muestras y el CPU por mando.
+Con varias cantidades de mandos (--controllers 1,8,32,64) dice a partir de
+cuántos se empiezan a perder muestras en esta máquina.
+
+    python -m benchmarks.e2e --controllers 16 --duration 20
+    python -m benchmarks.e2e --controllers 1,8,16,32,64 --rate 250
+    python -m benchmarks.e2e --protocol v2 --certfile cert.pem --keyfile key.pem
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from joydance import JoyDance
+from joydance.constants import ACCEL_ACQUISITION_FREQ_HZ, WsSubprotocolVersion
+from joydance.fake_console import FakeConsole, make_ssl_context
+from pycon.replay import ReplayWiimote
+from pycon.simulate import SimulatedWiimote, SineMotion
+
+PAIRING_TIMEOUT = 10  # s
+MAX_SAMPLE_LOSS = 0.01
+
+
+def make_controller(index, rate_hz, capture_path=None):
+    serial = f'bench-{index}'
+    if capture_path:
+        return ReplayWiimote(capture_path, realtime=True, loop=True, serial=serial)
+    motion = SineMotion(phases=tuple(p + index for p in (0.0, 1.0, 2.0)))
+    return SimulatedWiimote(serial, rate_hz=rate_hz, motion=motion, noise=2, seed=index)
+
+
+async def wait_paired(console, controllers, timeout=PAIRING_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        paired = sum(1 for record in console.phones.values() if record.paired_at is not None)
+        if paired >= controllers:
+            return
+        await asyncio.sleep(0.05)
+    raise TimeoutError(f'Solo {paired} de {controllers} mandos se emparejaron')
+
+
+async def run_benchmark(controllers, duration, protocol_version, rate_hz, capture_path=None, ssl_context=None):
+    console = await FakeConsole(ssl_context=ssl_context).start()
+    dancers = []
+    tasks = []
+    try:
+        for i in range(controllers):
+            wiimote = make_controller(i, rate_hz, capture_path)
+            dancer = JoyDance(wiimote, protocol_version=protocol_version)
+            dancer.pairing_url = console.url
+            dancers.append(dancer)
+            tasks.append(asyncio.create_task(dancer.connect_ws()))
+
+        await wait_paired(console, controllers)
+
+        cpu_started_at = time.process_time()
+        started_at = time.monotonic()
+        await asyncio.sleep(duration)
+        cpu = time.process_time() - cpu_started_at
+        wall = time.monotonic() - started_at
+
+        await console.disable_accel()
+    finally:
+        for dancer in dancers:
+            await dancer.disconnect()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await console.stop()
+
+    # Con simulados la referencia es su frecuencia; con capturas, los 200 Hz de JoyDance
+    phones = console.summary(ACCEL_ACQUISITION_FREQ_HZ if capture_path else rate_hz)
+    return {
+        'controllers': controllers,
+        'protocol': protocol_version.value,
+        'duration_s': round(wall, 2),
+        'samples_per_s': round(sum(p['samples_per_s'] or 0 for p in phones), 1),
+        'samples_per_s_per_controller': round(statistics.mean(p['samples_per_s'] or 0 for p in phones), 1),
+        'frame_jitter_ms': round(statistics.mean(p['frame_jitter_ms'] or 0 for p in phones), 2),
+        'frame_jitter_max_ms': max(p['frame_jitter_ms'] or 0 for p in phones),
+        'frame_interval_p99_ms': max(p['frame_interval_p99_ms'] or 0 for p in phones),
+        'sample_loss': round(statistics.mean(p['sample_loss'] or 0 for p in phones), 4),
+        'timestamp_gaps': sum(p['timestamp_gaps'] for p in phones),
+        'cpu_percent': round(cpu / wall * 100, 1),
+        'cpu_percent_per_controller': round(cpu / wall * 100 / controllers, 2),
+        'phones': phones,
+    }
+
+
+def print_result(result):
+    print(f"\n=== {result['controllers']} mandos, {result['protocol']}, {result['duration_s']} s ===")
+    for key in ('samples_per_s', 'samples_per_s_per_controller', 'frame_jitter_ms', 'frame_jitter_max_ms',
+                'frame_interval_p99_ms', 'sample_loss', 'timestamp_gaps', 'cpu_percent',
+                'cpu_percent_per_controller'):
+        print(f'  {key:30} {result[key]}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de extremo a extremo con la consola falsa')
+    parser.add_argument('--controllers', default='4',
+                        help='Número de mandos, o varios separados por comas para un barrido')
+    parser.add_argument('--duration', type=float, default=10, help='Segundos de envío medidos')
+    parser.add_argument('--rate', type=float, default=ACCEL_ACQUISITION_FREQ_HZ,
+                        help='Reportes por segundo de cada mando simulado')
+    parser.add_argument('--protocol', choices=[v.value for v in WsSubprotocolVersion], default='v1')
+    parser.add_argument('--capture', help='Reproducir esta captura .wmcap en lugar de simular')
+    parser.add_argument('--certfile', help='Certificado de la consola (necesario para v2)')
+    parser.add_argument('--keyfile')
+    parser.add_argument('--max-loss', type=float, default=MAX_SAMPLE_LOSS,
+                        help='Pérdida de muestras a partir de la cual se considera que no da abasto')
+    parser.add_argument('--json', help='Guardar el resultado completo en este fichero')
+    parser.add_argument('--no-uvloop', action='store_true')
+    args = parser.parse_args()
+
+    protocol_version = WsSubprotocolVersion(args.protocol)
+    if protocol_version == WsSubprotocolVersion.V2 and not args.certfile:
+        parser.error('v2 usa wss: indica --certfile y --keyfile')
+    ssl_context = make_ssl_context(args.certfile, args.keyfile) if args.certfile else None
+    counts = [int(count) for count in args.controllers.split(',')]
+
+    if not args.no_uvloop:
+        try:
+            import uvloop
+            uvloop.install()
+        except ImportError:
+            pass
+
+    results = []
+    for controllers in counts:
+        result = asyncio.run(run_benchmark(
+            controllers, args.duration, protocol_version, args.rate, args.capture, ssl_context))
+        print_result(result)
+        results.append(result)
+
+        if result['sample_loss'] > args.max_loss or result['timestamp_gaps']:
+            print(f'\nCon {controllers} mandos se pierden muestras '
+                  f"({result['sample_loss']:.1%}, {result['timestamp_gaps']} huecos)")
+            break
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results if len(counts) > 1 else results[0], f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
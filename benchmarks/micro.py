@@ -0,0 +1,278 @@
+"""Micro-benchmarks de los caminos que se ejecutan en cada reporte HID o frame.
+
+Usa reportes y mensajes sintéticos, sin mando ni consola: el Wiimote tiene un
+dispositivo que nunca devuelve datos y JoyDance un WebSocket que descarta lo
+que se envía, así que se mide solo nuestro código (codificar JSON, trocear
+muestras, despachar mensajes...).
+
+    python -m benchmarks.micro                          # tabla de resultados
+    python -m benchmarks.micro --save base.json         # guardar línea base
+    python -m benchmarks.micro --compare base.json      # marcar regresiones (exit 1)
+"""
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from joydance import JoyDance
+from joydance.constants import WsSubprotocolVersion
+from pycon.event import ButtonEventWiimote
+
+MIN_RUN_TIME = 0.2  # s por repetición
+REPEATS = 5
+ALLOC_CALLS = 200
+DEFAULT_THRESHOLD = 0.10
+
+# Reporte 0x31 (botones + acelerómetro) sin botones y con A + derecha pulsados
+REPORT_IDLE = bytes([0x31, 0x00, 0x00, 0x80, 0x82, 0x9A] + [0] * 16)
+REPORT_PRESSED = bytes([0x31, 0x02, 0x08, 0x7C, 0x90, 0xA0] + [0] * 16)
+
+CONSOLE_MESSAGES = [json.dumps(m) for m in (
+    {'__class': 'JD_EnableAccelValuesSending_ConsoleCommandData'},
+    {'__class': 'InputSetup_ConsoleCommandData', 'isEnabled': 1},
+    {'__class': 'JD_PhoneUiShortcutData', 'shortcuts': [
+        {'__class': 'JD_PhoneAction_Shortcut', 'shortcutType': 'SHORTCUT_BACK'},
+        {'__class': 'JD_PhoneAction_Shortcut', 'shortcutType': 'PAUSE'},
+    ]},
+    {'__class': 'JD_PhoneUiSetupData', 'isPopup': 0, 'inputSetup': {'isEnabled': 1},
+     'setupData': {'gameplaySetup': {'pauseSlider': {'enabled': 1}}}},
+    {'__class': 'JD_DisableAccelValuesSending_ConsoleCommandData'},
+)]
+
+
+class IdleDevice:
+    """hid.device que nunca tiene reportes: el hilo lector no toca _input_report"""
+
+    def read(self, max_length, timeout_ms=0):
+        time.sleep(timeout_ms / 1000)
+        return []
+
+    def write(self, data):
+        return len(data)
+
+    def close(self):
+        pass
+
+
+class NullWebSocket:
+    closed = False
+
+    async def send(self, payload):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+
+def make_wiimote():
+    return ButtonEventWiimote(serial='micro', device=IdleDevice())
+
+
+def make_dancer(wiimote):
+    dancer = JoyDance(wiimote, protocol_version=WsSubprotocolVersion.V2, accel_acquisition_latency=0)
+    dancer.ws = NullWebSocket()
+    return dancer
+
+
+def bench_get_status(wiimote, dancer):
+    wiimote._input_report = REPORT_PRESSED
+    return wiimote.get_status
+
+
+def bench_update_buttons(wiimote, dancer):
+    reports = (REPORT_IDLE, REPORT_PRESSED)
+    state = {'i': 0}
+
+    def call():
+        # Alterna entre dos reportes para que cada llamada genere eventos
+        state['i'] ^= 1
+        wiimote._input_report = reports[state['i']]
+        wiimote._update_buttons()
+        wiimote._events_buffer.clear()
+    return call
+
+
+def bench_send_message(wiimote, dancer):
+    data = {'accelData': [[128, 130, 154]] * 10, 'timeStamp': 1234}
+
+    async def call():
+        await dancer.send_message('JD_PhoneScoringData', data)
+    return call
+
+
+def bench_send_accelerometer_data(wiimote, dancer):
+    # Un frame típico a 200 Hz: 9 muestras cada 3 ticks de 15 ms, en trozos de 10
+    samples = [[128 + i, 130, 154 - i] for i in range(9)]
+    now = time.monotonic()
+    times = [now - i * 0.005 for i in range(9)]
+
+    async def call():
+        dancer.should_start_accelerometer = True
+        dancer.accel_data = list(samples)
+        dancer.accel_times = list(times)
+        await dancer.send_accelerometer_data(3)
+    return call
+
+
+def bench_on_message(wiimote, dancer):
+    messages = CONSOLE_MESSAGES
+    state = {'i': 0}
+
+    async def call():
+        state['i'] = (state['i'] + 1) % len(messages)
+        await dancer.on_message(messages[state['i']])
+    return call
+
+
+# Un frame de 45 ms a 200 Hz: 9 muestras por mando
+FRAME_SAMPLES = [(i * 0.005, (128 + i, 130, 154 - i)) for i in range(9)]
+
+
+def bench_frame_objects(count):
+    """Lo que hace cada frame: get_status() y drain_accels() mando a mando"""
+    def bench(wiimote, dancer):
+        wiimote._input_report = REPORT_PRESSED
+
+        def call():
+            for _ in range(count):
+                wiimote._accels.extend(FRAME_SAMPLES)
+                wiimote.get_status()
+                wiimote.drain_accels()
+        return call
+    return bench
+
+
+BENCHMARKS = {
+    'wiimote.get_status': bench_get_status,
+    'wiimote._update_buttons': bench_update_buttons,
+    'joydance.send_message': bench_send_message,
+    'joydance.send_accelerometer_data': bench_send_accelerometer_data,
+    'joydance.on_message': bench_on_message,
+    'frame.objects_x1': bench_frame_objects(1),
+    'frame.objects_x8': bench_frame_objects(8),
+}
+
+def _timer(fn, loop):
+    """Devuelve run(n) -> segundos para n llamadas, sea fn síncrona o corrutina"""
+    if asyncio.iscoroutinefunction(fn):
+        async def many(n):
+            started_at = time.perf_counter()
+            for _ in range(n):
+                await fn()
+            return time.perf_counter() - started_at
+        return lambda n: loop.run_until_complete(many(n))
+
+    def run(n):
+        started_at = time.perf_counter()
+        for _ in range(n):
+            fn()
+        return time.perf_counter() - started_at
+    return run
+
+
+def measure(fn, loop, repeats=REPEATS):
+    run = _timer(fn, loop)
+
+    number = 1
+    while run(number) < MIN_RUN_TIME / 10:
+        number *= 10
+    number = max(1, int(number * MIN_RUN_TIME / max(run(number), 1e-9)))
+    best = min(run(number) for _ in range(repeats))
+
+    # Pico por llamada (temporales incluidos) y memoria que queda retenida
+    tracemalloc.start()
+    try:
+        run(1)
+        peaks = []
+        for _ in range(ALLOC_CALLS // 10):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            run(1)
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        before, _ = tracemalloc.get_traced_memory()
+        run(ALLOC_CALLS)
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'ops_per_s': round(number / best, 1),
+        'us_per_op': round(best / number * 1e6, 3),
+        'peak_bytes_per_call': round(sum(peaks) / len(peaks)),
+        'retained_bytes_per_call': round((after - before) / ALLOC_CALLS, 1),
+    }
+
+
+def run_all(names):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    wiimote = make_wiimote()
+    dancer = make_dancer(wiimote)
+    results = {}
+    try:
+        for name in names:
+            results[name] = measure(BENCHMARKS[name](wiimote, dancer), loop)
+            print(f"  {name:36} {results[name]['ops_per_s']:>12,.0f} ops/s "
+                  f"{results[name]['peak_bytes_per_call']:>8} B pico "
+                  f"{results[name]['retained_bytes_per_call']:>8} B retenidos")
+    finally:
+        wiimote.close()
+        loop.close()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Regresiones: menos ops/s o más memoria de pico que la línea base, más allá del umbral"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            continue
+        speed = result['ops_per_s'] / base['ops_per_s'] - 1
+        memory = (result['peak_bytes_per_call'] - base['peak_bytes_per_call']) / max(base['peak_bytes_per_call'], 1)
+        flag = ''
+        if speed < -threshold or memory > threshold:
+            regressions.append(name)
+            flag = '  <-- REGRESIÓN'
+        print(f'  {name:36} {speed:+7.1%} ops/s {memory:+7.1%} memoria{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks de los caminos calientes')
+    parser.add_argument('--filter', default='', help='Solo los benchmarks cuyo nombre contenga este texto')
+    parser.add_argument('--save', help='Guardar los resultados como línea base JSON')
+    parser.add_argument('--compare', help='Comparar con una línea base JSON')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Cambio relativo que cuenta como regresión (0.10 = 10%%)')
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if args.filter in name]
+    print(f'Python {platform.python_version()} en {platform.machine()}')
+    results = run_all(names)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'results': results,
+            }, f, indent=2)
+        print(f'Línea base guardada en {args.save}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nComparado con {args.compare} ({baseline.get('created_at', '?')}):")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regresiones: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,24 @@
 import asyncio
 import json
+import logging
 import random
 import socket
-import ssl
 import time
-import traceback
 from enum import Enum
 from urllib.parse import urlparse
 
-import aiohttp
-import websockets
-
 from .constants import (ACCEL_ACQUISITION_FREQ_HZ, ACCEL_ACQUISITION_LATENCY,
-                        ACCEL_MAX_RANGE, FRAME_DURATION, SHORTCUT_MAPPING,
-                        UBI_APP_ID, UBI_SKU_ID, WS_SUBPROTOCOLS, Command,
-                        WiimoteButton, WsSubprotocolVersion)
+                        ACCEL_MAX_RANGE, FRAME_DURATION, HOLE_PUNCHING_TIMEOUT,
+                        LATENCY_PING_INTERVAL,
+                        SHORTCUT_MAPPING, UBI_APP_ID, UBI_SKU_ID,
+                        WS_SUBPROTOCOLS, Command, WiimoteButton,
+                        WsSubprotocolVersion)
+from .httpclient import get_http_session
+from .latency import LatencyEstimator
+from .tls import get_console_ssl_context, resuming, session_key
+from pycon.metrics import DEPTH_BUCKETS, REGISTRY
+
+log = logging.getLogger('joydance')
 
 
 class PairingState(Enum):
@@ -43,11 +47,15 @@ class JoyDance:
             host_ip_addr=None,
             console_ip_addr=None,
             accel_acquisition_freq_hz=ACCEL_ACQUISITION_FREQ_HZ,
-            accel_acquisition_latency=ACCEL_ACQUISITION_LATENCY,
+            accel_acquisition_latency=None,
             accel_max_range=ACCEL_MAX_RANGE,
-            on_state_changed=None):
+            on_state_changed=None,
+            shared=None):
         self.joycon = joycon
-        self.joycon_is_left = joycon.is_left()
+        # SharedPairing: token and pairing-info lookups done once for a batch
+        self.shared = shared
+        # Wiimotes (real, replayed or simulated) have no left/right variant
+        self.joycon_is_left = joycon.is_left() if hasattr(joycon, 'is_left') else False
         self.protocol_version = protocol_version
 
         if on_state_changed:
@@ -60,17 +68,30 @@ class JoyDance:
         self.tls_certificate = None
 
         self.accel_acquisition_freq_hz = accel_acquisition_freq_hz
+        # None = announce the measured latency instead of a fixed value
         self.accel_acquisition_latency = accel_acquisition_latency
         self.accel_max_range = accel_max_range
+        self.latency = LatencyEstimator(
+            initial_ms=accel_acquisition_latency if accel_acquisition_latency is not None else ACCEL_ACQUISITION_LATENCY)
+        self.announced_latency_ms = None
 
         self.number_of_accels_sent = 0
+        self.accel_started_at = None
+        self.next_timestamp = 0
+        # Measured time between samples; the reader rarely delivers the announced rate
+        self.accel_interval = 1 / accel_acquisition_freq_hz
+        self.first_accel_at = None
+        self.accels_captured = 0
         self.should_start_accelerometer = False
         self.is_input_allowed = False
         self.available_shortcuts = set()
 
         self.accel_data = []
+        self.accel_times = []
 
         self.ws = None
+        self.ssl_context = None
+        self.tls_key = None  # (host, port) of the console, key of its cached TLS session
         self.disconnected = False
 
         self.headers = {
@@ -80,15 +101,32 @@ class JoyDance:
 
         self.console_conn = None
 
+        labels = {'serial': getattr(joycon, 'metrics_serial', joycon.serial)}
+        self.metric_tick_lateness = REGISTRY.histogram(
+            'joydance_tick_lateness_ms', 'How late each accel tick woke up', **labels)
+        self.metric_accel_backlog = REGISTRY.histogram(
+            'joydance_accel_backlog', 'Samples waiting when a batch is sent', buckets=DEPTH_BUCKETS, **labels)
+        self.metric_encode = REGISTRY.histogram('joydance_encode_ms', 'JSON encode time per message', **labels)
+        self.metric_send = REGISTRY.histogram('joydance_ws_send_ms', 'ws.send time per message', **labels)
+        self.metric_command_latency = REGISTRY.histogram(
+            'joydance_command_latency_ms', 'Button poll to command sent', **labels)
+        self.metric_messages = REGISTRY.counter('joydance_messages_sent_total', 'Messages sent', **labels)
+        self.metric_send_errors = REGISTRY.counter('joydance_send_errors_total', 'Failed sends', **labels)
+
     def get_random_port(self):
         ''' Randomize a port number, to be used in hole_punching() later '''
         return random.randrange(39000, 39999)
 
-    async def on_state_changed(state):
+    async def on_state_changed(self, serial, state):
         pass
 
-    async def get_access_token(self):
-        ''' Log in using a guest account, pre-defined by Ubisoft '''
+    def _once(self, key, factory):
+        if self.shared is None:
+            return factory()
+        return self.shared.once(key, factory)
+
+    async def request_access_token(self):
+        ''' Log in using a guest account, pre-defined by Ubisoft. Returns the ticket '''
         headers = {
             'Authorization': 'UbiMobile_v1 t=NTNjNWRjZGMtZjA2Yy00MTdmLWJkMjctOTNhZTcxNzU1OTkyOlcwM0N5eGZldlBTeFByK3hSa2hhQ05SMXZtdz06UjNWbGMzUmZaVzB3TjJOYTpNakF5TVMweE1DMHlOMVF3TVRvME5sbz0=',
             'Ubi-AppId': UBI_APP_ID,
@@ -97,36 +135,50 @@ class JoyDance:
             'Content-Type': 'application/json',
         }
 
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.post('https://public-ubiservices.ubi.com/v1/profiles/sessions', json={}, ssl=False) as resp:
-                if resp.status != 200:
-                    await self.on_state_changed(self.joycon.serial, PairingState.ERROR_CONNECTION)
-                    raise Exception('ERROR: Couldn\'t get access token!')
+        session = get_http_session()
+        async with session.post('https://public-ubiservices.ubi.com/v1/profiles/sessions', headers=headers, json={}, ssl=False) as resp:
+            if resp.status != 200:
+                raise Exception('ERROR: Couldn\'t get access token!')
 
-                # Add ticket to headers
-                json_body = await resp.json()
-                self.headers['Authorization'] = 'Ubi_v1 ' + json_body['ticket']
+            json_body = await resp.json()
+            return json_body['ticket']
 
-    async def send_pairing_code(self):
-        ''' Send pairing code to JD server '''
+    async def get_access_token(self):
+        try:
+            ticket = await self._once('token', self.request_access_token)
+        except Exception:
+            await self.on_state_changed(self.joycon.serial, PairingState.ERROR_CONNECTION)
+            raise
+
+        # Add ticket to headers
+        self.headers['Authorization'] = 'Ubi_v1 ' + ticket
+
+    async def request_pairing_info(self):
+        ''' Look up the console behind the pairing code '''
         url = 'https://prod.just-dance.com/sessions/v1/pairing-info'
 
-        async with aiohttp.ClientSession(headers=self.headers) as session:
-            async with session.get(url, params={'code': self.pairing_code}, ssl=False) as resp:
-                if resp.status != 200:
-                    await self.on_state_changed(self.joycon.serial, PairingState.ERROR_INVALID_PAIRING_CODE)
-                    raise Exception('ERROR: Invalid pairing code!')
+        session = get_http_session()
+        async with session.get(url, headers=self.headers, params={'code': self.pairing_code}, ssl=False) as resp:
+            if resp.status != 200:
+                raise Exception('ERROR: Invalid pairing code!')
+            return await resp.json()
 
-                json_body = await resp.json()
+    async def send_pairing_code(self):
+        ''' Send pairing code to JD server '''
+        try:
+            json_body = await self._once(('pairing-info', self.pairing_code), self.request_pairing_info)
+        except Exception:
+            await self.on_state_changed(self.joycon.serial, PairingState.ERROR_INVALID_PAIRING_CODE)
+            raise
 
-                self.pairing_url = json_body['pairingUrl'].replace('https://', 'wss://')
-                if not self.pairing_url.endswith('/'):
-                    self.pairing_url += '/'
-                self.pairing_url += 'smartphone'
+        self.pairing_url = json_body['pairingUrl'].replace('https://', 'wss://')
+        if not self.pairing_url.endswith('/'):
+            self.pairing_url += '/'
+        self.pairing_url += 'smartphone'
 
-                self.tls_certificate = json_body['tlsCertificate']
+        self.tls_certificate = json_body['tlsCertificate']
 
-                self.requires_punch_pairing = json_body.get('requiresPunchPairing', False)
+        self.requires_punch_pairing = json_body.get('requiresPunchPairing', False)
 
     async def send_initiate_punch_pairing(self):
         ''' Tell console which IP address & port to connect to '''
@@ -137,25 +189,29 @@ class JoyDance:
             'mobilePort': self.host_port,
         }
 
-        async with aiohttp.ClientSession(headers=self.headers) as session:
-            async with session.post(url, json=json_payload, ssl=False) as resp:
-                body = await resp.text()
-                if body != 'OK':
-                    await self.on_state_changed(self.joycon.serial, PairingState.ERROR_PUNCH_PAIRING)
-                    raise Exception('ERROR: Couldn\'t initiate punch pairing!')
+        session = get_http_session()
+        async with session.post(url, headers=self.headers, json=json_payload, ssl=False) as resp:
+            body = await resp.text()
+            if body != 'OK':
+                await self.on_state_changed(self.joycon.serial, PairingState.ERROR_PUNCH_PAIRING)
+                raise Exception('ERROR: Couldn\'t initiate punch pairing!')
 
     async def hole_punching(self):
         ''' Open a port on this machine so the console can connect to it '''
         try:
             conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            conn.settimeout(10)
-            conn.bind(('0.0.0.0', self.host_port))
-            conn.listen(5)
-
-            # Accept incoming connection from console
-            console_conn, addr = conn.accept()
+            conn.setblocking(False)
+            try:
+                conn.bind(('0.0.0.0', self.host_port))
+                conn.listen(5)
+
+                # Accept incoming connection from console on the loop, so other remotes keep pairing
+                console_conn, addr = await asyncio.wait_for(
+                    asyncio.get_running_loop().sock_accept(conn), HOLE_PUNCHING_TIMEOUT)
+            finally:
+                conn.close()
             self.console_conn = console_conn
-            print('Connected with {}:{}'.format(addr[0], addr[1]))
+            log.info('Connected with %s:%s', addr[0], addr[1])
         except Exception as e:
             await self.on_state_changed(self.joycon.serial, PairingState.ERROR_HOLE_PUNCHING)
             raise e
@@ -170,11 +226,20 @@ class JoyDance:
             msg['root'].update(data)
 
         # Remove extra spaces from JSON to reduce size
+        started_at = time.perf_counter()
+        payload = json.dumps(msg, separators=(',', ':'))
+        encoded_at = time.perf_counter()
 
         try:
-            await self.ws.send(json.dumps(msg, separators=(',', ':')))
+            await self.ws.send(payload)
         except Exception:
+            self.metric_send_errors.inc()
             await self.disconnect(close_ws=False)
+            return
+
+        self.metric_encode.observe((encoded_at - started_at) * 1000)
+        self.metric_send.observe((time.perf_counter() - encoded_at) * 1000)
+        self.metric_messages.inc()
 
     async def on_message(self, message):
         message = json.loads(message)
@@ -187,10 +252,21 @@ class JoyDance:
             await self.send_message('JD_PhoneDataCmdSyncEnd', {'phoneID': message['phoneID']})
             await self.on_state_changed(self.joycon.serial, PairingState.CONNECTED)
         elif __class == 'JD_EnableAccelValuesSending_ConsoleCommandData':
-            self.should_start_accelerometer = True
+            await self.set_accel_reporting(True)
             self.number_of_accels_sent = 0
+            self.accel_started_at = time.monotonic()
+            self.next_timestamp = 0
+            self.first_accel_at = None
+            self.accels_captured = 0
+            # Samples buffered during pairing and menus must not go out as the first scoring frames
+            self.accel_data = []
+            self.accel_times = []
+            if hasattr(self.joycon, 'drain_accels'):
+                self.joycon.drain_accels()
+            self.should_start_accelerometer = True
         elif __class == 'JD_DisableAccelValuesSending_ConsoleCommandData':
             self.should_start_accelerometer = False
+            await self.set_accel_reporting(False)
         elif __class == 'InputSetup_ConsoleCommandData':
             if message.get('isEnabled', 0) == 1:
                 self.is_input_allowed = True
@@ -210,7 +286,7 @@ class JoyDance:
                     try:
                         shortcuts.add(Command(item['shortcutType']))
                     except Exception as e:
-                        print('Unknown Command: ', e)
+                        log.warning('Unknown Command: %s', e)
             self.available_shortcuts = shortcuts
         elif __class == 'JD_OpenPhoneKeyboard_ConsoleCommandData':
             await asyncio.sleep(1)
@@ -226,12 +302,49 @@ class JoyDance:
             else:
                 self.is_input_allowed = (message.get('inputSetup', {}).get('isEnabled', 0) == 1)
 
+    async def set_accel_reporting(self, enabled):
+        ''' Only stream accel from the controller while the console is scoring '''
+        if not hasattr(self.joycon, 'set_accel_reporting'):
+            return
+        # The HID write can block for a few ms on Bluetooth
+        await asyncio.get_running_loop().run_in_executor(None, self.joycon.set_accel_reporting, enabled)
+
+    @property
+    def latency_ms(self):
+        return self.latency.latency_ms
+
+    async def ping_console(self, timeout=LATENCY_PING_INTERVAL):
+        ''' Measure one websocket round trip and feed it to the latency estimator '''
+        pong_waiter = await self.ws.ping()
+        sent_at = time.perf_counter()
+        await asyncio.wait_for(pong_waiter, timeout=timeout)
+        self.latency.add_rtt((time.perf_counter() - sent_at) * 1000)
+
+    async def measure_latency(self):
+        while not self.disconnected:
+            await asyncio.sleep(LATENCY_PING_INTERVAL)
+            try:
+                await self.ping_console()
+            except asyncio.TimeoutError:
+                continue
+            except Exception:
+                return
+
     async def send_hello(self):
-        print('Pairing...')
+        log.info('Pairing...')
+
+        if self.accel_acquisition_latency is None:
+            try:
+                await self.ping_console(timeout=1)
+            except Exception:
+                pass
+            self.announced_latency_ms = self.latency.latency_ms
+        else:
+            self.announced_latency_ms = self.accel_acquisition_latency
 
         await self.send_message('JD_PhoneDataCmdHandshakeHello', {
             'accelAcquisitionFreqHz': float(self.accel_acquisition_freq_hz),
-            'accelAcquisitionLatency': float(self.accel_acquisition_latency),
+            'accelAcquisitionLatency': float(self.announced_latency_ms),
             'accelMaxRange': float(self.accel_max_range),
         })
 
@@ -272,6 +385,7 @@ class JoyDance:
                 self.sleep_approx(sleep_duration),
                 self.collect_accelerometer_data(),
             )
+            self.metric_tick_lateness.observe(max(0, time.time() - last_time - sleep_duration) * 1000)
             await self.send_accelerometer_data(frames)
 
             dt = time.time() - last_time
@@ -283,13 +397,22 @@ class JoyDance:
 
         if not self.should_start_accelerometer:
             self.accel_data = []
+            self.accel_times = []
             return
 
         try:
-            accels = self.joycon.get_accels()  # ([x, y, z],...)
-            self.accel_data += accels
+            if hasattr(self.joycon, 'drain_accels'):
+                samples = self.joycon.drain_accels()  # ((captured_at, (x, y, z)),...)
+                started_at = self.accel_started_at or 0
+                samples = [sample for sample in samples if sample[0] >= started_at]
+                self.accel_data += [list(accel) for _, accel in samples]
+                self.accel_times += [captured_at for captured_at, _ in samples]
+            else:
+                accels = self.joycon.get_accels()  # ([x, y, z],...)
+                self.accel_data += accels
+                self.accel_times += [time.monotonic()] * len(accels)
         except OSError:
-            self.disconnect()
+            await self.disconnect()
             return
 
     async def send_accelerometer_data(self, frames):
@@ -299,20 +422,52 @@ class JoyDance:
         if frames < 3:
             return
 
-        tmp_accel_data = []
-        while len(self.accel_data):
-            tmp_accel_data.append(self.accel_data.pop(0))
+        self.metric_accel_backlog.observe(len(self.accel_data))
+        tmp_accel_data, self.accel_data = self.accel_data, []
+        tmp_accel_times, self.accel_times = self.accel_times, []
+        self.update_accel_interval(tmp_accel_times)
 
         while len(tmp_accel_data) > 0:
             accels_num = min(len(tmp_accel_data), 10)
+            captured_at = tmp_accel_times[:accels_num]
+            self.latency.add_samples(captured_at, time.monotonic())
 
             await self.send_message('JD_PhoneScoringData', {
                 'accelData': tmp_accel_data[:accels_num],
-                'timeStamp': self.number_of_accels_sent,
+                'timeStamp': self.accel_timestamp(captured_at[0] if captured_at else None, accels_num),
             })
 
             self.number_of_accels_sent += accels_num
             tmp_accel_data = tmp_accel_data[accels_num:]
+            tmp_accel_times = tmp_accel_times[accels_num:]
+
+    def update_accel_interval(self, captured_at):
+        ''' Average time between the samples captured since accel sending was enabled '''
+        if not captured_at:
+            return
+        if self.first_accel_at is None:
+            self.first_accel_at = captured_at[0]
+        self.accels_captured += len(captured_at)
+        if self.accels_captured > 1 and captured_at[-1] > self.first_accel_at:
+            self.accel_interval = (captured_at[-1] - self.first_accel_at) / (self.accels_captured - 1)
+
+    def accel_timestamp(self, captured_at, accels_num):
+        ''' Sample index at which a batch was read, counted from when accel sending was enabled.
+
+        Using the read time instead of the number of samples already sent keeps
+        samples on the beat however long they waited in the HID queue, the accel
+        buffer or the websocket. The index is counted at the measured sample
+        rate, not the announced one, so a slower reader leaves no gaps. Never
+        goes backwards.
+        '''
+        if captured_at is None or self.accel_started_at is None:
+            timestamp = self.number_of_accels_sent
+        else:
+            timestamp = round((captured_at - self.accel_started_at) / self.accel_interval)
+
+        timestamp = max(timestamp, self.next_timestamp)
+        self.next_timestamp = timestamp + accels_num
+        return timestamp
 
     async def send_command(self):
         ''' Capture Joycon's input and send to console. Only works on protocol v2 '''
@@ -327,6 +482,7 @@ class JoyDance:
                 await asyncio.sleep(FRAME_DURATION)
                 if not self.is_input_allowed and not self.should_start_accelerometer:
                     continue
+                polled_at = time.perf_counter()
 
                 cmd = None
                 # Get pressed button
@@ -353,6 +509,8 @@ class JoyDance:
                 # Get joystick direction
                 if not self.should_start_accelerometer and not cmd:
                     status = self.joycon.get_status()
+                    if 'analog-sticks' not in status:  # Wiimote: the D-pad already came as events
+                        continue
 
                     # Check which Joycon (L/R) is being used
                     stick = status['analog-sticks']['left'] if self.joycon_is_left else status['analog-sticks']['right']
@@ -383,25 +541,21 @@ class JoyDance:
                     # Only send input when it's allowed to, otherwise we might get a disconnection
                     if self.is_input_allowed:
                         await self.send_message(__class, data)
+                        self.metric_command_latency.observe((time.perf_counter() - polled_at) * 1000)
                         await asyncio.sleep(FRAME_DURATION * 5)
             except Exception:
-                traceback.print_exc()
+                log.exception('Error while sending commands')
                 await self.disconnect()
 
     async def connect_ws(self):
+        import websockets  # deferred so importing joydance stays cheap
+
         server_hostname = None
 
         if self.protocol_version == WsSubprotocolVersion.V1:
             ssl_context = None
         else:
-            ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-            ssl_context.set_ciphers('ALL')
-            ssl_context.options &= ~ssl.OP_NO_SSLv3
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl.CERT_NONE
-
-            if self.tls_certificate:
-                ssl_context.load_verify_locations(cadata=self.tls_certificate)
+            ssl_context = get_console_ssl_context(self.protocol_version, self.tls_certificate)
 
             if self.pairing_url.startswith('192.168.') or self.pairing_url.startswith('10.'):
                 if self.console_conn:
@@ -412,40 +566,63 @@ class JoyDance:
                 server_hostname = tmp.hostname
 
         subprotocol = WS_SUBPROTOCOLS[self.protocol_version.value]
+        self.tls_key = session_key(self.pairing_url)
         try:
-            async with websockets.connect(
-                    self.pairing_url,
-                    subprotocols=[subprotocol],
-                    sock=self.console_conn,
-                    ssl=ssl_context,
-                    ping_timeout=None,
-                    server_hostname=server_hostname
-            ) as websocket:
-                try:
-                    self.ws = websocket
-
-                    await asyncio.gather(
-                        self.send_hello(),
-                        self.tick(),
-                        self.send_command(),
-                    )
-
-                except websockets.ConnectionClosed:
-                    await self.on_state_changed(self.joycon.serial, PairingState.ERROR_CONSOLE_CONNECTION)
-                    await self.disconnect(close_ws=False)
+            with resuming(self.tls_key):
+                async with websockets.connect(
+                        self.pairing_url,
+                        subprotocols=[subprotocol],
+                        sock=self.console_conn,
+                        ssl=ssl_context,
+                        ping_timeout=None,
+                        server_hostname=server_hostname
+                ) as websocket:
+                    try:
+                        self.ws = websocket
+                        # Menus until the console sends JD_EnableAccelValuesSending
+                        await self.set_accel_reporting(False)
+                        if ssl_context:
+                            ssl_context.remember_session(websocket.transport, self.tls_key)
+                        self.ssl_context = ssl_context
+
+                        await asyncio.gather(
+                            self.send_hello(),
+                            self.tick(),
+                            self.send_command(),
+                            self.measure_latency(),
+                        )
+
+                    except websockets.ConnectionClosed:
+                        await self.on_state_changed(self.joycon.serial, PairingState.ERROR_CONSOLE_CONNECTION)
+                        await self.disconnect(close_ws=False)
         except Exception:
-            traceback.print_exc()
+            log.exception('Console connection failed')
             await self.on_state_changed(self.joycon.serial, PairingState.ERROR_CONSOLE_CONNECTION)
             await self.disconnect(close_ws=False)
 
     async def disconnect(self, close_ws=True):
-        print('disconnected')
+        ''' Stop all loops and release the controller, the websocket and the punched socket '''
+        if self.disconnected:
+            return
+
+        log.info('disconnected')
         self.disconnected = True
-        self.joycon.__del__()
+        self.should_start_accelerometer = False
+
+        # Joining the HID reader thread can block for a read timeout
+        await asyncio.get_running_loop().run_in_executor(None, self.joycon.close)
+
+        if self.ssl_context and self.ws:
+            # TLS 1.3 tickets arrive after the handshake, keep the latest one
+            self.ssl_context.remember_session(self.ws.transport, self.tls_key)
 
         if close_ws and self.ws:
             await self.ws.close()
 
+        if self.console_conn:
+            self.console_conn.close()
+            self.console_conn = None
+
     async def pair(self):
         try:
             if self.console_ip_addr:
@@ -456,15 +633,15 @@ class JoyDance:
                     self.pairing_url = 'wss://{}:8080/smartphone'.format(self.console_ip_addr)
             else:
                 await self.on_state_changed(self.joycon.serial, PairingState.GETTING_TOKEN)
-                print('Getting authorication token...')
+                log.info('Getting authorication token...')
                 await self.get_access_token()
 
                 await self.on_state_changed(self.joycon.serial, PairingState.PAIRING)
-                print('Sending pairing code...')
+                log.info('Sending pairing code...')
                 await self.send_pairing_code()
 
                 await self.on_state_changed(self.joycon.serial, PairingState.CONNECTING)
-                print('Connecting with console...')
+                log.info('Connecting with console...')
                 if self.requires_punch_pairing:
                     await self.send_initiate_punch_pairing()
                     await self.hole_punching()
@@ -472,4 +649,4 @@ class JoyDance:
             await self.connect_ws()
         except Exception:
             await self.disconnect()
-            traceback.print_exc()
+            log.exception('Pairing failed')
@@ -0,0 +1,120 @@
+import asyncio
+import configparser
+import errno
+import os
+import time
+
+from .constants import DEFAULT_CONFIG, WsSubprotocolVersion
+
+CONFIG_SECTION = 'joydance'
+REMOTE_SECTION_PREFIX = 'remote '
+PAIRING_METHODS = ('default', 'fast')
+
+
+class SharedPairing:
+    ''' Lookups that every remote in a batch would otherwise repeat.
+
+    The guest token and the pairing info of each code are fetched once; the
+    other JoyDance instances wait on the same task instead of asking again.
+    Only successful lookups are kept.
+    '''
+    def __init__(self):
+        self._tasks = {}
+
+    def once(self, key, factory):
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(factory())
+            task.add_done_callback(lambda done: self._forget_failed(key, done))
+        # Cancelling one waiter must not cancel the lookup for the rest
+        return asyncio.shield(task)
+
+    def _forget_failed(self, key, task):
+        # A failed lookup is not cached: the next remote to ask tries again
+        if (task.cancelled() or task.exception() is not None) and self._tasks.get(key) is task:
+            del self._tasks[key]
+
+
+def load_pairing_config(path):
+    ''' Read a batch pairing config.
+
+    The [joydance] section holds the defaults (same keys as DEFAULT_CONFIG plus
+    protocol), and each [remote <serial>] section one remote to pair:
+
+        [joydance]
+        pairing_code = 0123
+
+        [remote 00:1f:32:aa:bb:cc]
+
+        [remote 00:1f:32:dd:ee:ff]
+        pairing_method = fast
+        console_ip_addr = 192.168.1.20
+
+    Raises FileNotFoundError if the file is missing and ValueError if it is invalid.
+    '''
+    parser = configparser.ConfigParser()
+    try:
+        if not parser.read(path):
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+    except configparser.Error as e:
+        raise ValueError('{}: {}'.format(path, e))
+
+    defaults = dict(DEFAULT_CONFIG, protocol=WsSubprotocolVersion.V2.value)
+    if parser.has_section(CONFIG_SECTION):
+        defaults.update(parser[CONFIG_SECTION])
+
+    remotes = []
+    for section in parser.sections():
+        if not section.startswith(REMOTE_SECTION_PREFIX):
+            continue
+        remote = dict(defaults, **parser[section])
+        remote['serial'] = section[len(REMOTE_SECTION_PREFIX):].strip()
+
+        if remote['pairing_method'] not in PAIRING_METHODS:
+            raise ValueError('{}: unknown pairing_method {}'.format(section, remote['pairing_method']))
+        if remote['pairing_method'] == 'default' and not remote['pairing_code']:
+            raise ValueError('{}: pairing_code is required'.format(section))
+        if remote['pairing_method'] == 'fast' and not remote['console_ip_addr']:
+            raise ValueError('{}: console_ip_addr is required'.format(section))
+
+        try:
+            remote['protocol_version'] = WsSubprotocolVersion(remote.pop('protocol'))
+        except ValueError:
+            raise ValueError('{}: unknown protocol'.format(section))
+        remotes.append(remote)
+
+    if not remotes:
+        raise ValueError('{}: no [remote <serial>] sections'.format(path))
+    return remotes
+
+
+class PairingTimeline:
+    ''' Time spent by each remote in every pairing phase '''
+    PHASES = ('GETTING_TOKEN', 'PAIRING', 'CONNECTING')
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self._changes = {}
+
+    def record(self, serial, state_name):
+        ''' Returns the seconds since the batch started '''
+        elapsed = time.perf_counter() - self.started_at
+        self._changes.setdefault(serial, []).append((state_name, elapsed))
+        return elapsed
+
+    def durations(self, serial):
+        ''' {phase: seconds} for the phases this remote went through '''
+        changes = self._changes.get(serial, [])
+        durations = {}
+        for (state_name, at), (_, next_at) in zip(changes, changes[1:]):
+            if state_name in self.PHASES:
+                durations[state_name] = durations.get(state_name, 0) + next_at - at
+        return durations
+
+    def summary(self):
+        ''' Per-remote durations plus the wall time until the last one finished '''
+        finished_at = max((changes[-1][1] for changes in self._changes.values() if changes), default=0)
+        return {
+            'remotes': {serial: self.durations(serial) for serial in self._changes},
+            'total_s': finished_at,
+        }
@@ -10,13 +10,18 @@ class WsSubprotocolVersion(Enum):
     V2 = 'v2'
 
 
-WS_SUBPROTOCOLS = ['v1.phonescoring.jd.ubisoft.com', 'v2.phonescoring.jd.ubisoft.com']
+WS_SUBPROTOCOLS = {
+    WsSubprotocolVersion.V1.value: 'v1.phonescoring.jd.ubisoft.com',
+    WsSubprotocolVersion.V2.value: 'v2.phonescoring.jd.ubisoft.com',
+}
 
 FRAME_DURATION = 0.015
 SEND_FREQ_MS = 0.05
 ACCEL_ACQUISITION_FREQ_HZ = 200  # Hz
 ACCEL_ACQUISITION_LATENCY = 0  # ms
 ACCEL_MAX_RANGE = 8  # ±G
+LATENCY_PING_INTERVAL = 5  # s
+HOLE_PUNCHING_TIMEOUT = 10  # s
 
 DEFAULT_CONFIG = {
     'pairing_method': 'default',
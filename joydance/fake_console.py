@@ -0,0 +1,225 @@
+''' A local stand-in for the console side of the phonescoring websocket.
+
+It speaks just enough of the v1/v2 subprotocols for JoyDance to pair and
+stream: the Hello/Continue/Sync/SyncEnd handshake and the enable/disable
+accel commands. Every JD_PhoneScoringData frame is recorded with its arrival
+time so a run can be turned into throughput, jitter and loss numbers.
+
+    python -m joydance.fake_console --port 8080 [--certfile cert.pem --keyfile key.pem]
+'''
+import argparse
+import asyncio
+import json
+import ssl
+import statistics
+import time
+
+from .constants import ACCEL_ACQUISITION_FREQ_HZ, WS_SUBPROTOCOLS
+
+
+def console_message(__class, **data):
+    ''' Console -> phone messages carry __class at the top level '''
+    return json.dumps(dict(data, __class=__class), separators=(',', ':'))
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class PhoneRecord:
+    ''' Everything one connected phone did, with arrival times (time.monotonic()) '''
+
+    def __init__(self, phone_id, subprotocol):
+        self.phone_id = phone_id
+        self.subprotocol = subprotocol
+        self.connected_at = time.monotonic()
+        self.hello = None
+        self.paired_at = None
+        self.accel_enabled_at = None
+        self.accel_disabled_at = None
+        self.frames = []  # (arrived_at, timeStamp, number of samples)
+        self.commands = []  # (arrived_at, __class, data)
+
+    @property
+    def samples(self):
+        return sum(count for _, _, count in self.frames)
+
+    def summary(self, freq_hz=ACCEL_ACQUISITION_FREQ_HZ):
+        ''' Throughput, frame interval jitter and sample loss while accel was enabled '''
+        arrivals = [arrived_at for arrived_at, _, _ in self.frames]
+        intervals = [(b - a) * 1000 for a, b in zip(arrivals, arrivals[1:])]
+
+        window = None
+        if self.accel_enabled_at is not None:
+            window = (self.accel_disabled_at or time.monotonic()) - self.accel_enabled_at
+
+        # timeStamp is a sample index; a jump past the previous frame's end is missing samples
+        gaps = 0
+        missing = 0
+        expected_next = None
+        for _, timestamp, count in self.frames:
+            if expected_next is not None and timestamp > expected_next:
+                gaps += 1
+                missing += timestamp - expected_next
+            expected_next = max(expected_next or 0, timestamp + count)
+
+        expected = round(window * freq_hz) if window else 0
+        return {
+            'phone_id': self.phone_id,
+            'subprotocol': self.subprotocol,
+            'handshake_ms': round((self.paired_at - self.connected_at) * 1000, 1) if self.paired_at else None,
+            'frames': len(self.frames),
+            'samples': self.samples,
+            'samples_per_s': round(self.samples / window, 1) if window else None,
+            'expected_samples': expected,
+            'sample_loss': round(max(0, expected - self.samples) / expected, 4) if expected else None,
+            'timestamp_gaps': gaps,
+            'timestamp_missing': missing,
+            'frame_interval_ms': round(statistics.mean(intervals), 2) if intervals else None,
+            'frame_jitter_ms': round(statistics.pstdev(intervals), 2) if intervals else None,
+            'frame_interval_p99_ms': round(percentile(intervals, 0.99), 2) if intervals else None,
+            'commands': len(self.commands),
+        }
+
+
+class FakeConsole:
+    ''' Websocket server that pairs phones and records their scoring frames.
+
+    With `auto_enable_accel` the console asks for accel data as soon as a
+    phone finishes the handshake; otherwise call enable_accel() yourself,
+    like the game does when a song starts.
+    '''
+
+    def __init__(self, host='127.0.0.1', port=0, ssl_context=None, auto_enable_accel=True):
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.auto_enable_accel = auto_enable_accel
+        self.phones = {}
+        self._sockets = {}
+        self._next_phone_id = 1
+        self._server = None
+
+    @property
+    def url(self):
+        scheme = 'wss' if self.ssl_context else 'ws'
+        return f'{scheme}://{self.host}:{self.port}/smartphone'
+
+    async def start(self):
+        import websockets
+
+        self._server = await websockets.serve(
+            self._handle, self.host, self.port, subprotocols=list(WS_SUBPROTOCOLS.values()), ssl=self.ssl_context)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _send(self, phone_id, __class, **data):
+        ws = self._sockets.get(phone_id)
+        if ws is not None and not ws.closed:
+            await ws.send(console_message(__class, **data))
+
+    async def enable_accel(self, phone_id=None):
+        for record in self._records(phone_id):
+            record.accel_enabled_at = time.monotonic()
+            record.accel_disabled_at = None
+            await self._send(record.phone_id, 'JD_EnableAccelValuesSending_ConsoleCommandData')
+
+    async def disable_accel(self, phone_id=None):
+        for record in self._records(phone_id):
+            if record.accel_enabled_at is not None and record.accel_disabled_at is None:
+                record.accel_disabled_at = time.monotonic()
+            await self._send(record.phone_id, 'JD_DisableAccelValuesSending_ConsoleCommandData')
+
+    def _records(self, phone_id):
+        if phone_id is None:
+            return list(self.phones.values())
+        return [self.phones[phone_id]]
+
+    async def _handle(self, ws, path=None):
+        import websockets
+
+        phone_id = self._next_phone_id
+        self._next_phone_id += 1
+        record = self.phones[phone_id] = PhoneRecord(phone_id, ws.subprotocol)
+        self._sockets[phone_id] = ws
+
+        try:
+            async for message in ws:
+                arrived_at = time.monotonic()
+                root = json.loads(message)['root']
+                __class = root['__class']
+
+                if __class == 'JD_PhoneScoringData':
+                    record.frames.append((arrived_at, root.get('timeStamp', 0), len(root.get('accelData', []))))
+                elif __class == 'JD_PhoneDataCmdHandshakeHello':
+                    record.hello = root
+                    await self._send(phone_id, 'JD_PhoneDataCmdHandshakeContinue', phoneID=phone_id)
+                elif __class == 'JD_PhoneDataCmdSync':
+                    await self._send(phone_id, 'JD_PhoneDataCmdSyncEnd', phoneID=phone_id)
+                elif __class == 'JD_PhoneDataCmdSyncEnd':
+                    record.paired_at = arrived_at
+                    if self.auto_enable_accel:
+                        await self.enable_accel(phone_id)
+                else:
+                    record.commands.append((arrived_at, __class, root))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            if record.accel_enabled_at is not None and record.accel_disabled_at is None:
+                record.accel_disabled_at = time.monotonic()
+            self._sockets.pop(phone_id, None)
+
+    def summary(self, freq_hz=ACCEL_ACQUISITION_FREQ_HZ):
+        return [record.summary(freq_hz) for record in self.phones.values()]
+
+
+def make_ssl_context(certfile, keyfile):
+    ''' Server context for the v2 (wss) subprotocol.
+
+    A self-signed pair is enough, JoyDance doesn't verify it:
+        openssl req -x509 -newkey rsa:2048 -nodes -subj /CN=console -keyout key.pem -out cert.pem
+    '''
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ssl_context.load_cert_chain(certfile, keyfile)
+    return ssl_context
+
+
+async def serve(args):
+    ssl_context = make_ssl_context(args.certfile, args.keyfile) if args.certfile else None
+    console = await FakeConsole(args.host, args.port, ssl_context).start()
+    print(f'Fake console listening on {console.url}')
+    try:
+        while True:
+            await asyncio.sleep(args.report_interval)
+            for summary in console.summary():
+                print(json.dumps(summary))
+    finally:
+        await console.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in console for JoyDance')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--certfile', help='Serve wss (v2) with this certificate')
+    parser.add_argument('--keyfile')
+    parser.add_argument('--report-interval', type=float, default=5, help='Seconds between per-phone summaries')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+import aiohttp
+
+HTTP_CONNECTION_LIMIT = 32
+HTTP_KEEPALIVE_TIMEOUT = 60  # s
+HTTP_DNS_CACHE_TTL = 300  # s
+
+_session = None
+
+
+def get_http_session():
+    ''' Return the process-wide ClientSession, creating it on first use.
+
+    Every pairing request (token, pairing code, punch pairing, HTTP discovery)
+    goes through the same keep-alive connector, so repeated pair attempts and
+    concurrent sessions reuse TCP/TLS connections and cached DNS answers.
+    Must be called from a running event loop.
+    '''
+    global _session
+
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_CONNECTION_LIMIT,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        )
+        _session = aiohttp.ClientSession(connector=connector)
+
+    return _session
+
+
+async def close_http_session():
+    global _session
+
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
@@ -0,0 +1,40 @@
+from .constants import ACCEL_ACQUISITION_LATENCY
+
+LATENCY_SMOOTHING = 0.1
+
+
+class LatencyEstimator:
+    ''' Estimate how late accel samples reach the console, in milliseconds.
+
+    Combines the on-host queueing delay (HID read -> websocket send) with half
+    of the measured websocket round trip. Both are smoothed with an EWMA so a
+    single slow ping or a late frame doesn't swing the estimate.
+    '''
+
+    def __init__(self, initial_ms=ACCEL_ACQUISITION_LATENCY, smoothing=LATENCY_SMOOTHING):
+        self.initial_ms = initial_ms
+        self.smoothing = smoothing
+        self.rtt_ms = None
+        self.queue_delay_ms = None
+
+    def _smooth(self, current, sample):
+        if current is None:
+            return sample
+        return current + self.smoothing * (sample - current)
+
+    def add_rtt(self, rtt_ms):
+        self.rtt_ms = self._smooth(self.rtt_ms, rtt_ms)
+
+    def add_queue_delay(self, delay_ms):
+        self.queue_delay_ms = self._smooth(self.queue_delay_ms, delay_ms)
+
+    @property
+    def latency_ms(self):
+        if self.rtt_ms is None and self.queue_delay_ms is None:
+            return float(self.initial_ms)
+        return (self.queue_delay_ms or 0) + (self.rtt_ms or 0) / 2
+
+    def add_samples(self, captured_at, now):
+        ''' Record the queueing delay of a batch of samples sent at `now` '''
+        if captured_at:
+            self.add_queue_delay((now - sum(captured_at) / len(captured_at)) * 1000)
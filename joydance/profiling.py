@@ -0,0 +1,243 @@
+import asyncio
+import cProfile
+import itertools
+import marshal
+import math
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, OrderedDict
+
+PROFILE_DEFAULT_DURATION = 30  # s
+PROFILE_MAX_DURATION = 300  # s
+SAMPLE_INTERVAL = 0.01  # s
+SAMPLE_INTERVAL_MIN = 0.001  # s
+SAMPLE_INTERVAL_MAX = 0.1  # s
+TRACEMALLOC_FRAMES = 10
+TRACEMALLOC_MAX_SNAPSHOTS = 10
+
+
+class Profiler:
+    ''' Time-boxed profile of the running process, started and stopped on demand.
+
+    In 'sample' mode a thread walks sys._current_frames() every `interval`
+    (clamped to SAMPLE_INTERVAL_MIN..SAMPLE_INTERVAL_MAX), so
+    it sees the event loop and the HID reader threads alike; the result is a
+    collapsed-stack file for flamegraph.pl or speedscope. In 'cprofile' mode
+    cProfile traces every call on the event loop thread (it cannot follow other
+    threads) and the result is a pstats file. One profile runs at a time and it
+    stops by itself after `duration`; the last result stays downloadable until
+    the next start.
+    '''
+    MODES = ('sample', 'cprofile')
+
+    def __init__(self, max_duration=PROFILE_MAX_DURATION):
+        self.max_duration = max_duration
+        self.mode = None
+        self.started_at = None
+        self.stopped_at = None
+        self.samples = 0
+        self._running = False
+        self._stacks = Counter()
+        self._profile = None
+        self._stats = None
+        self._thread = None
+        self._timer = None
+        self._stop_sampling = threading.Event()
+
+    @property
+    def running(self):
+        return self._running
+
+    def start(self, mode='sample', duration=PROFILE_DEFAULT_DURATION, interval=SAMPLE_INTERVAL):
+        ''' Must be called on the event loop thread: that is the thread cProfile traces '''
+        if self._running:
+            raise RuntimeError('A profile is already running')
+        if mode not in self.MODES:
+            raise ValueError('Unknown profile mode {}'.format(mode))
+        if not (math.isfinite(duration) and math.isfinite(interval)):
+            raise ValueError('duration and interval must be finite numbers')
+        duration = min(max(duration, 0.1), self.max_duration)
+        interval = min(max(interval, SAMPLE_INTERVAL_MIN), SAMPLE_INTERVAL_MAX)
+
+        self.mode = mode
+        self.started_at = time.time()
+        self.stopped_at = None
+        self.samples = 0
+        self._stacks = Counter()
+        self._stats = None
+
+        if mode == 'cprofile':
+            profile = cProfile.Profile()
+            profile.enable()
+            self._profile = profile
+        else:
+            self._stop_sampling.clear()
+            thread = threading.Thread(target=self._sample, args=(interval,), name='profiler', daemon=True)
+            thread.start()
+            self._thread = thread
+        self._running = True
+
+        self._timer = asyncio.get_running_loop().call_later(duration, self.stop)
+        return self.status()
+
+    def stop(self):
+        if not self._running:
+            return self.status()
+        self._running = False
+        self._timer.cancel()
+
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.create_stats()
+            self._stats = self._profile.stats
+            self._profile = None
+        if self._thread is not None:
+            # The sampler waits on the event, so this only waits for the stack walk in progress
+            self._stop_sampling.set()
+            self._thread.join()
+            self._thread = None
+        self.stopped_at = time.time()
+        return self.status()
+
+    def _sample(self, interval):
+        own = threading.get_ident()
+        labels = {}  # code object -> 'func (file:line)'
+
+        def label(code):
+            text = labels.get(code)
+            if text is None:
+                text = labels[code] = '{} ({}:{})'.format(
+                    code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+            return text
+
+        while True:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self._stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+            if self._stop_sampling.wait(interval):
+                break
+
+    def top(self, limit=20):
+        ''' Hottest functions: self samples in 'sample' mode, own time in 'cprofile' mode '''
+        if self.mode == 'cprofile' and self._stats is not None:
+            rows = sorted(self._stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+            return [{
+                'function': '{} ({}:{})'.format(name, os.path.basename(filename), line),
+                'calls': calls,
+                'own_s': round(own, 6),
+                'cumulative_s': round(cumulative, 6),
+            } for (filename, line, name), (_, calls, own, cumulative, _) in rows]
+
+        leaves = Counter()
+        for stack, count in self._stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [{'function': function, 'samples': count, 'share': round(count / total, 4)}
+                for function, count in leaves.most_common(limit)]
+
+    def status(self):
+        return {
+            'running': self._running,
+            'mode': self.mode,
+            'started_at': self.started_at,
+            'stopped_at': self.stopped_at,
+            'samples': self.samples,
+            'formats': self.formats(),
+        }
+
+    def formats(self):
+        ''' Result files available for download '''
+        if self._running:
+            return []
+        if self._stats is not None:
+            return ['pstats']
+        return ['collapsed'] if self._stacks else []
+
+    def collapsed(self):
+        ''' One 'thread;outer;...;inner count' line per distinct stack '''
+        return ''.join('{} {}\n'.format(stack, count) for stack, count in self._stacks.most_common())
+
+    def pstats_bytes(self):
+        ''' Same bytes as cProfile.Profile.dump_stats(), loadable with pstats.Stats(path) '''
+        return marshal.dumps(self._stats)
+
+
+class AllocationTracker:
+    ''' tracemalloc snapshots taken on demand and diffed against each other.
+
+    Tracing starts with the first snapshot and slows every allocation down
+    until stop() is called.
+    '''
+    def __init__(self, frames=TRACEMALLOC_FRAMES, max_snapshots=TRACEMALLOC_MAX_SNAPSHOTS):
+        self.frames = frames
+        self.max_snapshots = max_snapshots
+        self.snapshots = OrderedDict()  # id -> (time.time(), tracemalloc.Snapshot)
+        self._ids = itertools.count(1)
+        self._started_tracing = False
+
+    def snapshot(self):
+        ''' Blocking (it copies every trace): run it in an executor '''
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<unknown>'),
+        ))
+        snapshot_id = next(self._ids)
+        self.snapshots[snapshot_id] = (time.time(), snapshot)
+        while len(self.snapshots) > self.max_snapshots:
+            self.snapshots.popitem(last=False)
+
+        traced, peak = tracemalloc.get_traced_memory()
+        return {
+            'id': snapshot_id,
+            'taken_at': self.snapshots[snapshot_id][0],
+            'traced_bytes': traced,
+            'peak_bytes': peak,
+            'blocks': len(snapshot.traces),
+        }
+
+    def diff(self, first=None, second=None, key_type='lineno', limit=20):
+        ''' Biggest changes from snapshot `first` to `second` (default: the last two) '''
+        ids = list(self.snapshots)
+        if second is None:
+            second = ids[-1] if ids else None
+        if first is None:
+            first = ids[-2] if len(ids) > 1 else None
+        if first not in self.snapshots or second not in self.snapshots:
+            raise KeyError('Snapshots {} and {} are not available ({})'.format(first, second, ids))
+
+        stats = self.snapshots[second][1].compare_to(self.snapshots[first][1], key_type)
+        return {
+            'from': first,
+            'to': second,
+            'size_diff': sum(stat.size_diff for stat in stats),
+            'top': [{
+                'traceback': [str(frame) for frame in stat.traceback],
+                'size_diff': stat.size_diff,
+                'size': stat.size,
+                'count_diff': stat.count_diff,
+                'count': stat.count,
+            } for stat in stats[:limit]],
+        }
+
+    def stop(self):
+        self.snapshots.clear()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
@@ -0,0 +1,119 @@
+import contextvars
+import hashlib
+import ssl
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+from urllib.parse import urlparse
+
+from .constants import WsSubprotocolVersion
+
+TLS_SESSION_CACHE_SIZE = 64
+
+# (host, port) being connected to by the current task, see ResumingSSLContext.resuming()
+_connecting_to = contextvars.ContextVar('connecting_to', default=None)
+
+
+def session_key(url):
+    ''' (host, port) of a wss:// or https:// URL, the key of its cached TLS session '''
+    parsed = urlparse(url)
+    return parsed.hostname, parsed.port or 443
+
+
+@contextmanager
+def resuming(key):
+    ''' Offer the session cached for `key` to the TLS connections this task opens in the block '''
+    token = _connecting_to.set(key)
+    try:
+        yield
+    finally:
+        _connecting_to.reset(token)
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    ''' Client SSLContext that offers the last TLS session seen for a (host, port).
+
+    asyncio creates its SSLObject through wrap_bio() without a session, so
+    the cached session is injected there. wrap_bio() only gets the SNI name,
+    which may be None, so connections are opened inside resuming((host, port))
+    and the key travels in a context variable. Reconnecting to the same
+    console then resumes instead of doing a full handshake. Only the
+    `max_sessions` most recently used endpoints are kept.
+    '''
+
+    def __new__(cls, protocol=ssl.PROTOCOL_TLS_CLIENT, *args, **kwargs):
+        self = super().__new__(cls, protocol, *args, **kwargs)
+        self.tls_sessions = OrderedDict()
+        self.max_sessions = TLS_SESSION_CACHE_SIZE
+        self._sessions_lock = Lock()
+        return self
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        key = _connecting_to.get()
+        if session is None and not server_side and key is not None:
+            with self._sessions_lock:
+                session = self.tls_sessions.get(key)
+                if session is not None:
+                    self.tls_sessions.move_to_end(key)
+        return super().wrap_bio(incoming, outgoing, server_side, server_hostname, session)
+
+    def remember_session(self, transport, key):
+        ''' Keep the session of an established connection to `key` for the next connect '''
+        ssl_object = transport.get_extra_info('ssl_object') if transport else None
+        if ssl_object is None or ssl_object.session is None:
+            return
+        with self._sessions_lock:
+            self.tls_sessions[key] = ssl_object.session
+            self.tls_sessions.move_to_end(key)
+            while len(self.tls_sessions) > self.max_sessions:
+                self.tls_sessions.popitem(last=False)
+
+
+_contexts = {}
+_lock = Lock()
+
+
+def certificate_fingerprint(tls_certificate):
+    if not tls_certificate:
+        return None
+    return hashlib.sha256(tls_certificate.encode('utf-8')).hexdigest()
+
+
+def _build_console_context(tls_certificate):
+    ssl_context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    ssl_context.set_ciphers('ALL')
+    ssl_context.options &= ~ssl.OP_NO_SSLv3
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+
+    if tls_certificate:
+        ssl_context.load_verify_locations(cadata=tls_certificate)
+    return ssl_context
+
+
+def _build_default_context():
+    ssl_context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    ssl_context.load_default_certs()
+    return ssl_context
+
+
+def get_console_ssl_context(protocol_version, tls_certificate=None):
+    ''' Process-wide SSLContext for a console, keyed by protocol and certificate '''
+    if protocol_version == WsSubprotocolVersion.V1:
+        return None
+
+    key = (protocol_version, certificate_fingerprint(tls_certificate))
+    with _lock:
+        ssl_context = _contexts.get(key)
+        if ssl_context is None:
+            ssl_context = _contexts[key] = _build_console_context(tls_certificate)
+    return ssl_context
+
+
+def get_default_ssl_context():
+    ''' Process-wide SSLContext with the system CA store, loaded only once '''
+    with _lock:
+        ssl_context = _contexts.get('default')
+        if ssl_context is None:
+            ssl_context = _contexts['default'] = _build_default_context()
+    return ssl_context
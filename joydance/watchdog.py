@@ -0,0 +1,101 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from pycon.metrics import REGISTRY
+
+WATCHDOG_INTERVAL = 0.01  # s
+WATCHDOG_MAX_REPORTS = 50
+
+
+class LoopWatchdog:
+    ''' Measure event loop lag and capture what was running when the loop stalled.
+
+    A coroutine on the loop refreshes a heartbeat every `interval`. A separate
+    thread checks it; once the heartbeat is older than `threshold` it grabs the
+    loop thread's current stack (the blocking coroutine or callback) and the
+    running task. The report is completed with the stall duration when the
+    loop comes back.
+    '''
+
+    def __init__(self, threshold=0.1, interval=WATCHDOG_INTERVAL, max_reports=WATCHDOG_MAX_REPORTS, on_report=None):
+        self.threshold = threshold
+        self.interval = interval
+        self.reports = deque(maxlen=max_reports)
+        self.on_report = on_report
+
+        self.metric_lag = REGISTRY.histogram('joydance_loop_lag_ms', 'Event loop lag')
+        self.metric_stalls = REGISTRY.counter('joydance_loop_stalls_total', 'Event loop stalls over the threshold')
+
+        self._loop = None
+        self._loop_thread_id = None
+        self._beat = None
+        self._pending = None
+        self._running = False
+        self._task = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._running = True
+        self._task = asyncio.create_task(self._heartbeat())
+        threading.Thread(target=self._monitor, name='loop-watchdog', daemon=True).start()
+
+    def stop(self):
+        self._running = False
+        if self._task:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        while self._running:
+            before = time.monotonic()
+            self._beat = before
+            await asyncio.sleep(self.interval)
+
+            now = time.monotonic()
+            lag = now - before - self.interval
+            self.metric_lag.observe(max(0, lag) * 1000)
+            self._beat = now
+
+            report = self._pending
+            if report is not None:
+                self._pending = None
+                report['duration_ms'] = round((now - before) * 1000, 1)
+                self.reports.append(report)
+                if self.on_report:
+                    self.on_report(report)
+
+    def _monitor(self):
+        while self._running:
+            time.sleep(self.interval / 2)
+            if self._pending is not None:
+                continue
+
+            blocked_for = time.monotonic() - self._beat
+            if blocked_for < self.threshold:
+                continue
+
+            self.metric_stalls.inc()
+            self._pending = self._capture(blocked_for)
+
+    def _capture(self, blocked_for):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.format_stack(frame) if frame is not None else []
+        del frame
+
+        task = asyncio.current_task(self._loop)
+        return {
+            'at': time.time(),
+            'detected_after_ms': round(blocked_for * 1000, 1),
+            'duration_ms': None,
+            'task': task.get_name() if task else None,
+            'coro': repr(task.get_coro()) if task else None,
+            'stack': [line.rstrip() for line in stack],
+        }
+
+    def snapshot(self):
+        return list(self.reports)
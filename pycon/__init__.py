@@ -1,9 +1,20 @@
+from .capture import CaptureReader, CaptureWriter
 from .event import ButtonEventWiimote
-from .wiimote import Wiimote
+from .hidraw import HidrawDevice, list_hidraw_wiimotes
+from .replay import ReplayWiimote
+from .simulate import SimulatedWiimote
+from .wiimote import Wiimote, list_wiimotes
 from .wrappers import PythonicWiimote
 
 __all__ = [
     "Wiimote",
     "PythonicWiimote",
     "ButtonEventWiimote",
+    "ReplayWiimote",
+    "SimulatedWiimote",
+    "CaptureReader",
+    "CaptureWriter",
+    "list_wiimotes",
+    "HidrawDevice",
+    "list_hidraw_wiimotes",
 ]
@@ -0,0 +1,200 @@
+# capture.py
+"""Grabación y reproducción de reportes HID crudos del Wiimote.
+
+Formato del fichero (little-endian, sin compresión para poder hacer mmap):
+
+    cabecera  4s magic 'WMCP' | B versión | B tamaño de reporte | H product_id
+    registro  Q nanosegundos desde el primer reporte | B longitud | reporte con relleno
+
+Todos los registros miden lo mismo, así que el registro i está en
+HEADER.size + i * tamaño_de_registro y se puede leer sin recorrer el fichero.
+"""
+import argparse
+import mmap
+import struct
+import time
+from typing import Iterator, Optional, Tuple
+
+CAPTURE_MAGIC = b'WMCP'
+CAPTURE_VERSION = 1
+HEADER = struct.Struct('<4sBBH')
+
+
+def _record_struct(report_size: int) -> struct.Struct:
+    return struct.Struct(f'<QB{report_size}s')
+
+
+class CaptureWriter:
+    """Escribe reportes con su instante de lectura (time.monotonic())"""
+
+    def __init__(self, path, report_size=22, product_id=0):
+        self.path = path
+        self.report_size = report_size
+        self._record = _record_struct(report_size)
+        self._file = open(path, 'wb')
+        self._file.write(HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION, report_size, product_id))
+        self._started_at: Optional[float] = None
+        self.count = 0
+
+    def write(self, captured_at: float, data):
+        if self._file is None:
+            return
+        if self._started_at is None:
+            self._started_at = captured_at
+        data = bytes(data[:self.report_size])
+        offset_ns = int((captured_at - self._started_at) * 1e9)
+        self._file.write(self._record.pack(offset_ns, len(data), data))
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class CaptureReader:
+    """Acceso aleatorio a una captura mapeada en memoria"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(self._map) < HEADER.size:
+                raise ValueError(f'{path}: fichero de captura truncado')
+            magic, version, self.report_size, self.product_id = HEADER.unpack_from(self._map, 0)
+            if magic != CAPTURE_MAGIC or version != CAPTURE_VERSION:
+                raise ValueError(f'{path}: no es una captura de Wiimote válida')
+        except Exception:
+            self.close()
+            raise
+
+        self._record = _record_struct(self.report_size)
+        # Un registro a medias (captura interrumpida) se ignora
+        self._count = (len(self._map) - HEADER.size) // self._record.size
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index) -> Tuple[float, bytes]:
+        """(segundos desde el primer reporte, reporte)"""
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        offset_ns, length, data = self._record.unpack_from(self._map, HEADER.size + index * self._record.size)
+        return offset_ns / 1e9, data[:length]
+
+    def __iter__(self) -> Iterator[Tuple[float, bytes]]:
+        for index in range(self._count):
+            yield self[index]
+
+    @property
+    def duration(self) -> float:
+        return self[-1][0] if self._count else 0.0
+
+    def close(self):
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ReplayDevice:
+    """Sustituto de hid.device que devuelve los reportes de una captura.
+
+    Con realtime respeta los intervalos originales; si no, entrega cada
+    reporte en cuanto se pide. Al acabar la captura vuelve a empezar (loop)
+    o se comporta como un mando quieto: read() solo agota el timeout.
+    """
+
+    def __init__(self, capture: CaptureReader, realtime=True, loop=False):
+        self.capture = capture
+        self.realtime = realtime
+        self.loop = loop
+        self.finished = False
+        self._index = 0
+        self._started_at: Optional[float] = None
+
+    def read(self, max_length, timeout_ms=0):
+        timeout = timeout_ms / 1000 if timeout_ms >= 0 else None
+
+        if self._index >= len(self.capture):
+            if not self.loop or not len(self.capture):
+                self.finished = True
+                if timeout:
+                    time.sleep(timeout)
+                return []
+            self._index = 0
+            self._started_at = None
+
+        offset, data = self.capture[self._index]
+        if self.realtime:
+            now = time.monotonic()
+            if self._started_at is None:
+                self._started_at = now - offset
+            wait = self._started_at + offset - now
+            if wait > 0:
+                if timeout is not None and wait > timeout:
+                    time.sleep(timeout)
+                    return []
+                time.sleep(wait)
+
+        self._index += 1
+        return data[:max_length]
+
+    def write(self, data):
+        # No hay mando al otro lado: las peticiones (estado, LEDs...) se ignoran
+        return len(data)
+
+    def close(self):
+        self.capture.close()
+
+
+def _record(args):
+    from .wiimote import Wiimote
+
+    wiimote = Wiimote(serial=args.serial, capture_path=args.output)
+    print(f'Grabando en {args.output}; Ctrl+C para terminar')
+    try:
+        time.sleep(args.seconds) if args.seconds else time.sleep(1e9)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        wiimote.close()
+    print(f'{wiimote.reports_received} reportes grabados')
+
+
+def _info(args):
+    capture = CaptureReader(args.file)
+    try:
+        duration = capture.duration
+        rate = len(capture) / duration if duration else 0
+        print(f'{args.file}: {len(capture)} reportes, {duration:.2f} s ({rate:.0f} Hz), '
+              f'product_id 0x{capture.product_id:04X}')
+    finally:
+        capture.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Captura de reportes HID del Wiimote')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record = commands.add_parser('record', help='Grabar un Wiimote conectado')
+    record.add_argument('output')
+    record.add_argument('--serial')
+    record.add_argument('--seconds', type=float, default=0, help='Duración (0 = hasta Ctrl+C)')
+    record.set_defaults(func=_record)
+
+    info = commands.add_parser('info', help='Resumen de una captura')
+    info.add_argument('file')
+    info.set_defaults(func=_info)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
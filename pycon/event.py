@@ -6,6 +6,8 @@ class ButtonEventWiimote(PythonicWiimote):
         super().__init__(*args, **kwargs)
         self._events_buffer = []
         self._previous = {btn: 0 for btn in ['a','b','plus','minus','up','down','left','right']}
+        # El hilo lector ya está en marcha: el hook se registra cuando _previous existe
+        super().register_update_hook(lambda status: self._update_buttons())
 
     def joycon_button_event(self, button, state):
         self._events_buffer.append((button, state))
@@ -20,6 +22,3 @@ class ButtonEventWiimote(PythonicWiimote):
             if val != self._previous[btn]:
                 self._previous[btn] = val
                 self.joycon_button_event(btn, val)
-
-    def register_update_hook(self, callback):
-        super().register_update_hook(lambda status: self._update_buttons())
@@ -0,0 +1,117 @@
+# hidraw.py
+"""Backend para Linux que lee /dev/hidrawN directamente, sin hidapi.
+
+Los mandos se descubren en sysfs por vendor/product ID. Cada lectura va a un
+buffer reservado una sola vez (os.readv) y se devuelve como memoryview, así que
+no se crea una lista por reporte. El descriptor es no bloqueante y expone
+fileno(), de modo que también sirve con loop.add_reader() u otro event loop.
+"""
+import errno
+import os
+import select
+from typing import List, Optional
+
+from .wiimote import WIIMOTE_PRODUCT_IDS, WIIMOTE_VENDOR_ID
+
+SYSFS_HIDRAW = '/sys/class/hidraw'
+DEV_DIR = '/dev'
+MAX_REPORT_SIZE = 64
+
+
+def _read_uevent(path) -> dict:
+    values = {}
+    with open(path) as f:
+        for line in f:
+            key, _, value = line.strip().partition('=')
+            values[key] = value
+    return values
+
+
+def list_hidraw_wiimotes(sysfs_root=SYSFS_HIDRAW, dev_dir=DEV_DIR) -> List[dict]:
+    """Como list_wiimotes(), con la ruta del nodo hidraw de cada mando"""
+    devices = []
+    try:
+        names = sorted(os.listdir(sysfs_root))
+    except FileNotFoundError:
+        return devices
+
+    for name in names:
+        try:
+            uevent = _read_uevent(os.path.join(sysfs_root, name, 'device', 'uevent'))
+        except OSError:
+            continue
+
+        # HID_ID=<bus>:<vendor>:<product> en hexadecimal
+        parts = uevent.get('HID_ID', '').split(':')
+        if len(parts) != 3:
+            continue
+        vendor_id, product_id = int(parts[1], 16), int(parts[2], 16)
+        if vendor_id != WIIMOTE_VENDOR_ID or product_id not in WIIMOTE_PRODUCT_IDS:
+            continue
+
+        devices.append({
+            'serial': uevent.get('HID_UNIQ') or None,
+            'vendor_id': vendor_id,
+            'product_id': product_id,
+            'path': os.path.join(dev_dir, name),
+        })
+    return devices
+
+
+class HidrawDevice:
+    """Sustituto de hid.device sobre un nodo hidraw (o cualquier fd que entregue reportes).
+
+    read() devuelve una vista del buffer interno: solo es válida hasta la
+    siguiente lectura, quien la use debe copiarla (Wiimote hace bytes(data)).
+    """
+
+    def __init__(self, path: Optional[str] = None, fd: Optional[int] = None, max_report_size=MAX_REPORT_SIZE):
+        if fd is None:
+            if path is None:
+                raise ValueError('Hace falta path o fd')
+            fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+        else:
+            os.set_blocking(fd, False)
+        self.path = path
+        self._fd = fd
+        self._buffer = bytearray(max_report_size)
+        self._view = memoryview(self._buffer)
+        self._poll = select.poll()
+        self._poll.register(fd, select.POLLIN)
+
+    @classmethod
+    def open_wiimote(cls, serial: Optional[str] = None, product_id: Optional[int] = None):
+        for device in list_hidraw_wiimotes():
+            if serial is not None and device['serial'] != serial:
+                continue
+            if product_id is not None and device['product_id'] != product_id:
+                continue
+            return cls(device['path'])
+        raise OSError(errno.ENODEV, f'No hay ningún Wiimote en hidraw (serial={serial})')
+
+    def fileno(self) -> int:
+        return self._fd
+
+    def read(self, max_length, timeout_ms=0):
+        """Un reporte, esperando como mucho timeout_ms (-1 = sin límite); [] si no llega"""
+        if self._fd is None:
+            raise OSError(errno.EBADF, 'Dispositivo cerrado')
+        if not self._poll.poll(None if timeout_ms < 0 else timeout_ms):
+            return []
+        try:
+            n = os.readv(self._fd, [self._view[:max_length]])
+        except BlockingIOError:
+            return []
+        if n == 0:
+            # Como hidapi cuando el mando se desconecta
+            raise OSError(errno.ENODEV, 'El dispositivo se ha desconectado')
+        return self._view[:n]
+
+    def write(self, data):
+        return os.write(self._fd, bytes(data))
+
+    def close(self):
+        if self._fd is not None:
+            self._poll.unregister(self._fd)
+            os.close(self._fd)
+            self._fd = None
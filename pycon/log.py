@@ -0,0 +1,211 @@
+# log.py
+"""Logging que no escribe desde el event loop ni desde los hilos HID.
+
+setup_logging() pone un QueueHandler en el logger raíz: loguear solo mete el
+record en una cola, y un hilo (QueueListener) lo formatea y lo escribe en la
+terminal y, si se pide, en un fichero JSON lines que rota por tamaño. Los
+niveles se ajustan por categoría (nombre del logger) y los mensajes repetidos
+(mismo logger, plantilla y argumentos) se limitan con RateLimitFilter antes
+de encolarse; lo descartado se cuenta aunque la ráfaga se corte. Con el nivel
+desactivado, log.debug(...) se queda en isEnabledFor(), que está cacheado.
+
+Los mensajes deben usar el estilo %: log.info('Conectado a %s', url). Así no
+se formatean si se descartan ni en el hilo que loguea.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+DEFAULT_LEVEL = 'INFO'
+RATE_LIMIT_INTERVAL = 1.0  # s
+RATE_LIMIT_BURST = 5  # mensajes iguales por intervalo
+RATE_LIMIT_MAX_KEYS = 1024
+LOG_FILE_MAX_BYTES = 10 * 1024 * 1024
+LOG_FILE_BACKUPS = 3
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_rate_limit: Optional['RateLimitFilter'] = None
+
+
+class RateLimitFilter(logging.Filter):
+    """Deja pasar como mucho burst records iguales (logger, plantilla y argumentos) cada interval s.
+
+    Los argumentos se comparan por str(): dos excepciones con el mismo texto son
+    el mismo mensaje. El siguiente que pasa lleva en record.suppressed cuántos
+    se descartaron; si la ráfaga se corta, con emit el último descartado se
+    emite al cerrarse su ventana con la cuenta del resto.
+    """
+
+    def __init__(self, interval=RATE_LIMIT_INTERVAL, burst=RATE_LIMIT_BURST, emit=None):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.emit = emit
+        # clave del mensaje -> [inicio de la ventana, dejados pasar, descartados, último descartado]
+        self._windows: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def filter(self, record) -> bool:
+        key = (record.name, record.msg, str(record.args))
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or record.created - window[0] >= self.interval:
+                if window is None and len(self._windows) >= RATE_LIMIT_MAX_KEYS:
+                    self._windows.clear()
+                suppressed = window[2] if window is not None else 0
+                self._windows[key] = [record.created, 1, 0, None]
+            elif window[1] < self.burst:
+                window[1] += 1
+                suppressed, window[2], window[3] = window[2], 0, None
+            else:
+                window[2] += 1
+                window[3] = record
+                if self.emit is not None and self._timer is None:
+                    self._schedule(window[0] + self.interval - record.created)
+                return False
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+    def _schedule(self, delay):
+        self._timer = threading.Timer(max(delay, 0), self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self, now=None):
+        """Emite los descartes de las ventanas ya cerradas que ningún mensaje posterior ha contado"""
+        now = time.time() if now is None else now
+        pending = []
+        with self._lock:
+            self._timer = None
+            next_end = None
+            for window in self._windows.values():
+                if not window[2]:
+                    continue
+                end = window[0] + self.interval
+                if end <= now:
+                    record, record.suppressed = window[3], window[2] - 1
+                    pending.append(record)
+                    window[2], window[3] = 0, None
+                elif next_end is None or end < next_end:
+                    next_end = end
+            if next_end is not None and self.emit is not None:
+                self._schedule(next_end - now)
+
+        if self.emit is not None:
+            for record in pending:
+                self.emit(record)
+        return pending
+
+    def close(self):
+        """Cancela el temporizador y emite todo lo descartado que quede pendiente"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        self.flush(now=float('inf'))
+
+
+class ConsoleFormatter(logging.Formatter):
+    def format(self, record) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            text += f' ({suppressed} mensajes iguales omitidos)'
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objeto JSON por línea, con los campos de extra={...} incluidos"""
+    _RESERVED = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+    def format(self, record) -> str:
+        entry = {
+            'ts': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self._RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _LocalQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # La cola no sale del proceso: el mensaje se formatea en el hilo del listener
+        return record
+
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    """'INFO,dance.command=WARNING' -> {'': 'INFO', 'dance.command': 'WARNING'}"""
+    levels = {}
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        name, _, level = part.rpartition('=')
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(levels: Optional[Dict[str, str]] = None, file: Optional[str] = None,
+                  rate_limit_interval=RATE_LIMIT_INTERVAL, rate_limit_burst=RATE_LIMIT_BURST):
+    """Configura el logging del proceso. levels: {categoría: nivel}, '' es el nivel general.
+
+    Se puede volver a llamar para cambiar la configuración.
+    """
+    global _listener, _rate_limit
+    shutdown_logging()
+
+    levels = dict(levels or {})
+    root = logging.getLogger()
+    root.setLevel(levels.pop('', DEFAULT_LEVEL))
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(ConsoleFormatter('%(message)s'))
+    handlers = [console]
+    if file:
+        rotating = logging.handlers.RotatingFileHandler(
+            file, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding='utf-8')
+        rotating.setFormatter(JsonFormatter())
+        handlers.append(rotating)
+
+    records = queue.SimpleQueue()
+    handler = _LocalQueueHandler(records)
+    _rate_limit = RateLimitFilter(rate_limit_interval, rate_limit_burst, emit=handler.enqueue)
+    handler.addFilter(_rate_limit)
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(handler)
+
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging():
+    """Escribe lo que quede en la cola y para el hilo del listener"""
+    global _listener, _rate_limit
+    if _rate_limit is not None:
+        _rate_limit.close()
+        _rate_limit = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
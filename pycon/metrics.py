@@ -0,0 +1,146 @@
+# metrics.py
+"""Contadores e histogramas de buckets fijos para medir el pipeline.
+
+Registrar una muestra no crea objetos (solo suma sobre listas ya reservadas),
+así que se puede llamar en cada reporte HID o en cada frame.
+"""
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Milisegundos
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+# Número de muestras/mensajes en cola
+DEPTH_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Counter:
+    __slots__ = ('value',)
+    kind = 'counter'
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def sample(self) -> dict:
+        return {'value': self.value}
+
+
+class Gauge:
+    __slots__ = ('value',)
+    kind = 'gauge'
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def sample(self) -> dict:
+        return {'value': self.value}
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+    kind = 'histogram'
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_BUCKETS_MS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # el último es +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def sample(self) -> dict:
+        cumulative = 0
+        buckets = []
+        for bound, count in zip(self.bounds + ('+Inf',), self.counts):
+            cumulative += count
+            buckets.append([bound, cumulative])
+        return {'buckets': buckets, 'sum': self.sum, 'count': self.count}
+
+
+class MetricsRegistry:
+    """Métricas del proceso, indexadas por nombre y etiquetas (p. ej. serial)"""
+
+    def __init__(self):
+        self._metrics: Dict[Tuple[str, tuple], object] = {}
+        self._help: Dict[str, str] = {}
+
+    def _get(self, cls, name, help_text, labels, *args):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            metric = self._metrics[key] = cls(*args)
+            self._help[name] = help_text
+        return metric
+
+    def counter(self, name, help_text='', **labels) -> Counter:
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text='', **labels) -> Gauge:
+        return self._get(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text='', buckets=LATENCY_BUCKETS_MS, **labels) -> Histogram:
+        return self._get(Histogram, name, help_text, labels, buckets)
+
+    def remove(self, **labels):
+        """Elimina las métricas que tengan estas etiquetas (al cerrar una sesión)"""
+        wanted = set((k, str(v)) for k, v in labels.items())
+        for key in list(self._metrics):
+            if wanted.issubset(key[1]):
+                del self._metrics[key]
+
+    def snapshot(self, **extra_labels) -> List[dict]:
+        """Muestras serializables (JSON/pickle); se pueden juntar entre procesos"""
+        samples = []
+        for (name, labels), metric in list(self._metrics.items()):
+            sample = {
+                'name': name,
+                'type': metric.kind,
+                'help': self._help.get(name, ''),
+                'labels': dict(labels, **{k: str(v) for k, v in extra_labels.items()}),
+            }
+            sample.update(metric.sample())
+            samples.append(sample)
+        return samples
+
+
+def _format_labels(labels: dict, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels.items())
+    if extra:
+        items.append(extra)
+    if not items:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in items) + '}'
+
+
+def render_prometheus(samples: List[dict]) -> str:
+    """Formato de texto de Prometheus (exposition format 0.0.4)"""
+    lines = []
+    described = set()
+    for sample in sorted(samples, key=lambda s: s['name']):
+        name = sample['name']
+        if name not in described:
+            described.add(name)
+            if sample['help']:
+                lines.append(f'# HELP {name} {sample["help"]}')
+            lines.append(f'# TYPE {name} {sample["type"]}')
+
+        labels = sample['labels']
+        if sample['type'] == 'histogram':
+            for bound, cumulative in sample['buckets']:
+                lines.append(f'{name}_bucket{_format_labels(labels, ("le", str(bound)))} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {sample["sum"]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {sample["count"]}')
+        else:
+            lines.append(f'{name}{_format_labels(labels)} {sample["value"]}')
+    return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,23 @@
+# replay.py
+from .capture import CaptureReader, ReplayDevice
+from .event import ButtonEventWiimote
+
+
+class ReplayWiimote(ButtonEventWiimote):
+    """Wiimote que reproduce una captura en lugar de leer un mando real.
+
+    Misma interfaz que Wiimote (y los eventos de ButtonEventWiimote), así que
+    sirve para probar y medir todo lo que va después de la lectura HID.
+    realtime=False entrega los reportes tan rápido como se consuman.
+    """
+    # El ritmo lo marca ReplayDevice.read(), no el hilo lector
+    _UPDATE_PERIOD = 0
+
+    def __init__(self, path, realtime=True, loop=False, serial=None, **kwargs):
+        capture = CaptureReader(path)
+        self.replay = ReplayDevice(capture, realtime=realtime, loop=loop)
+        super().__init__(product_id=capture.product_id, serial=serial, device=self.replay, **kwargs)
+
+    @property
+    def finished(self) -> bool:
+        return self.replay.finished
@@ -0,0 +1,179 @@
+# simulate.py
+"""Wiimotes simulados: movimiento paramétrico y secuencias de botones a la frecuencia que se pida.
+
+Generan los mismos reportes que un mando real, con su tamaño real: 0x31 (id,
+2 bytes de botones y 3 de acelerómetro), 0x30 (solo botones) y 0x20 (estado),
+así que todo lo que va después de la lectura HID no nota la diferencia.
+"""
+import math
+import random
+import time
+from collections import deque
+from typing import Optional, Sequence, Tuple
+
+from .capture import CaptureReader
+from .event import ButtonEventWiimote
+
+ACCEL_CENTER = 128
+# Reportes que se acumulan como mucho si el lector se retrasa (el resto se pierde)
+MAX_BACKLOG = 64
+# En modo solo botones se miran los botones cada 10 ms en lugar de a rate_hz
+BUTTONS_POLL_PERIOD = 0.01
+
+# (byte del reporte, máscara), igual que los get_button_* de Wiimote
+BUTTON_BITS = {
+    'a': (2, 0x08), 'b': (2, 0x04), 'one': (2, 0x02), 'two': (2, 0x01),
+    'up': (1, 0x08), 'down': (1, 0x04), 'left': (1, 0x01), 'right': (1, 0x02),
+    'plus': (1, 0x10), 'minus': (2, 0x10),
+}
+
+
+class SineMotion:
+    """Una senoide por eje alrededor del reposo (128)"""
+
+    def __init__(self, amplitude=60, freqs=(1.0, 1.5, 0.5), phases=(0.0, 1.0, 2.0)):
+        self.amplitude = amplitude
+        self.freqs = freqs
+        self.phases = phases
+
+    def __call__(self, t) -> Tuple[float, float, float]:
+        return tuple(ACCEL_CENTER + self.amplitude * math.sin(2 * math.pi * f * t + p)
+                     for f, p in zip(self.freqs, self.phases))
+
+
+class TemplateMotion:
+    """Repite un gesto grabado: muestras (x, y, z) tomadas a rate_hz"""
+
+    def __init__(self, samples: Sequence[Tuple[int, int, int]], rate_hz: float):
+        if not samples:
+            raise ValueError('La plantilla no tiene muestras')
+        self.samples = list(samples)
+        self.rate_hz = rate_hz
+
+    @classmethod
+    def from_capture(cls, path):
+        capture = CaptureReader(path)
+        try:
+            samples = [tuple(data[3:6]) for _, data in capture if len(data) >= 6 and data[0] == 0x31]
+            rate_hz = len(capture) / capture.duration if capture.duration else 100
+        finally:
+            capture.close()
+        return cls(samples, rate_hz)
+
+    def __call__(self, t):
+        return self.samples[int(t * self.rate_hz) % len(self.samples)]
+
+
+class ButtonSequence:
+    """Pulsaciones (inicio en s, duración en s, botón), repetidas cada period segundos si se indica"""
+
+    def __init__(self, presses: Sequence[Tuple[float, float, str]] = (), period: Optional[float] = None):
+        for _, _, button in presses:
+            if button not in BUTTON_BITS:
+                raise ValueError(f'Botón desconocido: {button}')
+        self.presses = list(presses)
+        self.period = period
+
+    def pressed(self, t):
+        if self.period:
+            t %= self.period
+        return [button for start, duration, button in self.presses if start <= t < start + duration]
+
+
+class SimulatedDevice:
+    """Sustituto de hid.device que genera reportes a rate_hz.
+
+    Como el sistema operativo con un mando real, los reportes que el lector no
+    ha recogido a tiempo se le entregan seguidos en la siguiente lectura.
+    """
+
+    def __init__(self, rate_hz=200, motion=None, noise=0.0, buttons=None, battery=0xC8, seed=None):
+        self.rate_hz = rate_hz
+        self.motion = motion or SineMotion()
+        self.noise = noise
+        self.buttons = buttons or ButtonSequence()
+        self.battery = battery
+        self._random = random.Random(seed)
+        self._pending = deque()  # reportes de estado pedidos con write()
+        self._started_at = None
+        self._index = 0
+        self.report_mode = 0x31
+        self.continuous = True
+        self._last_buttons = None
+
+    def _report(self, t):
+        report = bytearray(6 if self.report_mode == 0x31 else 3)
+        report[0] = self.report_mode
+        for button in self.buttons.pressed(t):
+            index, mask = BUTTON_BITS[button]
+            report[index] |= mask
+        if self.report_mode == 0x30:
+            return bytes(report)
+        for axis, value in enumerate(self.motion(t)):
+            if self.noise:
+                value += self._random.gauss(0, self.noise)
+            report[3 + axis] = min(255, max(0, int(round(value))))
+        return bytes(report)
+
+    def _read_on_change(self, max_length, deadline):
+        """Modo no continuo: solo hay reporte cuando cambian los botones"""
+        while True:
+            now = time.monotonic()
+            report = self._report(now - self._started_at)
+            buttons = report[1:3]
+            if buttons != self._last_buttons:
+                self._last_buttons = buttons
+                return report[:max_length]
+            if deadline is not None and now >= deadline:
+                return []
+            time.sleep(BUTTONS_POLL_PERIOD if deadline is None else min(BUTTONS_POLL_PERIOD, deadline - now))
+
+    def read(self, max_length, timeout_ms=0):
+        if self._pending:
+            return self._pending.popleft()[:max_length]
+
+        now = time.monotonic()
+        if self._started_at is None:
+            self._started_at = now
+        if not self.continuous:
+            return self._read_on_change(max_length, now + timeout_ms / 1000 if timeout_ms >= 0 else None)
+
+        behind = int((now - self._started_at) * self.rate_hz) - self._index
+        if behind > MAX_BACKLOG:
+            self._index += behind - MAX_BACKLOG
+        due_at = self._started_at + self._index / self.rate_hz
+        wait = due_at - now
+        if wait > 0:
+            if 0 <= timeout_ms < wait * 1000:
+                time.sleep(timeout_ms / 1000)
+                return []
+            time.sleep(wait)
+
+        t = self._index / self.rate_hz
+        self._index += 1
+        return self._report(t)[:max_length]
+
+    def write(self, data):
+        if data and data[0] == 0x15:  # petición de estado
+            self._pending.append(bytes([0x20, 0, 0, 0, 0, 0, self.battery]))
+        elif len(data) >= 3 and data[0] == 0x12:  # modo de reporte
+            self.continuous = bool(data[1] & 0x04)
+            self.report_mode = data[2]
+            self._last_buttons = None
+            if self._started_at is not None:
+                # Lo que no se envió mientras estaba en otro modo no se acumula
+                self._index = int((time.monotonic() - self._started_at) * self.rate_hz)
+        return len(data)
+
+    def close(self):
+        pass
+
+
+class SimulatedWiimote(ButtonEventWiimote):
+    """Wiimote que no existe: misma interfaz que Wiimote, datos de SimulatedDevice"""
+    # El ritmo lo marca SimulatedDevice.read()
+    _UPDATE_PERIOD = 0
+
+    def __init__(self, serial=None, rate_hz=200, motion=None, noise=0.0, buttons=None, seed=None, **kwargs):
+        self.simulator = SimulatedDevice(rate_hz=rate_hz, motion=motion, noise=noise, buttons=buttons, seed=seed)
+        super().__init__(serial=serial, device=self.simulator, **kwargs)
@@ -1,61 +1,242 @@
-import hid
+import importlib.util
+import itertools
 import time
-from threading import Thread
+from collections import deque
+from threading import Lock, Thread, current_thread
 from typing import Callable, List, Tuple, Optional
 
+from .metrics import DEPTH_BUCKETS, REGISTRY
+
 WIIMOTE_VENDOR_ID = 0x057E
 WIIMOTE_PRODUCT_IDS = [0x0306, 0x0307]
 
+
+def list_wiimotes() -> List[dict]:
+    """Devuelve los Wiimotes conectados: serial, vendor_id, product_id y hid_path"""
+    import hid  # diferido: cargar hidapi es lento y no hace falta para arrancar
+
+    devices = []
+    for info in hid.enumerate(WIIMOTE_VENDOR_ID, 0):
+        if info['product_id'] not in WIIMOTE_PRODUCT_IDS:
+            continue
+        devices.append({
+            'serial': info.get('serial_number') or None,
+            'vendor_id': info['vendor_id'],
+            'product_id': info['product_id'],
+            'hid_path': info['path'],
+        })
+    return devices
+
+
+def hidapi_available() -> bool:
+    """Si hidapi está instalado, sin llegar a cargarlo"""
+    return importlib.util.find_spec('hid') is not None
+
+
+def open_hid_path(path):
+    """Abre un Wiimote por su ruta de hidapi; distingue a los mandos sin número de serie"""
+    import hid
+
+    device = hid.device()
+    device.open_path(path)
+    return device
+
+
 class Wiimote:
+    _unnamed = itertools.count(1)  # etiquetas de métricas para mandos sin serial
     _REPORT_SIZE = 22
     _UPDATE_PERIOD = 0.01
+    _READ_TIMEOUT_MS = 100
+    _STATUS_REPORT_ID = 0x20
+    _REQUEST_STATUS_REPORT_ID = 0x15
+    _BATTERY_FULL = 0xC8
+    _ACCEL_BUFFER_SIZE = 256
+    _SET_REPORT_MODE_ID = 0x12
+    _MODE_BUTTONS = 0x30  # solo botones, y solo cuando cambian
+    _MODE_BUTTONS_ACCEL = 0x31
+    _CONTINUOUS = 0x04
+    # Tamaño real de cada reporte (hidraw no los rellena hasta _REPORT_SIZE)
+    _BUTTONS_REPORT_SIZE = 3  # id + 2 bytes de botones, común a todos los reportes de entrada
+    _ACCEL_REPORT_SIZE = 6  # 0x31: botones + 3 bytes de acelerómetro
 
-    def __init__(self, vendor_id=WIIMOTE_VENDOR_ID, product_id=WIIMOTE_PRODUCT_IDS[0], serial: Optional[str]=None):
+    def __init__(self, vendor_id=WIIMOTE_VENDOR_ID, product_id=WIIMOTE_PRODUCT_IDS[0], serial: Optional[str]=None,
+                 device=None, capture_path: Optional[str]=None, accel=True):
+        """device sustituye al hid.device real (p. ej. ReplayDevice); capture_path graba los reportes leídos;
+        accel elige el modo de reporte inicial (ver set_accel_reporting)"""
         self.vendor_id = vendor_id
         self.product_id = product_id
         self.serial = serial
         self._input_report = bytes(self._REPORT_SIZE)
         self._input_hooks: List[Callable[[dict], None]] = []
+        self.battery_level: Optional[int] = None
+        # (time.monotonic() de la lectura, (x, y, z)); deque es seguro entre hilos
+        self._accels = deque(maxlen=self._ACCEL_BUFFER_SIZE)
+
+        # Las métricas se borran por esta etiqueta en close(): no puede ser None ni repetirse
+        self.metrics_serial = serial or f'sin-serial-{next(self._unnamed)}'
+        labels = {'serial': self.metrics_serial}
+        self._reports = REGISTRY.counter('pycon_hid_reports_total', 'Reportes HID leídos', **labels)
+        self._read_errors = REGISTRY.counter('pycon_hid_read_errors_total', 'Errores de lectura HID', **labels)
+        self._dropped = REGISTRY.counter(
+            'pycon_accel_samples_dropped_total', 'Muestras descartadas por buffer lleno', **labels)
+        self._report_interval = REGISTRY.histogram(
+            'pycon_hid_report_interval_ms', 'Tiempo entre reportes HID', **labels)
+        self._accel_backlog = REGISTRY.histogram(
+            'pycon_accel_backlog', 'Muestras pendientes al vaciar el buffer', buckets=DEPTH_BUCKETS, **labels)
+        self._last_report_at = None
+        self._mode_switches = REGISTRY.counter(
+            'pycon_report_mode_switches_total', 'Cambios entre modo solo botones y acelerómetro', **labels)
+        # El modo lo cambian el hilo lector (tras un 0x20) y los hilos del executor
+        # (set_accel_reporting): el lock cubre el flag y la escritura al mando
+        self._mode_lock = Lock()
+        self._accel_reporting = accel
+
+        self._capture = None
+        if capture_path:
+            from .capture import CaptureWriter
+            self._capture = CaptureWriter(capture_path, self._REPORT_SIZE, product_id)
+
+        if device is None:
+            import hid
 
-        self._device = hid.device()
-        self._device.open(vendor_id, product_id, serial)
+            device = hid.device()
+            device.open(vendor_id, product_id, serial)
+        self._device = device
+        self._write_report_mode()
         self._running = True
 
-        Thread(target=self._update_loop, daemon=True).start()
+        self._thread = Thread(target=self._update_loop, daemon=True)
+        self._thread.start()
 
     def _read_report(self):
         try:
-            data = self._device.read(self._REPORT_SIZE)
-            if data:
-                self._input_report = bytes(data)
+            # Con timeout para que el hilo vea _running = False al cerrar
+            data = self._device.read(self._REPORT_SIZE, self._READ_TIMEOUT_MS)
+            if not data:
+                return False
+            now = time.monotonic()
+            self._reports.inc()
+            if self._last_report_at is not None:
+                self._report_interval.observe((now - self._last_report_at) * 1000)
+            self._last_report_at = now
+            if self._capture is not None:
+                self._capture.write(now, data)
+
+            try:
+                self._decode_report(data, now)
+            except ValueError:
+                # Un reporte corto no puede parar el hilo lector: se cuenta y se descarta
+                self._read_errors.inc()
+                return False
+            return True
         except OSError:
+            self._read_errors.inc()
             self._running = False
 
+    def _decode_report(self, data, now):
+        """Decodifica un reporte por su formato real; ValueError si es más corto que ese formato"""
+        accel = data[0] == self._MODE_BUTTONS_ACCEL
+        size = self._ACCEL_REPORT_SIZE if accel else self._BUTTONS_REPORT_SIZE
+        if len(data) < size:
+            raise ValueError(f'Reporte 0x{data[0]:02X} de {len(data)} bytes, se esperaban {size}')
+
+        # Todos los reportes de entrada empiezan por id + 2 bytes de botones;
+        # los que no traen acelerómetro conservan el último
+        self._input_report = bytes(data[:size]) + self._input_report[size:]
+        if not accel:
+            if data[0] == self._STATUS_REPORT_ID:
+                self._read_status_report(data)
+            return
+        if len(self._accels) == self._accels.maxlen:
+            self._dropped.inc()
+        self._accels.append((now, self.get_accel()))
+
+    @property
+    def reports_received(self) -> int:
+        return self._reports.value
+
+    def _read_status_report(self, data):
+        """Reporte 0x20: el byte 6 es la batería (0xC8 = llena). Nivel 0-4 como los Joy-Con."""
+        if len(data) > 6:
+            self.battery_level = min(4, data[6] * 5 // self._BATTERY_FULL)
+        # Tras un reporte de estado el mando deja de enviar datos hasta que se vuelve a fijar el modo
+        self._write_report_mode()
+
+    def request_status(self):
+        """Pide un reporte de estado (0x20) para actualizar la batería"""
+        with self._mode_lock:
+            if self._device is not None:
+                self._device.write([self._REQUEST_STATUS_REPORT_ID, 0x00])
+
+    @property
+    def accel_reporting(self) -> bool:
+        return self._accel_reporting
+
+    def _write_report_mode(self):
+        with self._mode_lock:
+            self._send_report_mode()
+
+    def _send_report_mode(self):
+        # Con _mode_lock tomado
+        if self._device is None:
+            return
+        if self._accel_reporting:
+            self._device.write([self._SET_REPORT_MODE_ID, self._CONTINUOUS, self._MODE_BUTTONS_ACCEL])
+        else:
+            self._device.write([self._SET_REPORT_MODE_ID, 0x00, self._MODE_BUTTONS])
+
+    def set_accel_reporting(self, enabled: bool):
+        """Acelerómetro continuo (0x31) mientras se baila; solo botones (0x30) en los menús.
+
+        En modo solo botones el mando envía un reporte por pulsación en lugar de
+        uno cada pocos ms: menos CPU, menos tráfico Bluetooth y menos batería.
+        """
+        with self._mode_lock:
+            if self._device is None or enabled == self._accel_reporting:
+                return
+            self._accel_reporting = enabled
+            self._mode_switches.inc()
+            self._send_report_mode()
+
     def _update_loop(self):
         while self._running:
-            self._read_report()
+            if not self._read_report():
+                continue
             status = self.get_status()
             for hook in self._input_hooks:
                 hook(status)
             time.sleep(self._UPDATE_PERIOD)
 
+    # Botones en [1] y [2] (tras el id del reporte), acelerómetro en [3:6] (reporte 0x31)
     def get_button_a(self):  return self._input_report[2] & 0x08 > 0
     def get_button_b(self):  return self._input_report[2] & 0x04 > 0
     def get_button_1(self):  return self._input_report[2] & 0x02 > 0
     def get_button_2(self):  return self._input_report[2] & 0x01 > 0
-    def get_button_plus(self):  return self._input_report[3] & 0x10 > 0
-    def get_button_minus(self): return self._input_report[3] & 0x01 > 0
-    def get_up(self):     return self._input_report[2] & 0x10 > 0
-    def get_down(self):   return self._input_report[2] & 0x20 > 0
-    def get_left(self):   return self._input_report[2] & 0x40 > 0
-    def get_right(self):  return self._input_report[2] & 0x80 > 0
+    def get_button_plus(self):  return self._input_report[1] & 0x10 > 0
+    def get_button_minus(self): return self._input_report[2] & 0x10 > 0
+    def get_up(self):     return self._input_report[1] & 0x08 > 0
+    def get_down(self):   return self._input_report[1] & 0x04 > 0
+    def get_left(self):   return self._input_report[1] & 0x01 > 0
+    def get_right(self):  return self._input_report[1] & 0x02 > 0
 
     def get_accel(self) -> Tuple[int, int, int]:
-        x = self._input_report[4]
-        y = self._input_report[5]
-        z = self._input_report[6]
+        x = self._input_report[3]
+        y = self._input_report[4]
+        z = self._input_report[5]
         return (x, y, z)
 
+    def drain_accels(self) -> List[Tuple[float, Tuple[int, int, int]]]:
+        """Saca del buffer las muestras pendientes con el instante en que se leyeron"""
+        self._accel_backlog.observe(len(self._accels))
+        samples = []
+        while self._accels:
+            samples.append(self._accels.popleft())
+        return samples
+
+    def get_accels(self) -> List[List[int]]:
+        """Muestras pendientes como [[x, y, z], ...], sin marcas de tiempo"""
+        return [list(accel) for _, accel in self.drain_accels()]
+
     def get_status(self) -> dict:
         return {
             "buttons": {
@@ -78,5 +259,17 @@ class Wiimote:
         return callback
 
     def close(self):
+        """Detiene el hilo lector y cierra el dispositivo. Se puede llamar varias veces."""
+        if self._device is None:
+            return
         self._running = False
-        self._device.close()
+        if self._thread.is_alive() and current_thread() is not self._thread:
+            self._thread.join()
+        with self._mode_lock:
+            device, self._device = self._device, None
+            if device is None:
+                return
+            device.close()
+        if self._capture is not None:
+            self._capture.close()
+        REGISTRY.remove(serial=self.metrics_serial)
@@ -0,0 +1,1539 @@
+"""Servidor web de Wiimote Just Dance: sesiones, interfaz, /ws y métricas.
+
+Se arranca con dance.py; workers.py importa de aquí las mismas clases.
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import hmac
+import importlib
+import ipaddress
+import json
+import logging
+import mimetypes
+import os
+import random
+import socket
+import time
+from enum import Enum
+
+import aiohttp
+from aiohttp import web
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from joydance.constants import (
+    ACCEL_ACQUISITION_FREQ_HZ, ACCEL_ACQUISITION_LATENCY,
+    ACCEL_MAX_RANGE, FRAME_DURATION, SHORTCUT_MAPPING,
+    UBI_APP_ID, UBI_SKU_ID, WS_SUBPROTOCOLS, Command,
+    WsSubprotocolVersion, WiimoteButton)
+from joydance import JoyDance, PairingState
+from joydance.batch import PairingTimeline, SharedPairing, load_pairing_config
+from joydance.httpclient import close_http_session, get_http_session
+from joydance.latency import LatencyEstimator
+from joydance.profiling import PROFILE_DEFAULT_DURATION, SAMPLE_INTERVAL, AllocationTracker, Profiler
+from joydance.tls import get_default_ssl_context, resuming, session_key
+from joydance.watchdog import LoopWatchdog
+from pycon.log import parse_levels, setup_logging
+from pycon.metrics import REGISTRY, render_prometheus
+from pycon.event import ButtonEventWiimote
+from pycon.hidraw import HidrawDevice, list_hidraw_wiimotes
+from pycon.replay import ReplayWiimote
+from pycon.simulate import SimulatedWiimote, SineMotion
+from pycon.wiimote import hidapi_available, list_wiimotes, open_hid_path
+
+
+HTTP_DISCOVERY_TIMEOUT = 2  # s
+UDP_DISCOVERY_PORT = 6000
+UDP_DISCOVERY_TIMEOUT = 1  # s por mensaje
+PING_INTERVAL = 10  # s
+WS_PUSH_INTERVAL = 0.1  # s
+STATS_POLL_INTERVAL = 1  # s
+BATTERY_POLL_INTERVAL = 60  # s
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+# Hosts que se consultan al emparejar; se resuelven por adelantado al arrancar
+PAIRING_HOSTS = [
+    'jmcs-controller-api.just-dance.com',
+    'public-ubiservices.ubi.com',
+    'prod.just-dance.com',
+]
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+log = logging.getLogger('dance')
+pairing_log = logging.getLogger('dance.pairing')
+command_log = logging.getLogger('dance.command')
+game_log = logging.getLogger('dance.game')
+timing_log = logging.getLogger('dance.timing')
+
+
+class State(Enum):
+    DISCONNECTED = 0
+    IDLE = 1
+    PENDING = 2
+    CONNECTED = 3
+    DANCING = 4
+
+
+# Estados de WiimoteDance traducidos a los que entiende la interfaz (app.js)
+PAIRING_STATES = {
+    State.DISCONNECTED: PairingState.DISCONNECTED,
+    State.IDLE: PairingState.IDLE,
+    State.PENDING: PairingState.CONNECTING,
+    State.CONNECTED: PairingState.CONNECTED,
+    State.DANCING: PairingState.CONNECTED,
+}
+
+WIIMOTE_NAMES = {
+    0x0306: 'Wii Remote',
+    0x0307: 'Wii Remote Plus',
+}
+
+
+class UdpDiscoveryProtocol(asyncio.DatagramProtocol):
+    """Guarda en una cola las respuestas al descubrimiento UDP"""
+
+    def __init__(self):
+        self.replies = asyncio.Queue()
+
+    def datagram_received(self, data, addr):
+        self.replies.put_nowait((data, addr))
+
+    def error_received(self, exc):
+        pairing_log.debug('  Error UDP: %s', exc)
+
+
+class WiimoteDance:
+    def __init__(self, wiimote, protocol_version, pairing_id=None, pairing_code=None, on_state_changed=None):
+        self.wiimote = wiimote
+        self.protocol_version = protocol_version
+        self.pairing_id = pairing_id or str(random.randint(0, 0xFFFFFFFF))
+        self.pairing_code = pairing_code
+        self.state = State.IDLE
+        self.ws = None
+        self.ws_url = None
+        self.last_phone_accel_sent_at = 0
+        self.latency = LatencyEstimator()
+        self.stopped = False
+
+        labels = {'serial': getattr(wiimote, 'metrics_serial', wiimote.serial)}
+        self.metric_encode = REGISTRY.histogram('joydance_encode_ms', 'JSON encode time per message', **labels)
+        self.metric_send = REGISTRY.histogram('joydance_ws_send_ms', 'ws.send time per message', **labels)
+        self.metric_messages = REGISTRY.counter('joydance_messages_sent_total', 'Messages sent', **labels)
+        self.metric_commands = REGISTRY.counter('joydance_commands_sent_total', 'Button commands sent', **labels)
+        
+        if on_state_changed:
+            self.on_state_changed = on_state_changed
+        else:
+            self.on_state_changed = self._default_state_changed
+
+    @property
+    def latency_ms(self):
+        """Latencia estimada de las muestras: cola local + medio RTT del WebSocket"""
+        return self.latency.latency_ms
+
+    async def _default_state_changed(self, state):
+        log.info('[Estado] %s', state.name)
+
+    def change_state(self, state):
+        if state == self.state:
+            return
+        self.state = state
+        asyncio.create_task(self.on_state_changed(state))
+
+    async def pair(self):
+        self.change_state(State.PENDING)
+
+        if self.protocol_version == WsSubprotocolVersion.V2:
+            await self.pair_with_code()
+        else:
+            await self.pair_v1()
+
+    async def pair_with_code(self):
+        """Emparejamiento V2 con código (JD 2018+)"""
+        url = f'https://jmcs-controller-api.just-dance.com/pair/{self.pairing_code}'
+        headers = {
+            'X-SkuId': UBI_SKU_ID,
+        }
+
+        try:
+            session = get_http_session()
+            async with session.get(url, headers=headers) as resp:
+                if resp.status != 200:
+                    pairing_log.error('Error al emparejar: %s', resp.status)
+                    self.change_state(State.IDLE)
+                    return
+
+                result = await resp.json()
+                self.ws_url = result['jdcsUrl']
+        except Exception as e:
+            pairing_log.error('Error de emparejamiento: %s', e)
+            self.change_state(State.IDLE)
+            return
+
+        await self.connect()
+
+    async def pair_v1(self):
+        """Emparejamiento V1 directo por IP (JD 2016-2019)"""
+        import websockets
+
+        if not self.pairing_id:
+            pairing_log.error('Error: Se requiere una IP para emparejamiento V1')
+            self.change_state(State.IDLE)
+            return
+
+        pairing_log.info('Enviando descubrimiento UDP a %s:6000...', self.pairing_id)
+        udp_success = await self.udp_discovery(self.pairing_id)
+        
+        if udp_success:
+            pairing_log.info('Descubrimiento UDP exitoso')
+        else:
+            pairing_log.warning('Advertencia: No hubo respuesta UDP, intentando de todas formas...')
+        
+        # Pequeña espera para que Just Dance procese el descubrimiento
+        await asyncio.sleep(1)
+
+        pairing_log.info('Intentando descubrimiento HTTP en %s...', self.pairing_id)
+        discovered = await self.http_discovery(self.pairing_id)
+        
+        if not discovered:
+            pairing_log.warning('Advertencia: No se pudo hacer descubrimiento HTTP, intentando WebSocket directo...')
+        
+        ports_to_try = [8080, 50000, 50001]
+        paths_to_try = ['', '/ws', '/websocket', '/controller', '/phone']
+        
+        for port in ports_to_try:
+            for path in paths_to_try:
+                if self.stopped:
+                    return
+
+                test_url = f'ws://{self.pairing_id}:{port}{path}'
+                pairing_log.info('Probando %s...', test_url)
+                self.ws_url = test_url
+                
+                try:
+                    await self.connect()
+                    pairing_log.info('Conexion exitosa en %s', test_url)
+                    return
+                except websockets.exceptions.InvalidStatusCode as e:
+                    pairing_log.info('  Puerto %s%s - HTTP %s', port, path, e.status_code)
+                except Exception as e:
+                    pairing_log.info('  Puerto %s%s - %s: %.80s', port, path, type(e).__name__, e)
+                    continue
+        
+        pairing_log.error('Error: No se pudo conectar en ninguna combinacion de puerto/path')
+        self.change_state(State.IDLE)
+
+    async def udp_discovery(self, ip):
+        """Envía mensajes de descubrimiento UDP al puerto 6000 y espera respuesta a cada uno"""
+        loop = asyncio.get_running_loop()
+
+        # Mensaje de descubrimiento (puede variar según el protocolo)
+        discovery_messages = [
+            b'DISCOVER',
+            b'JDCONTROLLER',
+            json.dumps({
+                'type': 'discover',
+                'deviceId': self.pairing_id
+            }).encode('utf-8'),
+            json.dumps({
+                'msg': 'discover'
+            }).encode('utf-8')
+        ]
+
+        try:
+            # Endpoint de datagramas: las esperas no bloquean el event loop
+            transport, protocol = await loop.create_datagram_endpoint(
+                UdpDiscoveryProtocol, family=socket.AF_INET, allow_broadcast=True)
+        except OSError as e:
+            pairing_log.error('Error en descubrimiento UDP: %s', e)
+            return False
+
+        try:
+            for message in discovery_messages:
+                try:
+                    transport.sendto(message, (ip, UDP_DISCOVERY_PORT))
+                    pairing_log.debug('  Enviado UDP: %s', message[:50])
+                    data, addr = await asyncio.wait_for(protocol.replies.get(), UDP_DISCOVERY_TIMEOUT)
+                except asyncio.TimeoutError:
+                    continue
+                except Exception as e:
+                    pairing_log.info('  Error UDP con mensaje %s: %s', message[:20], type(e).__name__)
+                    continue
+                pairing_log.info('  Respuesta UDP de %s: %s', addr, data[:100])
+                return True
+            return False
+        finally:
+            transport.close()
+
+    async def http_discovery(self, ip):
+        """Intenta descubrimiento HTTP antes del WebSocket.
+
+        Todos los endpoints se prueban a la vez sobre la sesión HTTP compartida.
+        Devuelve el primero que responde con éxito (y cancela el resto), o None.
+        """
+        endpoints = [
+            f'http://{ip}:8080/',
+            f'http://{ip}:8080/discovery',
+            f'http://{ip}:8080/connect',
+            f'http://{ip}:8080/api',
+        ]
+
+        tasks = [asyncio.create_task(self._probe_http_endpoint(endpoint)) for endpoint in endpoints]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    endpoint = await next_done
+                except Exception as e:
+                    pairing_log.error('Error en descubrimiento HTTP: %s', e)
+                    continue
+                if endpoint:
+                    return endpoint
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        return None
+
+    async def _probe_http_endpoint(self, endpoint):
+        """Prueba un endpoint HTTP y registra cuánto tardó en responder. Devuelve el endpoint si respondió bien"""
+        started_at = time.perf_counter()
+        try:
+            session = get_http_session()
+            async with session.get(endpoint, timeout=aiohttp.ClientTimeout(total=HTTP_DISCOVERY_TIMEOUT)) as resp:
+                elapsed_ms = (time.perf_counter() - started_at) * 1000
+                pairing_log.info('  HTTP %s - Status %s (%.0f ms)', endpoint, resp.status, elapsed_ms)
+                if resp.status in [200, 201, 204]:
+                    text = await resp.text()
+                    pairing_log.info('  Respuesta: %.100s', text)
+                    return endpoint
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            elapsed_ms = (time.perf_counter() - started_at) * 1000
+            pairing_log.info('  HTTP %s - %s (%.0f ms)', endpoint, type(e).__name__, elapsed_ms)
+
+        return None
+
+    async def connect(self):
+        """Conecta al servidor WebSocket de Just Dance"""
+        import websockets
+
+        if not self.ws_url:
+            log.error('Error: No hay URL de WebSocket')
+            return
+
+        try:
+            ssl_context = None
+            if self.ws_url.startswith('wss://'):
+                ssl_context = get_default_ssl_context()
+
+            subprotocol = 'v2' if self.protocol_version == WsSubprotocolVersion.V2 else 'v1'
+            
+            with resuming(session_key(self.ws_url)):
+                self.ws = await asyncio.wait_for(
+                    websockets.connect(
+                        self.ws_url,
+                        subprotocols=[subprotocol],
+                        ssl=ssl_context,
+                        ping_interval=None  # Desactivar ping automático
+                    ),
+                    timeout=3.0  # Timeout de 3 segundos
+                )
+
+            if ssl_context:
+                ssl_context.remember_session(self.ws.transport, session_key(self.ws_url))
+
+            self.change_state(State.CONNECTED)
+            log.info('Conectado exitosamente a %s', self.ws_url)
+            # Solo botones hasta que empiece la canción (msg_id 5)
+            await self.set_accel_reporting(False)
+
+            await asyncio.gather(
+                self.send_ping(),
+                self.send_command(),
+                self.receive_message()
+            )
+
+        except asyncio.TimeoutError:
+            log.warning('Timeout al conectar')
+            self.change_state(State.IDLE)
+            raise
+        except Exception as e:
+            log.error('Error de conexión: %s: %s', type(e).__name__, e)
+            self.change_state(State.IDLE)
+            raise
+
+    async def send_ping(self):
+        """Envía pings periódicos para mantener la conexión"""
+        while self.ws and not self.ws.closed:
+            try:
+                pong_waiter = await self.ws.ping()
+                sent_at = time.perf_counter()
+                await asyncio.wait_for(pong_waiter, timeout=PING_INTERVAL)
+                self.latency.add_rtt((time.perf_counter() - sent_at) * 1000)
+                await asyncio.sleep(PING_INTERVAL)
+            except Exception as e:
+                log.warning('Error al enviar ping: %s', e)
+                break
+
+    async def send_command(self):
+        """Envía comandos del Wiimote a Just Dance"""
+        while self.ws and not self.ws.closed:
+            try:
+                events = self.wiimote.events()
+                
+                for event_type, status in events:
+                    if status == 0:
+                        continue
+
+                    command = SHORTCUT_MAPPING.get(event_type)
+                    if command:
+                        await self._send_json({'command': command.value})
+                        self.metric_commands.inc()
+                        command_log.info('[CMD] %s', command.name)
+
+                now = time.time()
+                if now - self.last_phone_accel_sent_at >= ACCEL_ACQUISITION_LATENCY:
+                    samples = self.wiimote.drain_accels()
+                    if not samples and not self.wiimote.accel_reporting:
+                        # En los menús no hay acelerómetro: no enviar frames vacíos
+                        await asyncio.sleep(FRAME_DURATION)
+                        continue
+                    self.latency.add_samples([captured_at for captured_at, _ in samples], time.monotonic())
+                    await self._send_json({
+                        'phoneAccel': {
+                            'data': [list(accel) for _, accel in samples],
+                        }
+                    })
+                    self.last_phone_accel_sent_at = now
+
+                await asyncio.sleep(FRAME_DURATION)
+
+            except Exception as e:
+                log.exception('Error al enviar comando: %s', e)
+                break
+
+    async def set_accel_reporting(self, enabled):
+        """Acelerómetro continuo solo mientras se baila (ver Wiimote.set_accel_reporting)"""
+        # La escritura HID puede tardar unos ms por Bluetooth
+        await asyncio.get_running_loop().run_in_executor(None, self.wiimote.set_accel_reporting, enabled)
+
+    async def receive_message(self):
+        """Recibe mensajes del servidor"""
+        import websockets
+
+        while self.ws and not self.ws.closed:
+            try:
+                message = await self.ws.recv()
+                data = json.loads(message)
+
+                if 'msg_id' in data:
+                    msg_id = data['msg_id']
+                    
+                    if msg_id == 5:
+                        await self.set_accel_reporting(True)
+                        self.change_state(State.DANCING)
+                        game_log.info('[INFO] Juego iniciado')
+                    
+                    elif msg_id == 6:
+                        self.change_state(State.CONNECTED)
+                        await self.set_accel_reporting(False)
+                        game_log.info('[INFO] Juego pausado')
+                    
+                    elif msg_id == 7:
+                        self.change_state(State.CONNECTED)
+                        await self.set_accel_reporting(False)
+                        game_log.info('[INFO] Juego terminado')
+
+            except websockets.exceptions.ConnectionClosed:
+                game_log.info('[INFO] Conexión cerrada')
+                break
+            except Exception as e:
+                log.error('Error al recibir mensaje: %s', e)
+                break
+
+        self.change_state(State.DISCONNECTED)
+
+    async def _send_json(self, data):
+        """Envía datos JSON al servidor"""
+        if self.ws and not self.ws.closed:
+            started_at = time.perf_counter()
+            payload = json.dumps(data)
+            encoded_at = time.perf_counter()
+            await self.ws.send(payload)
+            self.metric_encode.observe((encoded_at - started_at) * 1000)
+            self.metric_send.observe((time.perf_counter() - encoded_at) * 1000)
+            self.metric_messages.inc()
+
+    async def disconnect(self):
+        """Cierra el WebSocket, detiene el hilo del Wiimote y cierra el dispositivo"""
+        if self.stopped:
+            return
+        self.stopped = True
+
+        if self.ws:
+            if self.ws_url.startswith('wss://'):
+                get_default_ssl_context().remember_session(self.ws.transport, session_key(self.ws_url))
+            await self.ws.close()
+
+        # Esperar al hilo lector puede bloquear hasta el timeout de lectura
+        await asyncio.get_running_loop().run_in_executor(None, self.wiimote.close)
+        self.change_state(State.DISCONNECTED)
+
+    def status(self):
+        """Estado actual de la sesión, serializable a JSON"""
+        return {
+            'serial': self.wiimote.serial,
+            'protocol': self.protocol_version.value,
+            'state': self.state.name,
+            'pairing_id': self.pairing_id,
+            'ws_url': self.ws_url,
+        }
+
+
+class SessionError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class Session:
+    """Una sesión registrada: el bailarín, su tarea de emparejamiento y su estado"""
+
+    def __init__(self, serial, dancer):
+        self.serial = serial
+        self.dancer = dancer
+        self.task = None
+        self.state = None
+        self.started_at = time.time()
+        self.paired_after = None
+        self._created_at = time.perf_counter()
+        self.sample_rate = None
+        self._reports_seen = 0
+        self._stats_at = None
+
+    def status(self):
+        if hasattr(self.dancer, 'status'):
+            status = self.dancer.status()
+        else:
+            status = {'serial': self.serial}
+
+        if self.state is not None:
+            status['state'] = self.state.name
+        status['started_at'] = self.started_at
+        status['running'] = self.task is not None and not self.task.done()
+        return status
+
+    def report_paired(self):
+        """Muestra una vez cuánto tardó la sesión en quedar emparejada"""
+        if self.paired_after is None and self.pairing_state() == PairingState.CONNECTED.value:
+            self.paired_after = time.perf_counter() - self._created_at
+            timing_log.info('[Tiempo] %s emparejado en %.2f s', self.serial, self.paired_after)
+
+    @property
+    def device(self):
+        return getattr(self.dancer, 'wiimote', None) or getattr(self.dancer, 'joycon', None)
+
+    def pairing_state(self):
+        state = self.state if self.state is not None else getattr(self.dancer, 'state', None)
+        if isinstance(state, State):
+            state = PAIRING_STATES[state]
+        return (state or PairingState.IDLE).value
+
+    def update_stats(self):
+        """Recalcula la frecuencia de reportes HID desde la última llamada"""
+        now = time.monotonic()
+        reports = getattr(self.device, 'reports_received', 0)
+        if self._stats_at is not None and now > self._stats_at:
+            self.sample_rate = round((reports - self._reports_seen) / (now - self._stats_at))
+        self._reports_seen = reports
+        self._stats_at = now
+
+    def push_state(self):
+        """Campos que se envían a la interfaz por /ws"""
+        device = self.device
+        latency_ms = getattr(self.dancer, 'latency_ms', None)
+        return {
+            'state': self.pairing_state(),
+            'battery_level': getattr(device, 'battery_level', None),
+            'sample_rate': self.sample_rate,
+            'latency_ms': round(latency_ms) if latency_ms is not None else None,
+        }
+
+
+class DeviceCatalog:
+    """Mandos que se pueden abrir: los Wiimotes reales, las capturas a reproducir
+    y los simulados.
+
+    Es picklable para poder pasarlo a los workers. Con capture_dir, cada mando
+    real que se abre graba sus reportes en <capture_dir>/<serial>-<fecha>.wmcap.
+    Con hidraw, los mandos reales se buscan en sysfs y se leen de /dev/hidrawN sin hidapi.
+    """
+
+    def __init__(self, replay_files=(), replay_realtime=True, capture_dir=None, simulated=0, simulated_rate_hz=200,
+                 hidraw=False):
+        self.replay_files = list(replay_files)
+        self.replay_realtime = replay_realtime
+        self.capture_dir = capture_dir
+        self.simulated = simulated
+        self.simulated_rate_hz = simulated_rate_hz
+        self.hidraw = hidraw
+
+    def _replay_devices(self):
+        devices = []
+        for path in self.replay_files:
+            name = os.path.splitext(os.path.basename(path))[0]
+            devices.append({'serial': f'replay-{name}', 'vendor_id': None, 'product_id': None, 'replay': path})
+        return devices
+
+    def _simulated_devices(self):
+        return [{'serial': f'sim-{i}', 'vendor_id': None, 'product_id': None, 'simulated': i}
+                for i in range(self.simulated)]
+
+    def list(self):
+        if self.hidraw:
+            real = list_hidraw_wiimotes()
+        elif hidapi_available():
+            real = list_wiimotes()
+        else:
+            # Sin hidapi solo hay capturas y simulados (p. ej. con --simulate)
+            real = []
+        for device in real:
+            if not device['serial']:
+                # Sin número de serie la ruta distingue a los mandos (y open() los abre por ella)
+                path = device.get('path') or device['hid_path']
+                digest = hashlib.sha1(path if isinstance(path, bytes) else path.encode()).hexdigest()
+                device['serial'] = f'wiimote-{digest[:8]}'
+        return real + self._replay_devices() + self._simulated_devices()
+
+    def open(self, device):
+        if device.get('simulated') is not None:
+            # Fase distinta por mando para que no se muevan todos a la vez
+            motion = SineMotion(phases=tuple(p + device['simulated'] for p in (0.0, 1.0, 2.0)))
+            return SimulatedWiimote(device['serial'], rate_hz=self.simulated_rate_hz, motion=motion,
+                                    noise=2, seed=device['simulated'])
+        if device.get('replay'):
+            return ReplayWiimote(device['replay'], realtime=self.replay_realtime, loop=True, serial=device['serial'])
+
+        capture_path = None
+        if self.capture_dir:
+            os.makedirs(self.capture_dir, exist_ok=True)
+            name = f"{device['serial'] or 'wiimote'}-{time.strftime('%Y%m%d-%H%M%S')}.wmcap"
+            capture_path = os.path.join(self.capture_dir, name.replace(':', ''))
+            log.info('[Captura] %s -> %s', device['serial'], capture_path)
+        if device.get('path'):
+            hid_device = HidrawDevice(device['path'])
+        elif device.get('hid_path'):
+            hid_device = open_hid_path(device['hid_path'])
+        else:
+            hid_device = None
+        try:
+            return ButtonEventWiimote(product_id=device['product_id'], serial=device['serial'],
+                                      capture_path=capture_path, device=hid_device)
+        except Exception:
+            # Si falla, p. ej., la primera escritura del modo de reporte, el fd no debe quedar abierto
+            if hid_device is not None:
+                hid_device.close()
+            raise
+
+
+class SessionManager:
+    """Registro de todas las sesiones WiimoteDance/JoyDance, indexadas por serial.
+
+    DeviceCatalog da a los mandos sin número de serie uno derivado de su ruta,
+    así que el serial identifica siempre a un único dispositivo.
+
+    Garantiza que un mismo dispositivo no se abra dos veces y que al detener una
+    sesión se cierren el WebSocket, el hilo HID y el dispositivo.
+    """
+
+    def __init__(self, on_session_changed=None, devices=None):
+        self._sessions = {}
+        self._lock = asyncio.Lock()
+        self.on_session_changed = on_session_changed
+        self.devices = devices or DeviceCatalog()
+
+    def __iter__(self):
+        return iter(list(self._sessions.values()))
+
+    def _notify(self, session):
+        if self.on_session_changed:
+            self.on_session_changed(session)
+
+    def __contains__(self, serial):
+        return serial in self._sessions
+
+    def get(self, serial):
+        return self._sessions.get(serial)
+
+    def list(self):
+        return [session.status() for session in self._sessions.values()]
+
+    def _pick_free_serial(self, devices):
+        for device in devices:
+            if device['serial'] not in self._sessions:
+                return device
+        return None
+
+    async def start_wiimote(self, protocol_version, pairing_code=None, pairing_id=None, serial=None):
+        """Abre un Wiimote libre (o el indicado) y empieza a emparejarlo"""
+        loop = asyncio.get_running_loop()
+
+        async with self._lock:
+            devices = await loop.run_in_executor(None, self.devices.list)
+            if serial is None:
+                device = self._pick_free_serial(devices)
+                if device is None:
+                    raise SessionError('No hay Wiimotes libres', status=409)
+            else:
+                device = next((d for d in devices if d['serial'] == serial), None)
+                if device is None:
+                    raise SessionError(f'Wiimote {serial} no encontrado', status=404)
+
+            serial = device['serial']
+            if serial in self._sessions:
+                raise SessionError(f'El Wiimote {serial} ya tiene una sesión', status=409)
+
+            try:
+                wiimote = await loop.run_in_executor(None, self.devices.open, device)
+            except Exception as e:
+                raise SessionError(f'Error al conectar Wiimote: {e}', status=500)
+
+            dancer = WiimoteDance(
+                wiimote=wiimote,
+                protocol_version=protocol_version,
+                pairing_code=pairing_code,
+                pairing_id=pairing_id,
+            )
+            return self.add(serial, dancer, dancer.pair())
+
+    def add(self, serial, dancer, coro):
+        """Registra un bailarín ya creado y lanza su corrutina principal"""
+        session = Session(serial, dancer)
+        self._sessions[serial] = session
+
+        if isinstance(dancer, WiimoteDance):
+            default_callback = dancer.on_state_changed
+
+            async def on_state_changed(state):
+                session.state = state
+                session.report_paired()
+                self._notify(session)
+                await default_callback(state)
+        else:
+            async def on_state_changed(serial, state):
+                session.state = state
+                session.report_paired()
+                self._notify(session)
+        dancer.on_state_changed = on_state_changed
+        self._notify(session)
+
+        session.task = asyncio.create_task(coro)
+        session.task.add_done_callback(lambda task: asyncio.create_task(self._reap(session)))
+        return session
+
+    async def _reap(self, session):
+        """Libera los recursos de una sesión cuya tarea terminó sola"""
+        if self._sessions.get(session.serial) is session:
+            await self.stop(session.serial)
+
+    async def stop(self, serial):
+        session = self._sessions.pop(serial, None)
+        if session is None:
+            raise SessionError(f'No hay sesión para {serial}', status=404)
+
+        if session.task and not session.task.done():
+            session.task.cancel()
+            try:
+                await session.task
+            except BaseException:
+                pass
+
+        try:
+            await session.dancer.disconnect()
+        except Exception as e:
+            log.error('Error al detener sesión %s: %s', serial, e)
+
+        session.state = PairingState.DISCONNECTED
+        self._notify(session)
+        return session
+
+    async def stop_all(self):
+        for serial in list(self._sessions):
+            await self.stop(serial)
+
+
+class PushClient:
+    """Un navegador conectado a /ws.
+
+    Los cambios pendientes se acumulan por serial y se envían como mucho una vez
+    cada WS_PUSH_INTERVAL, así un cliente lento recibe menos mensajes en lugar
+    de acumular una cola. Si un envío falla, el cliente se da de baja del
+    broadcaster y cierra su WebSocket.
+    """
+
+    def __init__(self, ws, broadcaster=None):
+        self.ws = ws
+        self.broadcaster = broadcaster
+        self.pending = {}
+        self.wakeup = asyncio.Event()
+
+    def queue(self, serial, diff):
+        self.pending.setdefault(serial, {}).update(diff)
+        self.wakeup.set()
+
+    async def send(self, cmd, data):
+        await self.ws.send_json({'cmd': 'resp_' + cmd, 'data': data})
+
+    async def run(self):
+        try:
+            while not self.ws.closed:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+
+                pending, self.pending = self.pending, {}
+                for serial, diff in pending.items():
+                    await self.send('update_joycon_state', {'serial': serial, **diff})
+
+                await asyncio.sleep(WS_PUSH_INTERVAL)
+        except (ConnectionError, RuntimeError) as e:
+            # aiohttp: ConnectionResetError o RuntimeError al escribir en un transporte cerrado
+            log.debug('Cliente /ws desconectado: %s: %s', type(e).__name__, e)
+        finally:
+            if self.broadcaster is not None:
+                self.broadcaster.clients.discard(self)
+        await self.ws.close()
+
+
+class StateBroadcaster:
+    """Difunde a todos los navegadores solo los campos que cambiaron de cada sesión"""
+
+    def __init__(self):
+        self.clients = set()
+        self._last = {}
+
+    def publish(self, serial, state):
+        last = self._last.setdefault(serial, {})
+        diff = {key: value for key, value in state.items() if key not in last or last[key] != value}
+        if state.get('state') == PairingState.DISCONNECTED.value:
+            # La sesión terminó: una nueva con el mismo serial empieza de cero
+            del self._last[serial]
+        if not diff:
+            return
+
+        last.update(diff)
+        for client in self.clients:
+            client.queue(serial, diff)
+
+    def publish_session(self, session):
+        self.publish(session.serial, session.push_state())
+
+    async def poll_stats(self, sessions):
+        """Publica periódicamente batería, frecuencia de muestreo y latencia"""
+        last_battery_poll = 0
+        while True:
+            await asyncio.sleep(STATS_POLL_INTERVAL)
+
+            poll_battery = time.monotonic() - last_battery_poll >= BATTERY_POLL_INTERVAL
+            if poll_battery:
+                last_battery_poll = time.monotonic()
+
+            for session in sessions:
+                if poll_battery and hasattr(session.device, 'request_status'):
+                    try:
+                        session.device.request_status()
+                    except (OSError, ValueError):
+                        pass
+                session.update_stats()
+                self.publish_session(session)
+
+
+class StaticAsset:
+    def __init__(self, path, body):
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if path.endswith('.js'):
+            self.content_type = 'application/javascript'
+
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        # Las URLs no llevan versión: el navegador revalida siempre con el ETag (304 si no cambió)
+        self.cache_control = 'no-cache'
+
+        # Cada codificación tiene su propio ETag fuerte
+        self.variants = {None: (body, f'"{digest}"')}
+        if self.content_type.startswith(COMPRESSIBLE_TYPES):
+            gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(gzipped) < len(body):
+                self.variants['gzip'] = (gzipped, f'"{digest}-gz"')
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    self.variants['br'] = (compressed, f'"{digest}-br"')
+
+
+class StaticCache:
+    """Archivos de static/ cargados en memoria al arrancar, con variantes gzip/brotli.
+
+    Las rutas se resuelven respecto al paquete, no al directorio de trabajo.
+    """
+
+    def __init__(self, root=STATIC_DIR):
+        self.root = root
+        self.assets = {}
+
+    def build(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                path = os.path.relpath(full_path, self.root).replace(os.sep, '/')
+                with open(full_path, 'rb') as f:
+                    self.assets[path] = StaticAsset(path, f.read())
+        return self
+
+    def response(self, request, path):
+        asset = self.assets.get(path)
+        if asset is None:
+            raise web.HTTPNotFound()
+
+        accept_encoding = request.headers.get('Accept-Encoding', '')
+        encoding = None
+        for candidate in ('br', 'gzip'):
+            if candidate in asset.variants and candidate in accept_encoding:
+                encoding = candidate
+                break
+
+        body, etag = asset.variants[encoding]
+        headers = {
+            'ETag': etag,
+            'Cache-Control': asset.cache_control,
+            'Vary': 'Accept-Encoding',
+        }
+
+        if etag in request.headers.get('If-None-Match', ''):
+            return web.Response(status=304, headers=headers)
+
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return web.Response(body=body, content_type=asset.content_type, headers=headers)
+
+
+async def static_file(request):
+    return request.app['static'].response(request, request.match_info['path'])
+
+
+routes = web.RouteTableDef()
+
+@routes.get('/')
+async def index(request):
+    if not request.app['first_page_served']:
+        request.app['first_page_served'] = True
+        elapsed = time.perf_counter() - request.app['started_at']
+        timing_log.info('[Tiempo] Primera página servida a los %.2f s del arranque', elapsed)
+    return request.app['static'].response(request, 'index.html')
+
+async def read_json(request):
+    """Cuerpo de la petición como objeto JSON; SessionError (400) si no lo es"""
+    try:
+        data = await request.json()
+    except ValueError:
+        raise SessionError('El cuerpo no es JSON válido')
+    if not isinstance(data, dict):
+        raise SessionError('El cuerpo debe ser un objeto JSON')
+    return data
+
+
+@routes.post('/start')
+async def start_dance(request):
+    """Inicia el emparejamiento con Just Dance"""
+    try:
+        data = await read_json(request)
+    except SessionError as e:
+        return web.json_response({'error': str(e)}, status=e.status)
+
+    try:
+        method = data.get('method')
+        value = data.get('value', '')
+        serial = data.get('serial')
+
+        log.info('[INICIO] Método: %s, Valor: %s', method, value)
+
+        if method == 'code':
+            protocol_version = WsSubprotocolVersion.V2
+            pairing_code = value
+            pairing_id = None
+        elif method == 'old':
+            protocol_version = WsSubprotocolVersion.V1
+            pairing_code = None
+            pairing_id = value
+        else:
+            return web.json_response({'error': 'Método desconocido'}, status=400)
+
+        try:
+            session = await request.app['sessions'].start_wiimote(
+                protocol_version,
+                pairing_code=pairing_code,
+                pairing_id=pairing_id,
+                serial=serial,
+            )
+            log.info('Wiimote conectado (%s)', session.serial)
+        except SessionError as e:
+            log.error('Error: %s', e)
+            return web.json_response({'error': str(e)}, status=e.status)
+
+        return web.json_response({'status': 'ok', 'session': session.status()})
+
+    except Exception as e:
+        log.exception('Error: %s', e)
+        return web.json_response({'error': str(e)}, status=500)
+
+
+@routes.get('/metrics')
+async def metrics(request):
+    """Métricas de todas las etapas: JSON, o texto Prometheus con ?format=prometheus"""
+    samples = REGISTRY.snapshot()
+    sessions = request.app['sessions']
+    if hasattr(sessions, 'metrics_snapshot'):
+        samples += sessions.metrics_snapshot()
+
+    wants_prometheus = (request.query.get('format') == 'prometheus'
+                        or 'text/plain' in request.headers.get('Accept', ''))
+    if wants_prometheus:
+        return web.Response(text=render_prometheus(samples), content_type='text/plain',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+    return web.json_response({'metrics': samples})
+
+
+@routes.get('/stalls')
+async def stalls(request):
+    """Bloqueos del event loop detectados por el watchdog (--watchdog-ms)"""
+    watchdog = request.app['watchdog']
+    if watchdog is None:
+        return web.json_response({'error': 'Watchdog desactivado, usa --watchdog-ms'}, status=404)
+
+    reports = watchdog.snapshot()
+    sessions = request.app['sessions']
+    if hasattr(sessions, 'stall_reports'):
+        reports += sessions.stall_reports()
+    return web.json_response({'threshold_ms': watchdog.threshold * 1000, 'stalls': reports})
+
+
+def is_loopback(address):
+    try:
+        ip = ipaddress.ip_address(address or '')
+    except ValueError:
+        return False
+    return ip.is_loopback or (ip.version == 6 and ip.ipv4_mapped is not None and ip.ipv4_mapped.is_loopback)
+
+
+def profiling_denied(request, tool):
+    """Respuesta de error si el perfilado está desactivado (404) o la petición no está autorizada (403).
+
+    Sin --profiling-token solo se atiende a localhost; con él, a quien lo mande
+    en 'Authorization: Bearer <token>'.
+    """
+    if tool is None:
+        return web.json_response({'error': 'Perfilado desactivado, usa --profiling'}, status=404)
+    token = request.app['profiling_token']
+    if token:
+        allowed = hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode())
+    else:
+        allowed = is_loopback(request.remote)
+    if not allowed:
+        return web.json_response({'error': 'No autorizado'}, status=403)
+    return None
+
+
+@routes.get('/profile')
+async def profile_status(request):
+    """Estado del perfil en curso, o del último con sus funciones más costosas"""
+    profiler = request.app['profiler']
+    denied = profiling_denied(request, profiler)
+    if denied:
+        return denied
+
+    try:
+        limit = int(request.query.get('limit', 20))
+    except ValueError:
+        return web.json_response({'error': 'limit debe ser un entero'}, status=400)
+
+    status = profiler.status()
+    if status['formats']:
+        status['top'] = profiler.top(limit)
+    return web.json_response(status)
+
+
+@routes.post('/profile/start')
+async def profile_start(request):
+    """Empieza un perfil limitado en el tiempo: ?mode=sample|cprofile&duration=30&interval_ms=10"""
+    profiler = request.app['profiler']
+    denied = profiling_denied(request, profiler)
+    if denied:
+        return denied
+
+    try:
+        status = profiler.start(
+            mode=request.query.get('mode', 'sample'),
+            duration=float(request.query.get('duration', PROFILE_DEFAULT_DURATION)),
+            interval=float(request.query.get('interval_ms', SAMPLE_INTERVAL * 1000)) / 1000,
+        )
+    except ValueError as e:
+        return web.json_response({'error': str(e)}, status=400)
+    except RuntimeError as e:
+        return web.json_response({'error': str(e)}, status=409)
+    log.info('[Perfil] Perfil %s iniciado', profiler.mode)
+    return web.json_response(status)
+
+
+@routes.post('/profile/stop')
+async def profile_stop(request):
+    profiler = request.app['profiler']
+    denied = profiling_denied(request, profiler)
+    if denied:
+        return denied
+    return web.json_response(profiler.stop())
+
+
+@routes.get('/profile/result')
+async def profile_result(request):
+    """Descarga el último perfil: ?format=collapsed (muestreo) o pstats (cProfile)"""
+    profiler = request.app['profiler']
+    denied = profiling_denied(request, profiler)
+    if denied:
+        return denied
+
+    formats = profiler.formats()
+    fmt = request.query.get('format') or (formats[0] if formats else None)
+    if fmt not in formats:
+        return web.json_response({'error': f'No hay resultado en formato {fmt}', 'formats': formats}, status=404)
+
+    name = time.strftime('profile-%Y%m%d-%H%M%S', time.localtime(profiler.started_at))
+    if fmt == 'pstats':
+        body, content_type, name = profiler.pstats_bytes(), 'application/octet-stream', f'{name}.pstats'
+    else:
+        body, content_type, name = profiler.collapsed().encode(), 'text/plain', f'{name}.collapsed'
+    return web.Response(body=body, content_type=content_type,
+                        headers={'Content-Disposition': f'attachment; filename="{name}"'})
+
+
+@routes.post('/tracemalloc/snapshot')
+async def tracemalloc_snapshot(request):
+    """Toma un snapshot de tracemalloc (el primero activa el trazado de memoria)"""
+    allocations = request.app['allocations']
+    denied = profiling_denied(request, allocations)
+    if denied:
+        return denied
+    snapshot = await asyncio.get_running_loop().run_in_executor(None, allocations.snapshot)
+    return web.json_response(snapshot)
+
+
+@routes.get('/tracemalloc/diff')
+async def tracemalloc_diff(request):
+    """Qué ha crecido entre dos snapshots: ?from=1&to=2&key_type=lineno|filename|traceback&limit=20"""
+    allocations = request.app['allocations']
+    denied = profiling_denied(request, allocations)
+    if denied:
+        return denied
+
+    query = request.query
+    try:
+        diff = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: allocations.diff(
+                int(query['from']) if 'from' in query else None,
+                int(query['to']) if 'to' in query else None,
+                key_type=query.get('key_type', 'lineno'),
+                limit=int(query.get('limit', 20)),
+            ))
+    except KeyError as e:
+        return web.json_response({'error': e.args[0]}, status=404)
+    except ValueError as e:
+        return web.json_response({'error': str(e)}, status=400)
+    return web.json_response(diff)
+
+
+@routes.post('/tracemalloc/stop')
+async def tracemalloc_stop(request):
+    """Deja de trazar memoria y descarta los snapshots"""
+    allocations = request.app['allocations']
+    denied = profiling_denied(request, allocations)
+    if denied:
+        return denied
+    allocations.stop()
+    return web.json_response({'status': 'ok'})
+
+
+@routes.get('/sessions')
+async def list_sessions(request):
+    """Lista las sesiones activas"""
+    return web.json_response({'sessions': request.app['sessions'].list()})
+
+
+@routes.get('/sessions/{serial}')
+async def session_status(request):
+    """Estado de una sesión"""
+    session = request.app['sessions'].get(request.match_info['serial'])
+    if session is None:
+        return web.json_response({'error': 'Sesión no encontrada'}, status=404)
+    return web.json_response(session.status())
+
+
+@routes.post('/stop')
+async def stop_dance(request):
+    """Detiene una sesión ({"serial": ...}) o todas ({"all": true})"""
+    sessions = request.app['sessions']
+    try:
+        data = await read_json(request)
+        if data.get('all') is True:
+            await sessions.stop_all()
+            return web.json_response({'status': 'ok'})
+        if 'serial' not in data:
+            raise SessionError('Indica "serial" o "all": true')
+        session = await sessions.stop(data['serial'])
+    except SessionError as e:
+        return web.json_response({'error': str(e)}, status=e.status)
+    return web.json_response({'status': 'ok', 'session': session.status()})
+
+
+def device_name(device):
+    if device.get('replay'):
+        return 'Replay'
+    if device.get('simulated') is not None:
+        return 'Simulado'
+    return WIIMOTE_NAMES.get(device['product_id'], 'Wii Remote')
+
+
+def joycon_list(sessions):
+    """Wiimotes conectados con el estado de su sesión, en el formato de app.js"""
+    joycons = []
+    for device in sessions.devices.list():
+        session = sessions.get(device['serial'])
+        item = {
+            'serial': device['serial'],
+            'name': device_name(device),
+            'is_left': False,
+            'color': '#FFFFFF',
+            'state': PairingState.IDLE.value,
+            'battery_level': None,
+        }
+        if session is not None:
+            item.update(session.push_state())
+        joycons.append(item)
+    return joycons
+
+
+async def handle_ws_command(request, client, cmd, data):
+    sessions = request.app['sessions']
+
+    if cmd == 'get_joycon_list':
+        loop = asyncio.get_running_loop()
+        joycons = await loop.run_in_executor(None, joycon_list, sessions)
+        await client.send(cmd, joycons)
+
+    elif cmd == 'connect_joycon':
+        if data.get('pairing_method') == 'old':
+            protocol_version = WsSubprotocolVersion.V1
+            pairing_code = None
+            pairing_id = data.get('console_ip_addr')
+        else:
+            protocol_version = WsSubprotocolVersion.V2
+            pairing_code = data.get('pairing_code')
+            pairing_id = None
+
+        try:
+            await sessions.start_wiimote(
+                protocol_version,
+                pairing_code=pairing_code,
+                pairing_id=pairing_id,
+                serial=data.get('joycon_serial'),
+            )
+        except SessionError as e:
+            log.error('Error: %s', e)
+            client.queue(data.get('joycon_serial'), {'state': PairingState.ERROR_JOYCON.value})
+
+    elif cmd == 'disconnect_joycon':
+        try:
+            await sessions.stop(data.get('joycon_serial'))
+        except SessionError:
+            pass
+
+
+@routes.get('/ws')
+async def websocket_handler(request):
+    """Canal push para la interfaz: estados de sesión y órdenes del navegador"""
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+
+    broadcaster = request.app['broadcaster']
+    client = PushClient(ws, broadcaster)
+    broadcaster.clients.add(client)
+    sender = asyncio.create_task(client.run())
+
+    try:
+        async for msg in ws:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                continue
+            try:
+                payload = json.loads(msg.data)
+                await handle_ws_command(request, client, payload.get('cmd'), payload.get('data') or {})
+            except Exception as e:
+                log.error('Error en /ws: %s: %s', type(e).__name__, e)
+    finally:
+        broadcaster.clients.discard(client)
+        sender.cancel()
+
+    return ws
+
+
+def get_local_ip():
+    """Obtiene la IP local de la PC"""
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.connect(('8.8.8.8', 80))
+        ip = s.getsockname()[0]
+        s.close()
+        return ip
+    except:
+        return '127.0.0.1'
+
+
+def print_stall(report):
+    where = report['stack'][-1].strip() if report['stack'] else '?'
+    logging.getLogger('dance.watchdog').warning(
+        '[Watchdog] Event loop bloqueado %s ms (tarea %s): %s', report['duration_ms'], report['task'], where)
+
+
+async def prewarm(devices):
+    """Precalienta en segundo plano lo que paga el primer /start"""
+    loop = asyncio.get_running_loop()
+    started_at = time.perf_counter()
+
+    async def timed(name, coro):
+        t = time.perf_counter()
+        try:
+            await coro
+            timing_log.info('  [Precalentado] %s: %.0f ms', name, (time.perf_counter() - t) * 1000)
+        except Exception as e:
+            timing_log.warning('  [Precalentado] %s: %s: %s', name, type(e).__name__, e)
+
+    await asyncio.gather(
+        timed('websockets', loop.run_in_executor(None, importlib.import_module, 'websockets')),
+        timed('contexto SSL', loop.run_in_executor(None, get_default_ssl_context)),
+        timed('HID', loop.run_in_executor(None, devices.list)),
+        *(timed(f'DNS {host}', loop.getaddrinfo(host, 443, type=socket.SOCK_STREAM)) for host in PAIRING_HOSTS),
+    )
+    timing_log.info('[Tiempo] Precalentado completo en %.0f ms', (time.perf_counter() - started_at) * 1000)
+
+
+async def pair_from_config(args, devices):
+    """Empareja a la vez todos los mandos de un fichero de configuración, sin servidor web.
+
+    El token de Ubisoft, la consulta de cada código de emparejamiento, la IP
+    local y la lista de dispositivos se obtienen una sola vez para todos.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        remotes = load_pairing_config(args.pair)
+    except (OSError, ValueError) as e:
+        log.error('Error en la configuración de --pair: %s', e)
+        return
+    shared = SharedPairing()
+    timeline = PairingTimeline()
+    finished = asyncio.Event()
+    pending = {remote['serial'] for remote in remotes}
+
+    def on_session_changed(session):
+        state = session.state
+        if state is None:
+            return
+        elapsed = timeline.record(session.serial, state.name)
+        pairing_log.info('  [Emparejando] %s: %s (+%.2f s)', session.serial, state.name, elapsed)
+        if state == PairingState.CONNECTED or state == PairingState.DISCONNECTED or state.value > 100:
+            pending.discard(session.serial)
+            if not pending:
+                finished.set()
+
+    sessions = SessionManager(on_session_changed=on_session_changed, devices=devices)
+    available = {device['serial']: device for device in await loop.run_in_executor(None, devices.list)}
+    missing = [remote['serial'] for remote in remotes if remote['serial'] not in available]
+    if missing:
+        log.warning('Wiimotes no encontrados: %s', ', '.join(missing))
+        remotes = [remote for remote in remotes if remote['serial'] not in missing]
+        pending.difference_update(missing)
+    if not remotes:
+        return
+
+    host_ip_addr = get_local_ip()
+    wiimotes = await asyncio.gather(
+        *(loop.run_in_executor(None, devices.open, available[remote['serial']]) for remote in remotes),
+        return_exceptions=True)
+
+    pairing_log.info('Emparejando %s mandos...', len(remotes))
+    for remote, wiimote in zip(remotes, wiimotes):
+        serial = remote['serial']
+        if isinstance(wiimote, Exception):
+            log.error('Error al conectar Wiimote %s: %s', serial, wiimote)
+            pending.discard(serial)
+            continue
+        fast = remote['pairing_method'] == 'fast'
+        dancer = JoyDance(
+            wiimote,
+            protocol_version=remote['protocol_version'],
+            pairing_code=None if fast else remote['pairing_code'],
+            host_ip_addr=remote['host_ip_addr'] or host_ip_addr,
+            console_ip_addr=remote['console_ip_addr'] if fast else None,
+            shared=shared,
+        )
+        sessions.add(serial, dancer, dancer.pair())
+
+    try:
+        if pending:
+            await finished.wait()
+
+        summary = timeline.summary()
+        connected = sum(1 for session in sessions if session.state == PairingState.CONNECTED)
+        timing_log.info('[Tiempo] %s de %s mandos emparejados en %.2f s', connected, len(remotes), summary['total_s'])
+        for serial, durations in summary['remotes'].items():
+            phases = '  '.join(f'{phase} {seconds:.2f} s' for phase, seconds in durations.items())
+            timing_log.info('  %s: %s', serial, phases)
+        print(f'\nPresiona Ctrl+C para detener\n')
+        await asyncio.Event().wait()
+    finally:
+        await sessions.stop_all()
+        await close_http_session()
+
+
+async def main(args):
+    print('=== Wiimote Just Dance Server ===')
+    
+    local_ip = get_local_ip()
+    port = args.port
+    
+    app = web.Application()
+    app['started_at'] = args.started_at
+    app['first_page_served'] = False
+    app['broadcaster'] = StateBroadcaster()
+    app['watchdog'] = None
+    app['profiler'] = Profiler() if args.profiling else None
+    app['allocations'] = AllocationTracker() if args.profiling else None
+    app['profiling_token'] = args.profiling_token
+    devices = DeviceCatalog(args.replay, replay_realtime=not args.replay_fast, capture_dir=args.capture_dir,
+                            simulated=args.simulate, simulated_rate_hz=args.simulate_rate,
+                            hidraw=args.hidraw)
+    if args.pair:
+        await pair_from_config(args, devices)
+        return
+    if args.watchdog_ms:
+        app['watchdog'] = LoopWatchdog(threshold=args.watchdog_ms / 1000, on_report=print_stall)
+        app['watchdog'].start()
+    if args.workers:
+        from workers import WorkerSessionManager
+        app['sessions'] = WorkerSessionManager(
+            args.workers,
+            sessions_per_worker=args.sessions_per_worker,
+            watchdog_ms=args.watchdog_ms,
+            on_session_changed=app['broadcaster'].publish_session,
+            devices=devices,
+            log_options=args.log_options,
+        )
+        app['sessions'].start()
+    else:
+        app['sessions'] = SessionManager(on_session_changed=app['broadcaster'].publish_session, devices=devices)
+    app['static'] = StaticCache().build()
+    app.add_routes(routes)
+    # Debe ir al final para no tapar el resto de rutas GET
+    app.router.add_get('/{path:.+}', static_file)
+    stats_task = asyncio.create_task(app['broadcaster'].poll_stats(app['sessions']))
+    
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '0.0.0.0', port)
+    await site.start()
+    timing_log.info('[Tiempo] Escuchando en el puerto %s a los %.2f s del arranque', port, time.perf_counter() - args.started_at)
+
+    prewarm_task = None
+    if not args.no_prewarm:
+        prewarm_task = asyncio.create_task(prewarm(devices))
+    
+    print(f'\nServidor iniciado')
+    print(f'  Abre en tu navegador: http://{local_ip}:{port}')
+    print(f'  O usa: http://localhost:{port}')
+    print(f'\nPresiona Ctrl+C para detener\n')
+    
+    try:
+        await asyncio.Event().wait()
+    except KeyboardInterrupt:
+        print('\n\nDeteniendo servidor...')
+    finally:
+        stats_task.cancel()
+        if prewarm_task:
+            prewarm_task.cancel()
+        if app['watchdog']:
+            app['watchdog'].stop()
+        if app['profiler']:
+            app['profiler'].stop()
+            app['allocations'].stop()
+        if args.workers:
+            await app['sessions'].shutdown()
+        else:
+            await app['sessions'].stop_all()
+        await close_http_session()
+        await runner.cleanup()
+
+
+def run(started_at=None):
+    parser = argparse.ArgumentParser(description='Wiimote Just Dance Server')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Número de procesos worker para las sesiones (0 = todo en este proceso)')
+    parser.add_argument('--sessions-per-worker', type=int, default=1,
+                        help='Sesiones máximas por worker')
+    parser.add_argument('--no-prewarm', action='store_true',
+                        help='No precalentar SSL, DNS y HID al arrancar')
+    parser.add_argument('--watchdog-ms', type=float, default=0,
+                        help='Reportar bloqueos del event loop de más de N ms (0 = desactivado)')
+    parser.add_argument('--capture-dir',
+                        help='Grabar los reportes HID de cada Wiimote en este directorio')
+    parser.add_argument('--replay', nargs='+', default=[], metavar='FILE',
+                        help='Ofrecer capturas .wmcap como mandos virtuales')
+    parser.add_argument('--replay-fast', action='store_true',
+                        help='Reproducir las capturas lo más rápido posible en lugar de a tiempo real')
+    parser.add_argument('--simulate', type=int, default=0, metavar='N',
+                        help='Ofrecer N Wiimotes simulados (sim-0, sim-1, ...)')
+    parser.add_argument('--simulate-rate', type=float, default=200,
+                        help='Reportes por segundo de cada Wiimote simulado')
+    parser.add_argument('--hidraw', action='store_true',
+                        help='Leer los Wiimotes de /dev/hidrawN directamente en lugar de con hidapi (Linux)')
+    parser.add_argument('--pair', metavar='CONFIG',
+                        help='Emparejar a la vez los mandos de este fichero, sin servidor web')
+    parser.add_argument('--profiling', action='store_true',
+                        help='Activar /profile y /tracemalloc (con --workers solo perfilan el proceso principal)')
+    parser.add_argument('--profiling-token', metavar='TOKEN',
+                        help='Permitir /profile y /tracemalloc desde otras máquinas con Authorization: Bearer TOKEN '
+                             '(sin él, solo desde localhost)')
+    parser.add_argument('--log-level', default='INFO', metavar='NIVELES',
+                        help='Nivel general y por categoría, p. ej. INFO,dance.command=WARNING,dance.pairing=DEBUG')
+    parser.add_argument('--log-file',
+                        help='Escribir también los logs como JSON lines en este fichero (rota a los 10 MB)')
+    parser.add_argument('--no-uvloop', action='store_true',
+                        help='Usar el event loop de asyncio aunque uvloop esté instalado')
+    args = parser.parse_args()
+    args.started_at = started_at if started_at is not None else time.perf_counter()
+    args.log_options = {'levels': parse_levels(args.log_level), 'file': args.log_file}
+    setup_logging(**args.log_options)
+
+    if not args.no_uvloop:
+        try:
+            import uvloop
+            uvloop.install()
+            print('Usando uvloop')
+        except ImportError:
+            pass
+
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        print('Servidor detenido')
+
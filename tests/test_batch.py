@@ -0,0 +1,125 @@
+import asyncio
+import socket
+from types import SimpleNamespace
+
+import pytest
+
+from joydance import JoyDance, PairingState
+from joydance.batch import PairingTimeline, SharedPairing, load_pairing_config
+from joydance.constants import WsSubprotocolVersion
+
+
+def test_shared_pairing_runs_each_lookup_once():
+    calls = []
+
+    async def lookup():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'ticket'
+
+    async def scenario():
+        shared = SharedPairing()
+        return await asyncio.gather(*(shared.once('token', lookup) for _ in range(3)))
+
+    assert asyncio.run(scenario()) == ['ticket'] * 3
+    assert calls == [1]
+
+
+def test_shared_pairing_retries_failed_lookups():
+    calls = []
+
+    async def lookup():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionError('sin red')
+        return 'ticket'
+
+    async def scenario():
+        shared = SharedPairing()
+        with pytest.raises(ConnectionError):
+            await shared.once('token', lookup)
+        assert await shared.once('token', lookup) == 'ticket'
+        assert await shared.once('token', lookup) == 'ticket'
+
+    asyncio.run(scenario())
+    assert calls == [1, 1]
+
+
+def test_load_pairing_config(tmp_path):
+    path = tmp_path / 'pair.cfg'
+    path.write_text('[joydance]\npairing_code = 0123\n\n'
+                    '[remote 00:1f:32:aa:bb:cc]\n\n'
+                    '[remote sim-1]\npairing_method = fast\nconsole_ip_addr = 192.168.1.20\n')
+
+    first, second = load_pairing_config(str(path))
+    assert first['serial'] == '00:1f:32:aa:bb:cc'
+    assert first['pairing_code'] == '0123'
+    assert first['protocol_version'] == WsSubprotocolVersion.V2
+    assert second['pairing_method'] == 'fast'
+    assert second['console_ip_addr'] == '192.168.1.20'
+
+
+@pytest.mark.parametrize('text', [
+    'no es un ini',
+    '[joydance]\npairing_code = 0123\n',
+    '[remote a]\npairing_method = other\n',
+    '[remote a]\n',
+    '[remote a]\npairing_method = fast\n',
+    '[remote a]\npairing_code = 1\nprotocol = v9\n',
+])
+def test_invalid_pairing_config(tmp_path, text):
+    path = tmp_path / 'pair.cfg'
+    path.write_text(text)
+    with pytest.raises(ValueError):
+        load_pairing_config(str(path))
+
+
+def test_missing_pairing_config(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        load_pairing_config(str(tmp_path / 'missing.cfg'))
+
+
+def test_pairing_timeline():
+    timeline = PairingTimeline()
+    timeline._changes['a'] = [('GETTING_TOKEN', 0.0), ('PAIRING', 0.5), ('CONNECTING', 1.0), ('CONNECTED', 1.25)]
+    assert timeline.durations('a') == {'GETTING_TOKEN': 0.5, 'PAIRING': 0.5, 'CONNECTING': 0.25}
+    assert timeline.summary()['total_s'] == 1.25
+
+
+def make_dancer():
+    states = []
+
+    async def on_state_changed(serial, state):
+        states.append(state)
+
+    joycon = SimpleNamespace(serial='sim-0')
+    return JoyDance(joycon, WsSubprotocolVersion.V1, on_state_changed=on_state_changed), states
+
+
+def test_hole_punching_accepts_on_the_loop():
+    async def scenario():
+        dancer, states = make_dancer()
+        punching = asyncio.create_task(dancer.hole_punching())
+        await asyncio.sleep(0.05)
+        console = socket.create_connection(('127.0.0.1', dancer.host_port))
+        try:
+            await asyncio.wait_for(punching, 2)
+            assert dancer.console_conn.getpeername() == console.getsockname()
+        finally:
+            console.close()
+            dancer.console_conn.close()
+        return states
+
+    assert asyncio.run(scenario()) == []
+
+
+def test_hole_punching_times_out(monkeypatch):
+    monkeypatch.setattr('joydance.HOLE_PUNCHING_TIMEOUT', 0.05)
+
+    async def scenario():
+        dancer, states = make_dancer()
+        with pytest.raises(asyncio.TimeoutError):
+            await dancer.hole_punching()
+        return states
+
+    assert asyncio.run(scenario()) == [PairingState.ERROR_HOLE_PUNCHING]
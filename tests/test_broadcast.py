@@ -0,0 +1,83 @@
+import asyncio
+
+from joydance import PairingState
+from server import PushClient, StateBroadcaster
+
+
+class FakeWebSocket:
+    def __init__(self, fail_after=None):
+        self.sent = []
+        self.closed = False
+        self.fail_after = fail_after
+
+    async def send_json(self, data):
+        if self.fail_after is not None and len(self.sent) >= self.fail_after:
+            raise ConnectionResetError('Cannot write to closing transport')
+        self.sent.append(data)
+
+    async def close(self):
+        self.closed = True
+
+
+class RecordingClient:
+    def __init__(self):
+        self.queued = []
+
+    def queue(self, serial, diff):
+        self.queued.append((serial, diff))
+
+
+def test_publish_sends_only_changes():
+    broadcaster = StateBroadcaster()
+    client = RecordingClient()
+    broadcaster.clients.add(client)
+
+    broadcaster.publish('sim-0', {'state': PairingState.PAIRING.value, 'battery_level': 4})
+    broadcaster.publish('sim-0', {'state': PairingState.PAIRING.value, 'battery_level': 4})
+    broadcaster.publish('sim-0', {'state': PairingState.CONNECTED.value, 'battery_level': 4})
+    assert client.queued == [
+        ('sim-0', {'state': PairingState.PAIRING.value, 'battery_level': 4}),
+        ('sim-0', {'state': PairingState.CONNECTED.value}),
+    ]
+
+
+def test_disconnected_sessions_are_forgotten():
+    broadcaster = StateBroadcaster()
+    broadcaster.publish('sim-0', {'state': PairingState.CONNECTED.value})
+    broadcaster.publish('sim-0', {'state': PairingState.DISCONNECTED.value})
+    assert broadcaster._last == {}
+
+
+def test_push_client_coalesces_changes():
+    async def scenario():
+        ws = FakeWebSocket()
+        client = PushClient(ws)
+        client.queue('sim-0', {'state': 1})
+        client.queue('sim-0', {'state': 2, 'battery_level': 3})
+        task = asyncio.create_task(client.run())
+        await asyncio.sleep(0.01)
+        ws.closed = True
+        client.wakeup.set()
+        await asyncio.wait_for(task, 1)
+        return ws.sent
+
+    assert asyncio.run(scenario()) == [
+        {'cmd': 'resp_update_joycon_state', 'data': {'serial': 'sim-0', 'state': 2, 'battery_level': 3}},
+    ]
+
+
+def test_push_client_leaves_the_broadcaster_when_send_fails():
+    async def scenario():
+        broadcaster = StateBroadcaster()
+        ws = FakeWebSocket(fail_after=0)
+        client = PushClient(ws, broadcaster)
+        broadcaster.clients.add(client)
+        task = asyncio.create_task(client.run())
+
+        broadcaster.publish('sim-0', {'state': PairingState.PAIRING.value})
+        await asyncio.wait_for(task, 1)
+        return broadcaster, ws
+
+    broadcaster, ws = asyncio.run(scenario())
+    assert broadcaster.clients == set()
+    assert ws.closed
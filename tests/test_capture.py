@@ -0,0 +1,128 @@
+import time
+
+import pytest
+
+from pycon.capture import HEADER, CaptureReader, CaptureWriter, ReplayDevice
+from pycon.replay import ReplayWiimote
+from pycon.simulate import SimulatedWiimote
+
+REPORTS = [
+    (100.0, bytes([0x31, 0x00, 0x08, 0x80, 0x82, 0x9A])),
+    (100.005, bytes([0x30, 0x00, 0x10])),
+    (100.0125, bytes([0x20, 0, 0, 0, 0, 0, 0xC8])),
+]
+
+
+def write_capture(path, reports=REPORTS):
+    writer = CaptureWriter(str(path), product_id=0x0306)
+    for captured_at, data in reports:
+        writer.write(captured_at, data)
+    writer.close()
+    return path
+
+
+def test_round_trip(tmp_path):
+    path = write_capture(tmp_path / 'a.wmcap')
+    reader = CaptureReader(str(path))
+    try:
+        assert reader.product_id == 0x0306
+        assert reader.report_size == 22
+        assert len(reader) == 3
+        assert [data for _, data in reader] == [data for _, data in REPORTS]
+        assert [offset for offset, _ in reader] == pytest.approx([0, 0.005, 0.0125])
+        assert reader[-1] == reader[2]
+        assert reader.duration == pytest.approx(0.0125)
+        with pytest.raises(IndexError):
+            reader[3]
+    finally:
+        reader.close()
+
+
+def test_reports_longer_than_the_record_are_cut(tmp_path):
+    path = write_capture(tmp_path / 'a.wmcap', [(0.0, bytes(range(30)))])
+    reader = CaptureReader(str(path))
+    try:
+        assert reader[0][1] == bytes(range(22))
+    finally:
+        reader.close()
+
+
+def test_truncated_record_is_ignored(tmp_path):
+    path = write_capture(tmp_path / 'a.wmcap')
+    with open(path, 'r+b') as f:
+        f.truncate(path.stat().st_size - 5)
+    reader = CaptureReader(str(path))
+    try:
+        assert len(reader) == 2
+    finally:
+        reader.close()
+
+
+@pytest.mark.parametrize('content', [b'', b'WMC', b'NOPE' + bytes(HEADER.size)])
+def test_invalid_capture(tmp_path, content):
+    path = tmp_path / 'bad.wmcap'
+    path.write_bytes(content)
+    with pytest.raises(ValueError):
+        CaptureReader(str(path))
+
+
+def test_replay_device_loops_and_stops(tmp_path):
+    path = write_capture(tmp_path / 'a.wmcap')
+
+    device = ReplayDevice(CaptureReader(str(path)), realtime=False)
+    assert [bytes(device.read(22)) for _ in range(3)] == [data for _, data in REPORTS]
+    assert device.read(22) == []
+    assert device.finished
+    device.close()
+
+    device = ReplayDevice(CaptureReader(str(path)), realtime=False, loop=True)
+    assert [bytes(device.read(22)) for _ in range(4)][3] == REPORTS[0][1]
+    device.close()
+
+
+def test_replay_device_keeps_the_original_timing(tmp_path):
+    path = write_capture(tmp_path / 'a.wmcap')
+    device = ReplayDevice(CaptureReader(str(path)), realtime=True)
+    try:
+        started_at = time.monotonic()
+        for _ in range(3):
+            device.read(22, 1000)
+        assert time.monotonic() - started_at >= 0.012
+        # El reporte siguiente no existe: read() agota el timeout
+        assert device.read(22, 10) == []
+    finally:
+        device.close()
+
+
+def test_replay_wiimote(tmp_path):
+    path = write_capture(tmp_path / 'a.wmcap')
+    wiimote = ReplayWiimote(str(path), realtime=False, serial='replay-a')
+    try:
+        deadline = time.monotonic() + 2
+        while wiimote.reports_received < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert wiimote.reports_received == 3
+        assert wiimote.get_accel() == (0x80, 0x82, 0x9A)
+        assert wiimote.battery_level == 4
+    finally:
+        wiimote.close()
+
+
+def test_wiimote_records_what_it_reads(tmp_path):
+    path = tmp_path / 'sim.wmcap'
+    wiimote = SimulatedWiimote('sim-0', rate_hz=200, capture_path=str(path))
+    try:
+        deadline = time.monotonic() + 2
+        while wiimote.reports_received < 20 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        wiimote.close()
+
+    reader = CaptureReader(str(path))
+    try:
+        assert len(reader) == wiimote.reports_received
+        assert all(data[0] == 0x31 and len(data) == 6 for _, data in reader)
+        offsets = [offset for offset, _ in reader]
+        assert offsets == sorted(offsets)
+    finally:
+        reader.close()
@@ -0,0 +1,136 @@
+import asyncio
+import socket
+import time
+from types import SimpleNamespace
+
+import aiohttp
+
+import server
+from joydance.constants import WsSubprotocolVersion
+
+
+class FakeResponse:
+    def __init__(self, status):
+        self.status = status
+
+    async def text(self):
+        return 'ok'
+
+
+class FakeRequest:
+    def __init__(self, behaviour, cancelled, endpoint):
+        self.behaviour = behaviour
+        self.cancelled = cancelled
+        self.endpoint = endpoint
+
+    async def __aenter__(self):
+        kind, delay = self.behaviour
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(self.endpoint)
+            raise
+        if kind == 'timeout':
+            raise asyncio.TimeoutError()
+        if kind == 'refused':
+            raise aiohttp.ClientConnectionError('Connection refused')
+        return FakeResponse(kind)
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class FakeHttpSession:
+    """Cada path responde con (status o error, segundos de espera)"""
+
+    def __init__(self, behaviours):
+        self.behaviours = behaviours
+        self.cancelled = []
+
+    def get(self, url, timeout=None):
+        path = '/' + url.split('/', 3)[3]
+        return FakeRequest(self.behaviours[path], self.cancelled, url)
+
+
+def make_dancer():
+    return server.WiimoteDance(SimpleNamespace(serial='discovery'), WsSubprotocolVersion.V1, pairing_id='127.0.0.1')
+
+
+def discover(monkeypatch, behaviours):
+    session = FakeHttpSession(behaviours)
+    monkeypatch.setattr(server, 'get_http_session', lambda: session)
+
+    async def scenario():
+        started_at = time.monotonic()
+        endpoint = await make_dancer().http_discovery('192.168.1.20')
+        elapsed = time.monotonic() - started_at
+        # Deja que las tareas canceladas terminen
+        await asyncio.sleep(0)
+        return endpoint, elapsed
+
+    endpoint, elapsed = asyncio.run(scenario())
+    return endpoint, elapsed, session.cancelled
+
+
+def test_first_answer_wins_and_cancels_the_other_probes(monkeypatch):
+    endpoint, elapsed, cancelled = discover(monkeypatch, {
+        '/': (404, 0.01),
+        '/discovery': (200, 0.05),
+        '/connect': (200, 5),
+        '/api': ('timeout', 5),
+    })
+    assert endpoint == 'http://192.168.1.20:8080/discovery'
+    assert elapsed < 1
+    assert sorted(cancelled) == ['http://192.168.1.20:8080/api', 'http://192.168.1.20:8080/connect']
+
+
+def test_no_endpoint_when_every_probe_fails(monkeypatch):
+    endpoint, _, cancelled = discover(monkeypatch, {
+        '/': (404, 0.01),
+        '/discovery': ('refused', 0),
+        '/connect': ('timeout', 0.02),
+        '/api': (500, 0.03),
+    })
+    assert endpoint is None
+    assert cancelled == []
+
+
+def test_udp_discovery_does_not_block_the_loop(monkeypatch):
+    console = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    console.bind(('127.0.0.1', 0))
+    monkeypatch.setattr(server, 'UDP_DISCOVERY_PORT', console.getsockname()[1])
+    monkeypatch.setattr(server, 'UDP_DISCOVERY_TIMEOUT', 0.05)
+
+    async def ticker(ticks):
+        while True:
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    async def scenario(answer):
+        ticks = []
+        task = asyncio.create_task(ticker(ticks))
+        if answer:
+            loop = asyncio.get_running_loop()
+
+            async def reply():
+                data, addr = await loop.run_in_executor(None, console.recvfrom, 1024)
+                console.sendto(b'JD', addr)
+                return data
+
+            replied = asyncio.ensure_future(reply())
+        found = await make_dancer().udp_discovery('127.0.0.1')
+        task.cancel()
+        if answer:
+            assert await replied == b'DISCOVER'
+        return found, ticks
+
+    try:
+        found, _ = asyncio.run(scenario(answer=True))
+        assert found
+
+        # Sin respuesta se espera UDP_DISCOVERY_TIMEOUT por mensaje, con el loop libre
+        found, ticks = asyncio.run(scenario(answer=False))
+        assert not found
+        assert len(ticks) >= 10
+    finally:
+        console.close()
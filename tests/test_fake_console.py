@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+from joydance import JoyDance, PairingState
+from joydance.constants import WS_SUBPROTOCOLS, WsSubprotocolVersion
+from joydance.fake_console import FakeConsole
+from pycon.simulate import SimulatedWiimote
+
+TIMEOUT = 5  # s
+
+
+async def wait_for(condition, timeout=TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        await asyncio.sleep(0.02)
+
+
+def test_simulated_controller_pairs_and_streams():
+    states = []
+
+    async def on_state_changed(serial, state):
+        states.append((serial, state))
+
+    async def scenario():
+        console = await FakeConsole().start()
+        wiimote = SimulatedWiimote('console-test', rate_hz=200, seed=0)
+        dancer = JoyDance(wiimote, WsSubprotocolVersion.V1, on_state_changed=on_state_changed)
+        dancer.pairing_url = console.url
+        task = asyncio.create_task(dancer.connect_ws())
+        try:
+            await wait_for(lambda: ('console-test', PairingState.CONNECTED) in states)
+            # auto_enable_accel: la consola pide el acelerómetro en cuanto acaba el handshake
+            await wait_for(lambda: console.phones[1].samples >= 20)
+        finally:
+            await dancer.disconnect()
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await console.stop()
+        return console.phones
+
+    phones = asyncio.run(scenario())
+    assert list(phones) == [1]
+    record = phones[1]
+    assert record.subprotocol == WS_SUBPROTOCOLS[WsSubprotocolVersion.V1.value]
+    assert record.hello is not None
+    assert record.paired_at is not None
+    summary = record.summary(freq_hz=200)
+    assert summary['handshake_ms'] is not None
+    assert summary['frames'] > 0
+    assert summary['timestamp_gaps'] == 0
@@ -0,0 +1,166 @@
+import errno
+import socket
+import time
+
+import pytest
+
+import server
+from pycon.event import ButtonEventWiimote
+from pycon.hidraw import HidrawDevice, list_hidraw_wiimotes
+
+# hidraw entrega cada reporte con su tamaño real: 0x31 son 6 bytes
+REPORT = bytes([0x31, 0x00, 0x08, 0x80, 0x82, 0x9A])
+
+
+def make_node():
+    """Un socketpair SEQPACKET hace de /dev/hidrawN: cada send() es un reporte"""
+    node, remote = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    return HidrawDevice(fd=node.detach()), remote
+
+
+def write_uevent(root, name, hid_id, uniq=''):
+    device = root / name / 'device'
+    device.mkdir(parents=True)
+    (device / 'uevent').write_text(f'DRIVER=wiimote\nHID_ID={hid_id}\nHID_UNIQ={uniq}\n')
+
+
+def test_list_hidraw_wiimotes(tmp_path):
+    write_uevent(tmp_path, 'hidraw0', '0005:0000057E:00000306', '00:1f:32:aa:bb:cc')
+    write_uevent(tmp_path, 'hidraw1', '0003:0000046D:0000C52B')
+    write_uevent(tmp_path, 'hidraw2', '0005:0000057E:00000330')
+    (tmp_path / 'hidraw3').mkdir()  # sin uevent
+
+    # 0x0330 no es un Wiimote; 0x0306 sí
+    assert list_hidraw_wiimotes(str(tmp_path), '/dev') == [{
+        'serial': '00:1f:32:aa:bb:cc',
+        'vendor_id': 0x057E,
+        'product_id': 0x0306,
+        'path': '/dev/hidraw0',
+    }]
+
+
+def test_list_hidraw_wiimotes_without_sysfs(tmp_path):
+    assert list_hidraw_wiimotes(str(tmp_path / 'missing')) == []
+
+
+def test_read_reuses_buffer():
+    device, remote = make_node()
+    try:
+        remote.send(REPORT)
+        remote.send(bytes([0x30, 0, 0x01]))
+
+        first = device.read(22, 100)
+        assert bytes(first) == REPORT
+        second = device.read(22, 100)
+        assert bytes(second) == bytes([0x30, 0, 0x01])
+        assert first.obj is second.obj
+    finally:
+        device.close()
+        remote.close()
+
+
+def test_read_timeout_returns_empty():
+    device, remote = make_node()
+    try:
+        started_at = time.monotonic()
+        assert device.read(22, 50) == []
+        assert time.monotonic() - started_at >= 0.04
+    finally:
+        device.close()
+        remote.close()
+
+
+def test_read_after_disconnect_raises_enodev():
+    device, remote = make_node()
+    remote.close()
+    try:
+        with pytest.raises(OSError) as error:
+            device.read(22, 100)
+        assert error.value.errno == errno.ENODEV
+    finally:
+        device.close()
+
+
+def test_write_and_close():
+    device, remote = make_node()
+    try:
+        device.write([0x15, 0x00])
+        assert remote.recv(64) == bytes([0x15, 0x00])
+        device.close()
+        device.close()
+        with pytest.raises(OSError):
+            device.read(22, 0)
+    finally:
+        remote.close()
+
+
+def wait_for_reports(wiimote, count):
+    deadline = time.monotonic() + 2
+    while wiimote.reports_received < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert wiimote.reports_received == count
+
+
+def test_wiimote_over_hidraw():
+    device, remote = make_node()
+    wiimote = ButtonEventWiimote(serial='hidraw-test', device=device)
+    try:
+        # El Wiimote fija el modo de reporte al abrirse
+        assert remote.recv(64) == bytes([0x12, 0x04, 0x31])
+
+        remote.send(REPORT)
+        wait_for_reports(wiimote, 1)
+        assert wiimote.get_accel() == (0x80, 0x82, 0x9A)
+        assert wiimote.get_button_a()
+
+        remote.send(bytes([0x30, 0x10, 0x00]))
+        wait_for_reports(wiimote, 2)
+        assert wiimote.get_button_plus() and not wiimote.get_button_a()
+        assert wiimote.get_accel() == (0x80, 0x82, 0x9A)
+        assert wiimote.drain_accels()[0][1] == (0x80, 0x82, 0x9A)
+    finally:
+        wiimote.close()
+        remote.close()
+
+
+def test_short_reports_are_counted_and_skipped():
+    device, remote = make_node()
+    wiimote = ButtonEventWiimote(serial='hidraw-short', device=device)
+    try:
+        remote.recv(64)
+        remote.send(REPORT[:4])
+        remote.send(bytes([0x30]))
+        wait_for_reports(wiimote, 2)
+        assert wiimote._read_errors.value == 2
+        assert wiimote.get_accel() == (0, 0, 0)
+
+        # El hilo lector sigue vivo
+        remote.send(REPORT)
+        wait_for_reports(wiimote, 3)
+        assert wiimote.get_accel() == (0x80, 0x82, 0x9A)
+        assert wiimote._read_errors.value == 2
+    finally:
+        wiimote.close()
+        remote.close()
+
+
+def test_device_catalog_closes_hidraw_when_open_fails(monkeypatch):
+    closed = []
+
+    class FakeHidraw:
+        def __init__(self, path):
+            self.path = path
+
+        def close(self):
+            closed.append(self.path)
+
+    def failing_wiimote(**kwargs):
+        raise OSError(errno.EIO, 'write failed')
+
+    monkeypatch.setattr(server, 'HidrawDevice', FakeHidraw)
+    monkeypatch.setattr(server, 'ButtonEventWiimote', failing_wiimote)
+
+    with pytest.raises(OSError):
+        server.DeviceCatalog(hidraw=True).open(
+            {'serial': 'a', 'vendor_id': 0x057E, 'product_id': 0x0306, 'path': '/dev/hidraw7'})
+    assert closed == ['/dev/hidraw7']
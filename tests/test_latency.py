@@ -0,0 +1,113 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from joydance import JoyDance
+from joydance.constants import WsSubprotocolVersion
+from joydance.latency import LatencyEstimator
+
+
+def test_initial_latency_until_measured():
+    estimator = LatencyEstimator(initial_ms=40)
+    assert estimator.latency_ms == 40.0
+
+    estimator.add_samples([], now=10.0)
+    assert estimator.latency_ms == 40.0
+
+
+def test_latency_is_queue_delay_plus_half_rtt():
+    estimator = LatencyEstimator(initial_ms=40)
+    estimator.add_rtt(20)
+    assert estimator.latency_ms == pytest.approx(10)
+
+    # Media de los instantes de captura: 9.98 s -> 20 ms en cola
+    estimator.add_samples([9.97, 9.98, 9.99], now=10.0)
+    assert estimator.queue_delay_ms == pytest.approx(20)
+    assert estimator.latency_ms == pytest.approx(30)
+
+
+def test_latency_is_smoothed():
+    estimator = LatencyEstimator(smoothing=0.1)
+    estimator.add_rtt(10)
+    estimator.add_rtt(110)
+    assert estimator.rtt_ms == pytest.approx(20)
+    for _ in range(100):
+        estimator.add_rtt(110)
+    assert estimator.rtt_ms == pytest.approx(110, abs=0.01)
+
+
+class FakeRemote:
+    serial = 'sim-0'
+
+    def __init__(self):
+        self.samples = []
+
+    def drain_accels(self):
+        samples, self.samples = self.samples, []
+        return samples
+
+
+def make_dancer():
+    remote = FakeRemote()
+    dancer = JoyDance(remote, WsSubprotocolVersion.V2)
+    sent = []
+
+    async def send_message(__class, data={}):
+        sent.append(data)
+
+    async def set_accel_reporting(enabled):
+        pass
+
+    dancer.send_message = send_message
+    dancer.set_accel_reporting = set_accel_reporting
+    return dancer, remote, sent
+
+
+def enable_accel(dancer):
+    asyncio.run(dancer.on_message(json.dumps({'__class': 'JD_EnableAccelValuesSending_ConsoleCommandData'})))
+
+
+def test_enable_drops_samples_buffered_before_it():
+    dancer, remote, sent = make_dancer()
+    remote.samples = [(time.monotonic() - 1, (1, 2, 3))]
+    dancer.accel_data = [[9, 9, 9]]
+    enable_accel(dancer)
+    assert remote.samples == []
+    assert dancer.accel_data == []
+
+    # Lo leído antes de activar el envío tampoco cuenta si llega después
+    started_at = dancer.accel_started_at
+    remote.samples = [(started_at - 0.01, (1, 1, 1)), (started_at + 0.01, (2, 2, 2))]
+    asyncio.run(dancer.collect_accelerometer_data())
+    assert dancer.accel_data == [[2, 2, 2]]
+
+
+def test_timestamps_follow_the_measured_rate():
+    dancer, remote, sent = make_dancer()
+    enable_accel(dancer)
+    started_at = dancer.accel_started_at
+
+    # El lector entrega 100 Hz aunque se anuncien 200 Hz
+    async def scenario():
+        for frame in range(5):
+            remote.samples = [(started_at + (frame * 10 + i) / 100, (i, i, i)) for i in range(10)]
+            await dancer.collect_accelerometer_data()
+            await dancer.send_accelerometer_data(frames=3)
+
+    asyncio.run(scenario())
+    assert dancer.accel_interval == pytest.approx(0.01)
+    # Un lote de 10 muestras por frame y sin huecos entre lotes
+    assert [message['timeStamp'] for message in sent] == [0, 10, 20, 30, 40]
+
+
+def test_timestamps_never_go_backwards():
+    dancer, _, _ = make_dancer()
+    dancer.accel_started_at = 100.0
+    dancer.accel_interval = 0.005
+    assert dancer.accel_timestamp(100.05, 10) == 10
+    # Un lote leído antes que el anterior acabe no se solapa con él
+    assert dancer.accel_timestamp(100.06, 10) == 20
+    assert dancer.accel_timestamp(100.2, 10) == 40
@@ -0,0 +1,92 @@
+import logging
+import threading
+
+from pycon.log import ConsoleFormatter, RateLimitFilter, parse_levels
+
+
+def make_record(msg, *args, created=0.0, name='dance'):
+    record = logging.makeLogRecord({'name': name, 'msg': msg, 'args': args, 'levelno': logging.ERROR})
+    record.created = created
+    return record
+
+
+def test_burst_then_suppressed_count_on_next_window():
+    limiter = RateLimitFilter(interval=1.0, burst=2)
+    passed = [limiter.filter(make_record('Error %s', 'x', created=0.1 * i)) for i in range(5)]
+    assert passed == [True, True, False, False, False]
+
+    record = make_record('Error %s', 'x', created=1.5)
+    assert limiter.filter(record)
+    assert record.suppressed == 3
+
+
+def test_different_args_are_different_messages():
+    limiter = RateLimitFilter(interval=1.0, burst=1)
+    assert limiter.filter(make_record('Sesión %s', 'a'))
+    assert limiter.filter(make_record('Sesión %s', 'b'))
+    assert not limiter.filter(make_record('Sesión %s', 'a'))
+
+
+def test_exceptions_with_the_same_text_are_limited():
+    # Las excepciones se comparan por identidad: la clave usa su texto
+    limiter = RateLimitFilter(interval=1.0, burst=1)
+    assert limiter.filter(make_record('Error: %s', OSError('sin dispositivo')))
+    assert not limiter.filter(make_record('Error: %s', OSError('sin dispositivo')))
+    # Argumentos no hashables también sirven de clave
+    assert limiter.filter(make_record('Error: %s', {'lista': []}))
+    assert not limiter.filter(make_record('Error: %s', {'lista': []}))
+
+
+def test_flush_reports_suppressed_when_the_burst_stops():
+    limiter = RateLimitFilter(interval=1.0, burst=1)
+    for i in range(4):
+        limiter.filter(make_record('Error %s', 'x', created=0.1 * i))
+
+    assert limiter.flush(now=0.5) == []
+    flushed = limiter.flush(now=1.0)
+    assert len(flushed) == 1
+    # Sale el último descartado con la cuenta de los otros
+    assert flushed[0].created == 0.1 * 3
+    assert flushed[0].suppressed == 2
+    # Ya contados: el siguiente de la clave no los vuelve a sumar
+    assert limiter.flush(now=2.0) == []
+    record = make_record('Error %s', 'x', created=2.0)
+    assert limiter.filter(record)
+    assert not hasattr(record, 'suppressed')
+
+
+def test_flush_runs_on_a_timer():
+    emitted = []
+    done = threading.Event()
+
+    def emit(record):
+        emitted.append(record)
+        done.set()
+
+    limiter = RateLimitFilter(interval=0.05, burst=1, emit=emit)
+    try:
+        for _ in range(3):
+            limiter.filter(logging.makeLogRecord({'name': 'dance', 'msg': 'Error', 'args': ()}))
+        assert done.wait(2)
+        assert emitted[0].suppressed == 1
+    finally:
+        limiter.close()
+
+
+def test_close_emits_pending():
+    emitted = []
+    limiter = RateLimitFilter(interval=60, burst=1, emit=emitted.append)
+    for _ in range(3):
+        limiter.filter(logging.makeLogRecord({'name': 'dance', 'msg': 'Error', 'args': ()}))
+    limiter.close()
+    assert [record.suppressed for record in emitted] == [1]
+
+
+def test_console_formatter_appends_suppressed():
+    record = make_record('Error %s', 'x')
+    record.suppressed = 4
+    assert ConsoleFormatter('%(message)s').format(record) == 'Error x (4 mensajes iguales omitidos)'
+
+
+def test_parse_levels():
+    assert parse_levels('info, dance.command=warning,') == {'': 'INFO', 'dance.command': 'WARNING'}
@@ -0,0 +1,62 @@
+from pycon.metrics import MetricsRegistry, REGISTRY, render_prometheus
+from pycon.simulate import SimulatedWiimote
+
+
+def test_render_prometheus():
+    registry = MetricsRegistry()
+    registry.counter('reports_total', 'Reportes leídos', serial='a').inc(3)
+    registry.gauge('sessions', 'Sesiones activas').set(2)
+    histogram = registry.histogram('latency_ms', 'Latencia', buckets=(1, 10), serial='a"b')
+    for value in (0.5, 5, 50):
+        histogram.observe(value)
+
+    assert render_prometheus(registry.snapshot(worker=1)) == '\n'.join([
+        '# HELP latency_ms Latencia',
+        '# TYPE latency_ms histogram',
+        'latency_ms_bucket{serial="a\\"b",worker="1",le="1"} 1',
+        'latency_ms_bucket{serial="a\\"b",worker="1",le="10"} 2',
+        'latency_ms_bucket{serial="a\\"b",worker="1",le="+Inf"} 3',
+        'latency_ms_sum{serial="a\\"b",worker="1"} 55.5',
+        'latency_ms_count{serial="a\\"b",worker="1"} 3',
+        '# HELP reports_total Reportes leídos',
+        '# TYPE reports_total counter',
+        'reports_total{serial="a",worker="1"} 3',
+        '# HELP sessions Sesiones activas',
+        '# TYPE sessions gauge',
+        'sessions{worker="1"} 2',
+    ]) + '\n'
+
+
+def test_render_prometheus_describes_each_name_once():
+    registry = MetricsRegistry()
+    registry.counter('reports_total', 'Reportes leídos', serial='a').inc()
+    registry.counter('reports_total', 'Reportes leídos', serial='b').inc(2)
+
+    text = render_prometheus(registry.snapshot())
+    assert text.count('# TYPE reports_total counter') == 1
+    assert 'reports_total{serial="a"} 1\n' in text
+    assert 'reports_total{serial="b"} 2\n' in text
+
+
+def test_remove_by_label():
+    registry = MetricsRegistry()
+    registry.counter('reports_total', serial='a')
+    registry.histogram('latency_ms', serial='a')
+    registry.counter('reports_total', serial='b')
+
+    registry.remove(serial='a')
+    assert [sample['labels'] for sample in registry.snapshot()] == [{'serial': 'b'}]
+
+
+def test_closing_a_wiimote_without_serial_keeps_other_metrics():
+    first = SimulatedWiimote(None, rate_hz=100)
+    second = SimulatedWiimote(None, rate_hz=100)
+    try:
+        assert first.metrics_serial != second.metrics_serial
+        first.close()
+        serials = {sample['labels'].get('serial') for sample in REGISTRY.snapshot()}
+        assert second.metrics_serial in serials
+        assert first.metrics_serial not in serials
+    finally:
+        first.close()
+        second.close()
@@ -0,0 +1,198 @@
+import asyncio
+import cProfile
+import pstats
+import time
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+import server
+from joydance import profiling
+from joydance.profiling import AllocationTracker, Profiler
+
+# El servidor usa claves str en la app, como en main()
+pytestmark = pytest.mark.filterwarnings('ignore:It is recommended to use web.AppKey')
+
+
+def busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        sum(range(100))
+
+
+def test_sample_profile():
+    async def scenario():
+        profiler = Profiler()
+        profiler.start('sample', duration=10, interval=0)
+        assert profiler.running
+        await asyncio.sleep(0.1)
+        started_at = time.perf_counter()
+        status = profiler.stop()
+        # El muestreador espera en un Event: parar no espera al intervalo
+        assert time.perf_counter() - started_at < 0.05
+        return profiler, status
+
+    profiler, status = asyncio.run(scenario())
+    assert not status['running']
+    assert status['formats'] == ['collapsed']
+    assert status['samples'] > 0
+    assert 'MainThread;' in profiler.collapsed()
+    assert profiler.top(3)
+
+
+def test_interval_is_clamped(monkeypatch):
+    intervals = []
+    monkeypatch.setattr(Profiler, '_sample', lambda self, interval: intervals.append(interval))
+
+    async def scenario():
+        profiler = Profiler()
+        for interval in (0, 5):
+            profiler.start('sample', duration=10, interval=interval)
+            profiler.stop()
+
+    asyncio.run(scenario())
+    assert intervals == [profiling.SAMPLE_INTERVAL_MIN, profiling.SAMPLE_INTERVAL_MAX]
+
+
+def test_cprofile_profile():
+    async def scenario():
+        profiler = Profiler()
+        profiler.start('cprofile', duration=10)
+        busy(0.02)
+        return profiler, profiler.stop()
+
+    profiler, status = asyncio.run(scenario())
+    assert status['formats'] == ['pstats']
+    assert any('busy' in row['function'] for row in profiler.top(10))
+
+
+def test_profile_stops_by_itself():
+    async def scenario():
+        profiler = Profiler()
+        profiler.start('sample', duration=0.1)
+        await asyncio.sleep(0.3)
+        return profiler
+
+    assert not asyncio.run(scenario()).running
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'mode': 'nope'},
+    {'duration': float('nan')},
+    {'duration': float('inf')},
+    {'interval': float('nan')},
+])
+def test_invalid_start(kwargs):
+    async def scenario():
+        profiler = Profiler()
+        with pytest.raises(ValueError):
+            profiler.start(**kwargs)
+        assert not profiler.running
+
+    asyncio.run(scenario())
+
+
+def test_failed_enable_does_not_leave_it_running(monkeypatch):
+    class FailingProfile(cProfile.Profile):
+        def enable(self):
+            raise ValueError('Another profiling tool is already active')
+
+    monkeypatch.setattr(profiling.cProfile, 'Profile', FailingProfile)
+
+    async def scenario():
+        profiler = Profiler()
+        with pytest.raises(ValueError):
+            profiler.start('cprofile')
+        assert not profiler.running
+        assert profiler.status()['running'] is False
+
+    asyncio.run(scenario())
+
+
+def test_allocation_tracker():
+    tracker = AllocationTracker(max_snapshots=2)
+    try:
+        first = tracker.snapshot()
+        kept = [bytearray(1024) for _ in range(1000)]
+        second = tracker.snapshot()
+        assert second['id'] == first['id'] + 1
+
+        diff = tracker.diff()
+        assert (diff['from'], diff['to']) == (first['id'], second['id'])
+        assert diff['size_diff'] >= 1000 * 1024
+        assert 'test_profiling.py' in diff['top'][0]['traceback'][0]
+
+        third = tracker.snapshot()
+        assert list(tracker.snapshots) == [second['id'], third['id']]
+        with pytest.raises(KeyError):
+            tracker.diff(first['id'], third['id'])
+        del kept
+    finally:
+        tracker.stop()
+    assert not tracker.snapshots
+    with pytest.raises(KeyError):
+        tracker.diff()
+
+
+def profiling_app(token=None):
+    app = web.Application()
+    app.add_routes(server.routes)
+    app['profiler'] = Profiler()
+    app['allocations'] = AllocationTracker()
+    app['profiling_token'] = token
+    return app
+
+
+def test_profile_routes():
+    async def scenario():
+        async with TestClient(TestServer(profiling_app())) as client:
+            response = await client.get('/profile', params={'limit': 'x'})
+            assert response.status == 400
+            response = await client.post('/profile/start', params={'duration': 'nan'})
+            assert response.status == 400
+            response = await client.post('/profile/start', params={'duration': '10', 'interval_ms': '0'})
+            assert response.status == 200
+            response = await client.post('/profile/start')
+            assert response.status == 409
+            response = await client.post('/profile/stop')
+            assert (await response.json())['formats'] == ['collapsed']
+            response = await client.get('/profile/result')
+            assert response.status == 200
+            assert 'attachment' in response.headers['Content-Disposition']
+
+    asyncio.run(scenario())
+
+
+def test_profile_routes_require_token():
+    async def scenario():
+        async with TestClient(TestServer(profiling_app(token='secreto'))) as client:
+            response = await client.get('/profile')
+            assert response.status == 403
+            response = await client.get('/profile', headers={'Authorization': 'Bearer otro'})
+            assert response.status == 403
+            response = await client.get('/profile', headers={'Authorization': 'Bearer secreto'})
+            assert response.status == 200
+
+    asyncio.run(scenario())
+
+
+def test_is_loopback():
+    assert server.is_loopback('127.0.0.1')
+    assert server.is_loopback('::1')
+    assert server.is_loopback('::ffff:127.0.0.1')
+    assert not server.is_loopback('192.168.1.20')
+    assert not server.is_loopback(None)
+
+
+def test_pstats_bytes_load(tmp_path):
+    async def scenario():
+        profiler = Profiler()
+        profiler.start('cprofile', duration=10)
+        busy(0.01)
+        profiler.stop()
+        return profiler
+
+    path = tmp_path / 'profile.pstats'
+    path.write_bytes(asyncio.run(scenario()).pstats_bytes())
+    assert pstats.Stats(str(path)).total_calls > 0
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+import server
+from joydance.constants import WsSubprotocolVersion
+
+# El servidor usa claves str en la app, como en main()
+pytestmark = pytest.mark.filterwarnings('ignore:It is recommended to use web.AppKey')
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    """SessionManager con dos mandos simulados; el emparejamiento no sale a la red"""
+    async def pair(self):
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(server, 'list_hidraw_wiimotes', lambda: [])
+    monkeypatch.setattr(server.WiimoteDance, 'pair', pair)
+    return server.SessionManager(devices=server.DeviceCatalog(simulated=2, hidraw=True))
+
+
+def test_devices_without_serial_get_distinct_keys(monkeypatch):
+    monkeypatch.setattr(server, 'list_hidraw_wiimotes', lambda: [
+        {'serial': None, 'vendor_id': 0x057E, 'product_id': 0x0306, 'path': '/dev/hidraw1'},
+        {'serial': None, 'vendor_id': 0x057E, 'product_id': 0x0306, 'path': '/dev/hidraw2'},
+        {'serial': '00:1f:32:aa:bb:cc', 'vendor_id': 0x057E, 'product_id': 0x0306, 'path': '/dev/hidraw3'},
+    ])
+    catalog = server.DeviceCatalog(hidraw=True)
+
+    serials = [device['serial'] for device in catalog.list()]
+    assert len(set(serials)) == 3
+    assert serials[2] == '00:1f:32:aa:bb:cc'
+    # El mismo mando conserva su clave entre listados
+    assert [device['serial'] for device in catalog.list()] == serials
+
+
+def test_start_stop_and_conflicts(sessions):
+    async def scenario():
+        first = await sessions.start_wiimote(WsSubprotocolVersion.V2, pairing_code='123456')
+        assert first.serial == 'sim-0'
+        assert 'pairing_code' not in first.status()
+        assert 'pairing_code' not in first.push_state()
+
+        with pytest.raises(server.SessionError) as error:
+            await sessions.start_wiimote(WsSubprotocolVersion.V2, serial='sim-0')
+        assert error.value.status == 409
+        with pytest.raises(server.SessionError) as error:
+            await sessions.start_wiimote(WsSubprotocolVersion.V2, serial='sim-9')
+        assert error.value.status == 404
+
+        second = await sessions.start_wiimote(WsSubprotocolVersion.V2)
+        assert second.serial == 'sim-1'
+        with pytest.raises(server.SessionError) as error:
+            await sessions.start_wiimote(WsSubprotocolVersion.V2)
+        assert error.value.status == 409
+
+        stopped = await sessions.stop('sim-0')
+        assert stopped.state == server.PairingState.DISCONNECTED
+        assert 'sim-0' not in sessions
+        with pytest.raises(server.SessionError) as error:
+            await sessions.stop('sim-0')
+        assert error.value.status == 404
+
+        await sessions.stop_all()
+        assert sessions.list() == []
+
+    asyncio.run(scenario())
+
+
+def test_start_and_stop_routes(sessions):
+    async def scenario():
+        app = web.Application()
+        app.add_routes(server.routes)
+        app['sessions'] = sessions
+
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post('/start', data='no es json')
+            assert response.status == 400
+            response = await client.post('/start', json=['code', '123456'])
+            assert response.status == 400
+
+            response = await client.post('/start', json={'method': 'code', 'value': '123456'})
+            assert response.status == 200
+            assert (await response.json())['session']['serial'] == 'sim-0'
+
+            # Sin cuerpo o sin serial no se detiene nada
+            response = await client.post('/stop')
+            assert response.status == 400
+            response = await client.post('/stop', json={})
+            assert response.status == 400
+            assert 'sim-0' in sessions
+
+            response = await client.post('/stop', json={'serial': 'sim-0'})
+            assert response.status == 200
+            await sessions.start_wiimote(WsSubprotocolVersion.V2)
+            response = await client.post('/stop', json={'all': True})
+            assert response.status == 200
+            assert sessions.list() == []
+
+    asyncio.run(scenario())
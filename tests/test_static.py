@@ -0,0 +1,99 @@
+import asyncio
+import gzip
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+import server
+
+# El servidor usa claves str en la app, como en main()
+pytestmark = pytest.mark.filterwarnings('ignore:It is recommended to use web.AppKey')
+
+APP_JS = b'const answer = 42;\n' * 200
+
+
+@pytest.fixture
+def static_root(tmp_path):
+    (tmp_path / 'js').mkdir()
+    (tmp_path / 'js' / 'app.js').write_bytes(APP_JS)
+    (tmp_path / 'js' / 'preact.module.js').write_bytes(b'export const h = 1;\n' * 100)
+    (tmp_path / 'favicon.png').write_bytes(b'\x89PNG' + bytes(64))
+    return tmp_path
+
+
+def fetch(static_root, path, headers=None, auto_decompress=False):
+    async def scenario():
+        app = web.Application()
+        app['static'] = server.StaticCache(str(static_root)).build()
+        app.router.add_get('/{path:.+}', server.static_file)
+        async with TestClient(TestServer(app), auto_decompress=auto_decompress) as client:
+            response = await client.get('/' + path, headers=headers or {})
+            return response.status, response.headers, await response.read()
+
+    return asyncio.run(scenario())
+
+
+def test_gzip_variant_and_headers(static_root):
+    status, headers, body = fetch(static_root, 'js/app.js', {'Accept-Encoding': 'gzip'})
+    assert status == 200
+    assert headers['Content-Encoding'] == 'gzip'
+    assert headers['Content-Type'].startswith('application/javascript')
+    assert headers['Cache-Control'] == 'no-cache'
+    assert headers['Vary'] == 'Accept-Encoding'
+    assert headers['ETag'].endswith('-gz"')
+    assert gzip.decompress(body) == APP_JS
+
+
+def test_identity_variant(static_root):
+    status, headers, body = fetch(static_root, 'js/app.js', {'Accept-Encoding': 'identity'})
+    assert status == 200
+    assert 'Content-Encoding' not in headers
+    assert body == APP_JS
+
+
+def test_matching_etag_gets_304(static_root):
+    _, headers, _ = fetch(static_root, 'js/app.js', {'Accept-Encoding': 'gzip'})
+    etag = headers['ETag']
+
+    status, headers, body = fetch(static_root, 'js/app.js', {'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert status == 304
+    assert headers['ETag'] == etag
+    assert body == b''
+
+    # El ETag de otra codificación no vale para esta
+    status, _, body = fetch(static_root, 'js/app.js', {'Accept-Encoding': 'identity', 'If-None-Match': etag})
+    assert status == 200
+    assert body == APP_JS
+
+
+def test_unversioned_urls_are_always_revalidated(static_root):
+    # Un fichero redesplegado en la misma URL no puede quedarse en caché
+    _, headers, _ = fetch(static_root, 'js/preact.module.js')
+    assert headers['Cache-Control'] == 'no-cache'
+
+    (static_root / 'js' / 'preact.module.js').write_bytes(b'export const h = 2;\n' * 100)
+    status, changed, _ = fetch(static_root, 'js/preact.module.js', {'If-None-Match': headers['ETag']})
+    assert status == 200
+    assert changed['ETag'] != headers['ETag']
+
+
+def test_brotli_variant(static_root):
+    brotli = pytest.importorskip('brotli')
+    status, headers, body = fetch(static_root, 'js/app.js', {'Accept-Encoding': 'gzip, br'})
+    assert status == 200
+    assert headers['Content-Encoding'] == 'br'
+    assert headers['ETag'].endswith('-br"')
+    assert brotli.decompress(body) == APP_JS
+
+
+def test_binary_files_are_not_compressed(static_root):
+    status, headers, body = fetch(static_root, 'favicon.png', {'Accept-Encoding': 'gzip, br'})
+    assert status == 200
+    assert 'Content-Encoding' not in headers
+    assert body.startswith(b'\x89PNG')
+
+
+def test_missing_file(static_root):
+    status, _, _ = fetch(static_root, 'js/missing.js')
+    assert status == 404
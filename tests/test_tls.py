@@ -0,0 +1,91 @@
+import asyncio
+import shutil
+import ssl
+import subprocess
+from types import SimpleNamespace
+
+import pytest
+
+from joydance.tls import ResumingSSLContext, resuming, session_key
+
+
+class FakeTransport:
+    def __init__(self, session):
+        self.ssl_object = SimpleNamespace(session=session)
+
+    def get_extra_info(self, name):
+        return self.ssl_object if name == 'ssl_object' else None
+
+
+def test_session_key():
+    assert session_key('wss://192.168.1.20:8080/smartphone') == ('192.168.1.20', 8080)
+    assert session_key('wss://example.com/ws') == ('example.com', 443)
+
+
+def test_sessions_are_kept_per_host_and_port_with_lru_limit():
+    context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.max_sessions = 2
+
+    context.remember_session(FakeTransport('a'), ('192.168.1.20', 8080))
+    context.remember_session(FakeTransport('b'), ('192.168.1.20', 8081))
+    assert context.tls_sessions == {('192.168.1.20', 8080): 'a', ('192.168.1.20', 8081): 'b'}
+
+    context.remember_session(FakeTransport('c'), ('192.168.1.21', 8080))
+    assert list(context.tls_sessions) == [('192.168.1.20', 8081), ('192.168.1.21', 8080)]
+
+    # Sin sesión (p. ej. TLS desactivado) no se guarda nada
+    context.remember_session(FakeTransport(None), ('192.168.1.22', 8080))
+    context.remember_session(None, ('192.168.1.22', 8080))
+    assert len(context.tls_sessions) == 2
+
+
+@pytest.fixture
+def server_context(tmp_path):
+    if shutil.which('openssl') is None:
+        pytest.skip('openssl no está instalado')
+    cert, key = tmp_path / 'cert.pem', tmp_path / 'key.pem'
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=localhost',
+                    '-keyout', str(key), '-out', str(cert)], check=True, capture_output=True)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(str(cert), str(key))
+    return context
+
+
+def test_reconnect_resumes_the_session(server_context):
+    async def handle(reader, writer):
+        writer.write(b'hola\n')
+        await writer.drain()
+        await reader.read()
+        writer.close()
+
+    async def connect(context, port):
+        key = ('127.0.0.1', port)
+        with resuming(key):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port, ssl=context, server_hostname=None)
+        # Con TLS 1.3 el ticket llega después del handshake
+        await reader.readline()
+        context.remember_session(writer.transport, key)
+        reused = writer.get_extra_info('ssl_object').session_reused
+        writer.close()
+        await writer.wait_closed()
+        return reused
+
+    async def scenario():
+        server = await asyncio.start_server(handle, '127.0.0.1', 0, ssl=server_context)
+        port = server.sockets[0].getsockname()[1]
+        context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        try:
+            first = await connect(context, port)
+            second = await connect(context, port)
+            # Sin resuming() no se ofrece ninguna sesión
+            reader, writer = await asyncio.open_connection('127.0.0.1', port, ssl=context)
+            third = writer.get_extra_info('ssl_object').session_reused
+            writer.close()
+        finally:
+            server.close()
+            await server.wait_closed()
+        return first, second, third
+
+    assert asyncio.run(scenario()) == (False, True, False)
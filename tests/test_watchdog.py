@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+import server
+from joydance.watchdog import LoopWatchdog
+
+# El servidor usa claves str en la app, como en main()
+pytestmark = pytest.mark.filterwarnings('ignore:It is recommended to use web.AppKey')
+
+THRESHOLD = 0.05  # s
+BLOCK = 0.2  # s
+
+
+def block_the_loop():
+    time.sleep(BLOCK)
+
+
+async def stall(watchdog):
+    # Deja que el hilo del watchdog vea al menos un latido antes de bloquear
+    await asyncio.sleep(0.05)
+    block_the_loop()
+    # El informe se completa con la duración cuando el loop vuelve
+    deadline = time.monotonic() + 2
+    while not watchdog.snapshot() and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+
+def test_stall_is_recorded_with_duration_and_stack():
+    reported = []
+
+    async def scenario():
+        watchdog = LoopWatchdog(threshold=THRESHOLD, on_report=reported.append)
+        watchdog.start()
+        try:
+            await stall(watchdog)
+        finally:
+            watchdog.stop()
+        return watchdog.snapshot()
+
+    reports = asyncio.run(scenario())
+    assert len(reports) == 1
+    report = reports[0]
+    assert reported == [report]
+    assert report['duration_ms'] >= BLOCK * 1000
+    assert THRESHOLD * 1000 <= report['detected_after_ms'] < BLOCK * 1000
+    # La pila es la del hilo del loop mientras estaba bloqueado
+    assert any('block_the_loop' in line for line in report['stack'])
+    assert 'scenario' in report['coro']
+
+
+def test_stalls_endpoint():
+    async def scenario():
+        watchdog = LoopWatchdog(threshold=THRESHOLD)
+        app = web.Application()
+        app.add_routes(server.routes)
+        app['sessions'] = server.SessionManager()
+        app['watchdog'] = watchdog
+        async with TestClient(TestServer(app)) as client:
+            watchdog.start()
+            try:
+                await stall(watchdog)
+                response = await client.get('/stalls')
+                return response.status, await response.json()
+            finally:
+                watchdog.stop()
+
+    status, body = asyncio.run(scenario())
+    assert status == 200
+    assert body['threshold_ms'] == THRESHOLD * 1000
+    assert len(body['stalls']) == 1
+    assert body['stalls'][0]['duration_ms'] >= BLOCK * 1000
+    assert any('block_the_loop' in line for line in body['stalls'][0]['stack'])
+
+
+def test_stalls_endpoint_without_watchdog():
+    async def scenario():
+        app = web.Application()
+        app.add_routes(server.routes)
+        app['watchdog'] = None
+        async with TestClient(TestServer(app)) as client:
+            response = await client.get('/stalls')
+            return response.status
+
+    assert asyncio.run(scenario()) == 404
@@ -0,0 +1,135 @@
+import queue
+import threading
+import time
+
+from pycon.simulate import ButtonSequence, SimulatedDevice, SimulatedWiimote
+from pycon.wiimote import Wiimote
+
+STATUS_REPORT = [0x20, 0, 0, 0, 0, 0, 0xC8]
+
+
+class FakeDevice:
+    """hid.device de mentira: read() saca de una cola y write() detecta escrituras solapadas"""
+
+    def __init__(self):
+        self.reports = queue.Queue()
+        self.writes = []
+        self.overlaps = 0
+        self._writing = False
+
+    def read(self, size, timeout_ms):
+        try:
+            return self.reports.get(timeout=timeout_ms / 1000)
+        except queue.Empty:
+            return []
+
+    def write(self, data):
+        if self._writing:
+            self.overlaps += 1
+        self._writing = True
+        time.sleep(0.0005)
+        self.writes.append(bytes(data))
+        self._writing = False
+
+    def close(self):
+        pass
+
+
+def test_mode_switches_and_status_reports_do_not_interleave():
+    device = FakeDevice()
+    wiimote = Wiimote(serial='test', device=device)
+    try:
+        def switch(enabled):
+            for _ in range(50):
+                wiimote.set_accel_reporting(enabled)
+                enabled = not enabled
+
+        threads = [threading.Thread(target=switch, args=(i % 2 == 0,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for _ in range(50):
+            device.reports.put(STATUS_REPORT)
+        for thread in threads:
+            thread.join()
+        while not device.reports.empty():
+            time.sleep(0.01)
+        time.sleep(0.05)
+    finally:
+        wiimote.close()
+
+    assert device.overlaps == 0
+    assert wiimote.battery_level == 4
+    # La última escritura de modo es la del estado que quedó fijado
+    expected = bytes([0x12, 0x04, 0x31]) if wiimote.accel_reporting else bytes([0x12, 0x00, 0x30])
+    assert device.writes[-1] == expected
+
+
+def test_set_accel_reporting_after_close_is_ignored():
+    device = FakeDevice()
+    wiimote = Wiimote(serial='test', device=device)
+    wiimote.close()
+    wiimote.set_accel_reporting(False)
+    wiimote.request_status()
+    assert device.writes == [bytes([0x12, 0x04, 0x31])]
+    assert wiimote.accel_reporting
+
+
+def wait_for_reports(wiimote, count):
+    deadline = time.monotonic() + 2
+    while wiimote.reports_received < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert wiimote.reports_received >= count
+
+
+def pressed(wiimote):
+    return {button for button, down in wiimote.get_status()['buttons'].items() if down}
+
+
+def test_buttons_are_decoded_at_the_hardware_offsets():
+    device = FakeDevice()
+    wiimote = Wiimote(serial='test', device=device)
+    try:
+        # 0x31: id, botones (más, izquierda | A, menos) y acelerómetro
+        device.reports.put([0x31, 0x11, 0x18, 0x80, 0x82, 0x9A])
+        wait_for_reports(wiimote, 1)
+        assert pressed(wiimote) == {'+', 'left', 'A', '-'}
+        assert wiimote.get_accel() == (0x80, 0x82, 0x9A)
+
+        # 0x30: solo botones (arriba | B, 1); el acelerómetro es el último recibido
+        device.reports.put([0x30, 0x08, 0x06])
+        wait_for_reports(wiimote, 2)
+        assert pressed(wiimote) == {'up', 'B', '1'}
+        assert wiimote.get_accel() == (0x80, 0x82, 0x9A)
+    finally:
+        wiimote.close()
+
+
+def test_simulated_presses_are_decoded_in_both_modes():
+    buttons = ButtonSequence([(0, 60, 'a'), (0, 60, 'plus'), (0, 60, 'right')])
+    wiimote = SimulatedWiimote('sim-0', rate_hz=200, buttons=buttons, accel=False)
+    try:
+        wait_for_reports(wiimote, 1)
+        assert pressed(wiimote) == {'A', '+', 'right'}
+
+        wiimote.set_accel_reporting(True)
+        wiimote.drain_accels()
+        received = wiimote.reports_received
+        wait_for_reports(wiimote, received + 5)
+        assert pressed(wiimote) == {'A', '+', 'right'}
+        assert wiimote.drain_accels()
+    finally:
+        wiimote.close()
+
+
+def test_simulated_reports_have_the_hardware_size():
+    device = SimulatedDevice(buttons=ButtonSequence([(0, 10, 'a'), (0, 10, 'plus')]))
+    device.write([0x12, 0x00, 0x30])
+    assert device.read(22, 100) == bytes([0x30, 0x10, 0x08])
+
+    device.write([0x12, 0x04, 0x31])
+    report = device.read(22, 100)
+    assert len(report) == 6
+    assert report[:3] == bytes([0x31, 0x10, 0x08])
+
+    device.write([0x15, 0x00])
+    assert len(device.read(22, 100)) == 7
@@ -0,0 +1,109 @@
+import asyncio
+import socket
+import time
+
+import pytest
+
+import server
+from joydance import PairingState
+from joydance.constants import WsSubprotocolVersion
+from workers import WorkerSessionManager
+
+# WiimoteDance (V1) prueba siempre el puerto 8080 de la consola y el 6000 para el descubrimiento UDP
+CONSOLE_PORT = 8080
+TIMEOUT = 15  # s: el worker se arranca con spawn e importa el servidor entero
+
+
+def port_is_free(kind, port):
+    sock = socket.socket(socket.AF_INET, kind)
+    # Como websockets.serve(): las conexiones en TIME_WAIT de otra prueba no cuentan
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        sock.bind(('127.0.0.1', port))
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+class DiscoveryResponder(asyncio.DatagramProtocol):
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.transport.sendto(b'JD', addr)
+
+
+async def wait_for(condition, timeout=TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        await asyncio.sleep(0.05)
+
+
+@pytest.fixture
+def console_ports():
+    if not port_is_free(socket.SOCK_STREAM, CONSOLE_PORT) or not port_is_free(socket.SOCK_DGRAM, 6000):
+        pytest.skip('Los puertos 8080/6000 de 127.0.0.1 están ocupados')
+
+
+def test_simulated_session_in_a_worker_survives_a_crash(console_ports):
+    import websockets
+
+    async def console(ws, path=None):
+        async for _ in ws:
+            pass
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        udp, _ = await loop.create_datagram_endpoint(DiscoveryResponder, local_addr=('127.0.0.1', 6000))
+        ws_server = await websockets.serve(console, '127.0.0.1', CONSOLE_PORT)
+
+        states = []
+
+        def on_session_changed(session):
+            states.append(session.push_state().get('state'))
+
+        # Sin hidapi, DeviceCatalog.list() solo devuelve los simulados
+        manager = WorkerSessionManager(1, devices=server.DeviceCatalog(simulated=1),
+                                       on_session_changed=on_session_changed)
+        manager.start()
+        worker = manager.workers[0]
+        try:
+            session = await asyncio.wait_for(
+                manager.start_wiimote(WsSubprotocolVersion.V1, pairing_id='127.0.0.1'), TIMEOUT)
+            assert session.serial == 'sim-0'
+            assert session.status()['worker'] == 0
+
+            # Estado y métricas del worker llegan al proceso principal
+            await wait_for(lambda: session.push_state().get('state') == PairingState.CONNECTED.value)
+            assert session.status()['ws_url'] == f'ws://127.0.0.1:{CONSOLE_PORT}'
+
+            def reports():
+                return [sample for sample in manager.metrics_snapshot()
+                        if sample['name'] == 'pycon_hid_reports_total' and sample['labels']['serial'] == 'sim-0']
+
+            await wait_for(lambda: reports() and reports()[0]['value'] > 0)
+            assert reports()[0]['labels']['worker'] == '0'
+
+            # Si el worker muere, se reinicia y la sesión se vuelve a emparejar
+            pid = worker.process.pid
+            states.clear()
+            worker.process.kill()
+            await wait_for(lambda: PairingState.CONNECTING.value in states)
+            await wait_for(lambda: session.push_state().get('state') == PairingState.CONNECTED.value)
+            assert worker.process.pid != pid
+            assert worker.restarts == 1
+            assert manager.get('sim-0') is session
+        finally:
+            await manager.shutdown()
+            ws_server.close()
+            await ws_server.wait_closed()
+            udp.close()
+
+        assert manager.list() == []
+        assert not worker.process.is_alive()
+
+    asyncio.run(scenario())
@@ -0,0 +1,416 @@
+"""Modo worker: cada proceso hijo tiene su propio event loop y una o pocas sesiones.
+
+El servidor web (server.py) solo supervisa: reparte sesiones entre los
+workers, recibe por un Pipe sus estados y estadísticas, y reinicia los
+workers que se caen (volviendo a emparejar las sesiones que tenían).
+
+Cada worker tiene dos Pipes de un solo sentido: por uno llegan las órdenes y
+por el otro salen los eventos. Así el hilo que hace recv() nunca comparte
+conexión con el event loop, que es el único que hace send().
+"""
+import asyncio
+import itertools
+import logging
+import multiprocessing
+from collections import deque
+from threading import Thread
+
+from server import STATS_POLL_INTERVAL, DeviceCatalog, SessionError, SessionManager, StateBroadcaster, print_stall
+from joydance import PairingState
+from joydance.httpclient import close_http_session
+from joydance.watchdog import WATCHDOG_MAX_REPORTS, LoopWatchdog
+from pycon.log import setup_logging
+from pycon.metrics import REGISTRY
+
+WORKER_RESTART_DELAY = 1  # s
+
+log = logging.getLogger('workers')
+
+
+class PipeClient:
+    """Reenvía al proceso principal los cambios de estado de las sesiones del worker"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def queue(self, serial, diff):
+        self.conn.send(('state', serial, diff))
+
+
+def worker_main(worker_id, commands, events, watchdog_ms=0, devices=None, log_options=None):
+    """Punto de entrada del proceso hijo"""
+    log_options = dict(log_options or {})
+    if log_options.get('file'):
+        # RotatingFileHandler no se puede compartir entre procesos: un fichero por worker
+        log_options['file'] = f"{log_options['file']}.worker{worker_id}"
+    setup_logging(**log_options)
+    try:
+        asyncio.run(_run_worker(worker_id, commands, events, watchdog_ms, devices))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _run_worker(worker_id, commands, events, watchdog_ms, devices):
+    loop = asyncio.get_running_loop()
+    pending = asyncio.Queue()
+
+    def read_commands():
+        while True:
+            try:
+                msg = commands.recv()
+            except (EOFError, OSError, TypeError):
+                # TypeError: el worker cerró commands mientras recv() esperaba
+                msg = ('exit',)
+            try:
+                loop.call_soon_threadsafe(pending.put_nowait, msg)
+            except RuntimeError:
+                return  # el event loop ya se cerró
+            if msg[0] == 'exit':
+                return
+
+    Thread(target=read_commands, daemon=True).start()
+
+    broadcaster = StateBroadcaster()
+    broadcaster.clients.add(PipeClient(events))
+
+    def on_session_changed(session):
+        events.send(('status', session.serial, session.status()))
+        broadcaster.publish_session(session)
+
+    sessions = SessionManager(on_session_changed=on_session_changed, devices=devices)
+    stats_task = asyncio.create_task(broadcaster.poll_stats(sessions))
+
+    async def send_metrics():
+        while True:
+            await asyncio.sleep(STATS_POLL_INTERVAL)
+            events.send(('metrics', None, REGISTRY.snapshot(worker=worker_id)))
+
+    metrics_task = asyncio.create_task(send_metrics())
+
+    watchdog = None
+    if watchdog_ms:
+        def on_stall(report):
+            report['worker'] = worker_id
+            print_stall(report)
+            # on_report corre en el hilo del watchdog: el envío lo hace el event loop
+            loop.call_soon_threadsafe(events.send, ('stall', None, report))
+
+        watchdog = LoopWatchdog(threshold=watchdog_ms / 1000, on_report=on_stall)
+        watchdog.start()
+
+    async def handle(kind, req_id, kwargs):
+        try:
+            if kind == 'start':
+                session = await sessions.start_wiimote(**kwargs)
+            else:
+                session = await sessions.stop(kwargs['serial'])
+            events.send(('result', req_id, True, session.status()))
+        except SessionError as e:
+            events.send(('result', req_id, False, (str(e), e.status)))
+        except Exception as e:
+            events.send(('result', req_id, False, (f'{type(e).__name__}: {e}', 500)))
+
+    log.info('[Worker %s] Iniciado', worker_id)
+    try:
+        while True:
+            msg = await pending.get()
+            if msg[0] == 'exit':
+                break
+            kind, req_id, kwargs = msg
+            asyncio.create_task(handle(kind, req_id, kwargs))
+    finally:
+        stats_task.cancel()
+        metrics_task.cancel()
+        if watchdog:
+            watchdog.stop()
+        await sessions.stop_all()
+        await close_http_session()
+        commands.close()
+        events.close()
+
+
+class WorkerProcess:
+    """Un proceso worker visto desde el supervisor"""
+
+    def __init__(self, worker_id, loop, on_message, on_exit, watchdog_ms=0, devices=None, log_options=None):
+        self.worker_id = worker_id
+        self.watchdog_ms = watchdog_ms
+        self.devices = devices
+        self.log_options = log_options
+        self.loop = loop
+        self.on_message = on_message
+        self.on_exit = on_exit
+        self.process = None
+        self.commands = None  # órdenes al worker
+        self.events = None  # estados, resultados y métricas del worker
+        self.restarts = -1
+
+    def spawn(self):
+        # spawn también en Linux: el hijo no hereda hilos HID ni sockets del padre
+        ctx = multiprocessing.get_context('spawn')
+        child_commands, self.commands = ctx.Pipe(duplex=False)
+        self.events, child_events = ctx.Pipe(duplex=False)
+        self.process = ctx.Process(
+            target=worker_main,
+            args=(self.worker_id, child_commands, child_events, self.watchdog_ms, self.devices, self.log_options),
+            name=f'dance-worker-{self.worker_id}',
+            daemon=True,
+        )
+        self.process.start()
+        child_commands.close()
+        child_events.close()
+        self.restarts += 1
+
+        Thread(target=self._read_loop, args=(self.events,), daemon=True).start()
+
+    def _read_loop(self, conn):
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError, TypeError):
+                # TypeError: stop() cerró events mientras recv() esperaba
+                break
+            self.loop.call_soon_threadsafe(self.on_message, self, msg)
+        self.loop.call_soon_threadsafe(self.on_exit, self, conn)
+
+    def send(self, msg):
+        self.commands.send(msg)
+
+    def stop(self):
+        try:
+            self.send(('exit',))
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.commands.close()
+        self.events.close()
+
+
+class RemoteSession:
+    """Sesión que vive en un worker; guarda el último estado recibido"""
+
+    device = None
+
+    def __init__(self, serial, worker, start_kwargs):
+        self.serial = serial
+        self.worker = worker
+        self.start_kwargs = start_kwargs
+        self._status = {'serial': serial}
+        self._push = {}
+
+    def status(self):
+        status = dict(self._status)
+        status['worker'] = self.worker.worker_id
+        return status
+
+    def push_state(self):
+        return dict(self._push)
+
+    def update_stats(self):
+        pass
+
+
+class WorkerSessionManager:
+    """Misma interfaz que SessionManager, pero las sesiones corren en procesos worker"""
+
+    def __init__(self, workers, sessions_per_worker=1, watchdog_ms=0, on_session_changed=None, devices=None,
+                 log_options=None):
+        self.num_workers = workers
+        self.sessions_per_worker = sessions_per_worker
+        self.watchdog_ms = watchdog_ms
+        self.log_options = log_options
+        self.devices = devices or DeviceCatalog()
+        self.on_session_changed = on_session_changed
+        self.workers = []
+        self._sessions = {}
+        self._pending = {}
+        self._req_ids = itertools.count()
+        self._lock = asyncio.Lock()
+        self._closing = False
+        self._metrics = {}
+        self._stalls = deque(maxlen=WATCHDOG_MAX_REPORTS)
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        for worker_id in range(self.num_workers):
+            worker = WorkerProcess(worker_id, loop, self._on_message, self._on_exit, self.watchdog_ms, self.devices,
+                                   self.log_options)
+            worker.spawn()
+            self.workers.append(worker)
+        log.info('%s workers iniciados (%s sesiones por worker)', self.num_workers, self.sessions_per_worker)
+
+    def __contains__(self, serial):
+        return serial in self._sessions
+
+    def __iter__(self):
+        return iter(list(self._sessions.values()))
+
+    def get(self, serial):
+        return self._sessions.get(serial)
+
+    def list(self):
+        return [session.status() for session in self._sessions.values()]
+
+    def _notify(self, session):
+        if self.on_session_changed:
+            self.on_session_changed(session)
+
+    def metrics_snapshot(self):
+        """Últimas métricas recibidas de cada worker"""
+        samples = []
+        for worker_samples in self._metrics.values():
+            samples += worker_samples
+        return samples
+
+    def stall_reports(self):
+        return list(self._stalls)
+
+    def _load(self, worker):
+        return sum(1 for session in self._sessions.values() if session.worker is worker)
+
+    def _pick_worker(self):
+        worker = min(self.workers, key=self._load)
+        if self._load(worker) >= self.sessions_per_worker:
+            raise SessionError('Todos los workers están ocupados', status=503)
+        return worker
+
+    def _request(self, worker, kind, kwargs):
+        req_id = next(self._req_ids)
+        future = asyncio.get_running_loop().create_future()
+        try:
+            worker.send((kind, req_id, kwargs))
+        except (OSError, ValueError):
+            future.set_exception(SessionError('El worker no está disponible', status=503))
+            return future
+        self._pending[req_id] = (worker, future)
+        return future
+
+    async def start_wiimote(self, protocol_version, pairing_code=None, pairing_id=None, serial=None):
+        loop = asyncio.get_running_loop()
+
+        async with self._lock:
+            if serial is None:
+                devices = await loop.run_in_executor(None, self.devices.list)
+                device = next((d for d in devices if d['serial'] not in self._sessions), None)
+                if device is None:
+                    raise SessionError('No hay Wiimotes libres', status=409)
+                serial = device['serial']
+
+            if serial in self._sessions:
+                raise SessionError(f'El Wiimote {serial} ya tiene una sesión', status=409)
+
+            kwargs = {
+                'protocol_version': protocol_version,
+                'pairing_code': pairing_code,
+                'pairing_id': pairing_id,
+                'serial': serial,
+            }
+            session = RemoteSession(serial, self._pick_worker(), kwargs)
+            # Se reserva antes de esperar al worker para no abrir el mismo mando dos veces
+            self._sessions[serial] = session
+
+        try:
+            session._status = await self._request(session.worker, 'start', kwargs)
+        except SessionError:
+            self._sessions.pop(serial, None)
+            raise
+
+        self._notify(session)
+        return session
+
+    async def stop(self, serial):
+        session = self._sessions.pop(serial, None)
+        if session is None:
+            raise SessionError(f'No hay sesión para {serial}', status=404)
+
+        try:
+            await self._request(session.worker, 'stop', {'serial': serial})
+        except SessionError as e:
+            if e.status != 404:
+                log.error('Error al detener sesión %s: %s', serial, e)
+
+        session._push['state'] = PairingState.DISCONNECTED.value
+        self._notify(session)
+        return session
+
+    async def stop_all(self):
+        for serial in list(self._sessions):
+            await self.stop(serial)
+
+    async def shutdown(self):
+        self._closing = True
+        await self.stop_all()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(None, worker.stop) for worker in self.workers))
+
+    def _on_message(self, worker, msg):
+        kind = msg[0]
+        if kind == 'result':
+            _, req_id, ok, payload = msg
+            _, future = self._pending.pop(req_id, (None, None))
+            if future is None or future.done():
+                return
+            if ok:
+                future.set_result(payload)
+            else:
+                message, status = payload
+                future.set_exception(SessionError(message, status=status))
+            return
+
+        if kind == 'metrics':
+            self._metrics[worker.worker_id] = msg[2]
+            return
+        if kind == 'stall':
+            self._stalls.append(msg[2])
+            return
+
+        _, serial, data = msg
+        session = self._sessions.get(serial)
+        if session is None or session.worker is not worker:
+            return
+
+        if kind == 'status':
+            session._status = data
+        elif kind == 'state':
+            session._push.update(data)
+            if data.get('state') == PairingState.DISCONNECTED.value:
+                # La sesión terminó sola dentro del worker
+                del self._sessions[serial]
+            self._notify(session)
+
+    def _on_exit(self, worker, conn):
+        if self._closing or conn is not worker.events:
+            return
+
+        log.warning('[Worker %s] Terminó inesperadamente (código %s), reiniciando...',
+                    worker.worker_id, worker.process.exitcode)
+        for req_id, (owner, future) in list(self._pending.items()):
+            if owner is worker:
+                del self._pending[req_id]
+                if not future.done():
+                    future.set_exception(SessionError('El worker se cayó', status=500))
+
+        asyncio.get_running_loop().call_later(WORKER_RESTART_DELAY, self._restart, worker)
+
+    def _restart(self, worker):
+        if self._closing:
+            return
+
+        worker.spawn()
+        for session in self:
+            if session.worker is worker:
+                session._push['state'] = PairingState.CONNECTING.value
+                self._notify(session)
+                asyncio.create_task(self._resubmit(session))
+
+    async def _resubmit(self, session):
+        try:
+            session._status = await self._request(session.worker, 'start', session.start_kwargs)
+        except SessionError as e:
+            log.error('No se pudo recuperar la sesión %s: %s', session.serial, e)
+            if self._sessions.get(session.serial) is session:
+                del self._sessions[session.serial]
+                session._push['state'] = PairingState.ERROR_JOYCON.value
+                self._notify(session)